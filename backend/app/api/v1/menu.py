@@ -2,19 +2,26 @@ from __future__ import annotations
 
 from datetime import date
 
-from datetime import date
-
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy import select
+from sqlalchemy.orm import noload
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...api.deps import get_session
+from ...core.cache import CachedBody, etag_matches
 from ...db.models.menu import MenuWeek, Preset
+from ...domain.menu.cache import menu_cache
 from ..v1.schemas import MenuWeekOut, MenuWeeksResponse, PresetOut
 
 router = APIRouter()
 
 
+def _menu_weeks_query():
+    # day_offers come from the relationship's selectin load (one query for all weeks);
+    # presets are not part of the response
+    return select(MenuWeek).options(noload(MenuWeek.presets))
+
+
 def _serialize_menu_week(menu: MenuWeek) -> MenuWeekOut:
     return MenuWeekOut(
         id=menu.id,
@@ -42,30 +49,49 @@ def _serialize_menu_week(menu: MenuWeek) -> MenuWeekOut:
     )
 
 
+def _cached_response(request: Request, cached: CachedBody) -> Response:
+    # no-cache: clients may store the body but must revalidate it with If-None-Match
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
 @router.get("/week", response_model=MenuWeekOut)
 async def get_week_menu(
+    request: Request,
     session: AsyncSession = Depends(get_session),
     week_start: date | None = Query(default=None, description="ISO date of week start"),
-) -> MenuWeekOut:
-    stmt = select(MenuWeek).order_by(MenuWeek.week_start.desc())
-    if week_start:
-        stmt = select(MenuWeek).where(MenuWeek.week_start == week_start)
-    result = await session.execute(stmt)
-    menu_week = result.scalars().unique().first()
-    if not menu_week:
+) -> Response:
+    async def build() -> bytes | None:
+        stmt = _menu_weeks_query().order_by(MenuWeek.week_start.desc())
+        if week_start:
+            stmt = _menu_weeks_query().where(MenuWeek.week_start == week_start)
+        result = await session.execute(stmt)
+        menu_week = result.scalars().unique().first()
+        if not menu_week:
+            return None
+        return _serialize_menu_week(menu_week).model_dump_json().encode()
+
+    cached = await menu_cache.get_or_build(f"week:{week_start.isoformat() if week_start else 'latest'}", build)
+    if cached is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Menu not found")
-    await session.refresh(menu_week, attribute_names=["day_offers"])
-    return _serialize_menu_week(menu_week)
+    return _cached_response(request, cached)
 
 
 @router.get("/weeks", response_model=MenuWeeksResponse)
-async def list_weeks(session: AsyncSession = Depends(get_session), limit: int = Query(default=8, ge=1, le=16)) -> MenuWeeksResponse:
-    stmt = select(MenuWeek).order_by(MenuWeek.week_start.desc()).limit(limit)
-    result = await session.execute(stmt)
-    weeks = result.scalars().unique().all()
-    for week in weeks:
-        await session.refresh(week, attribute_names=["day_offers"])
-    return MenuWeeksResponse(weeks=[_serialize_menu_week(week) for week in weeks])
+async def list_weeks(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    limit: int = Query(default=8, ge=1, le=16),
+) -> Response:
+    async def build() -> bytes:
+        stmt = _menu_weeks_query().order_by(MenuWeek.week_start.desc()).limit(limit)
+        result = await session.execute(stmt)
+        weeks = result.scalars().unique().all()
+        return MenuWeeksResponse(weeks=[_serialize_menu_week(week) for week in weeks]).model_dump_json().encode()
+
+    return _cached_response(request, await menu_cache.get_or_build(f"weeks:{limit}", build))
 
 
 @router.get("/presets", response_model=list[PresetOut])
@@ -1,77 +1,101 @@
 from __future__ import annotations
 
-from datetime import timedelta
+import secrets
+from datetime import date, timedelta
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, noload
 
 from ...api.deps import get_session
 from ...db.models.menu import MenuWeek
 from ...db.models.orders import Order, OrderStatus
 from ..v1.schemas import (
+    CalcOrderBatchRequest,
+    CalcOrderBatchResponse,
+    CalcOrderBatchResult,
     CalcOrderRequest,
     CalcOrderResponse,
     CalcOrderWeekBreakdown,
     CheckoutRequest,
     CheckoutResponse,
 )
-from ...domain.orders.calculator import BasketItem, OrderCalculator
+from ...domain.menu.cache import invalidate_menu_cache
+from ...domain.orders.calculator import BasketItem, OrderCalculator, calc_weeks
+from ...domain.orders.inventory import reserve
+from ...domain.orders.pricing import business_now, pricing_tables, to_tetri
 
 router = APIRouter()
 
+PROMO_DISCOUNT_TETRI = 500
 
-@router.post("/calc", response_model=CalcOrderResponse)
-async def calculate_order(payload: CalcOrderRequest, session: AsyncSession = Depends(get_session)) -> CalcOrderResponse:
-    if not payload.selections:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No selections provided")
 
-    weeks: list[CalcOrderWeekBreakdown] = []
-    total = 0.0
-    discount = 0.0
-    promo_applied = False
+def _week_starts(week_start: date, weeks_ahead: int) -> list[date]:
+    return [week_start + timedelta(days=7 * idx) for idx in range(weeks_ahead)]
 
-    for idx in range(payload.weeks_ahead):
-        week_start = payload.week_start + timedelta(days=7 * idx)
-        result = await session.execute(select(MenuWeek).where(MenuWeek.week_start == week_start))
-        menu_week = result.scalars().unique().first()
-        if not menu_week:
-            weeks.append(
-                CalcOrderWeekBreakdown(
-                    week_start=week_start,
-                    total_lari=0.0,
-                    days=[],
-                    has_menu=False,
-                )
-            )
-            continue
-        await session.refresh(menu_week, attribute_names=["day_offers"])
-        calc = OrderCalculator(menu_week)
-        items = [BasketItem(sel.day_of_week, sel.portions) for sel in payload.selections]
-        week_result = calc.calc_week(items, week_start)
-        breakdown = CalcOrderWeekBreakdown(
-            week_start=week_result["week_start"],
-            total_lari=week_result["total_lari"],
-            days=week_result["days"],
-            has_menu=week_result["has_menu"],
-        )
-        weeks.append(breakdown)
-        total += breakdown.total_lari
 
-    if payload.promo_code:
+def _calc_response(weeks: list[dict], promo_code: str | None, mode: str) -> CalcOrderResponse:
+    breakdowns = [CalcOrderWeekBreakdown(**week) for week in weeks]
+    total_tetri = sum(to_tetri(week.total_lari) for week in breakdowns)
+    discount_tetri = 0
+    promo_applied = False
+
+    if promo_code:
         promo_applied = True
-        discount = min(5.0, total)
-        total -= discount
+        discount_tetri = min(PROMO_DISCOUNT_TETRI, total_tetri)
+        total_tetri -= discount_tetri
 
     return CalcOrderResponse(
-        total_lari=total,
-        discount_lari=discount,
-        mode=payload.mode,
-        weeks=weeks,
+        total_lari=total_tetri / 100,
+        discount_lari=discount_tetri / 100,
+        mode=mode,
+        weeks=breakdowns,
         promo_code_applied=promo_applied,
     )
 
 
+@router.post("/calc", response_model=CalcOrderResponse)
+async def calculate_order(payload: CalcOrderRequest, session: AsyncSession = Depends(get_session)) -> CalcOrderResponse:
+    if not payload.selections:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No selections provided")
+
+    items = [BasketItem(sel.day_of_week, sel.portions) for sel in payload.selections]
+    week_starts = _week_starts(payload.week_start, payload.weeks_ahead)
+    tables = await pricing_tables.get(session, week_starts)
+    return _calc_response(calc_weeks(tables, items, week_starts), payload.promo_code, payload.mode)
+
+
+@router.post("/calc/batch", response_model=CalcOrderBatchResponse)
+async def calculate_order_batch(
+    payload: CalcOrderBatchRequest, session: AsyncSession = Depends(get_session)
+) -> CalcOrderBatchResponse:
+    """Prices many candidate baskets (presets, portion counts, horizons) in one request.
+
+    All weeks are loaded once and every week's day statuses are evaluated once for
+    the whole batch. A basket that cannot be priced gets ``error`` instead of
+    ``result``; the rest of the batch is unaffected.
+    """
+
+    week_starts = _week_starts(payload.week_start, max(basket.weeks_ahead for basket in payload.baskets))
+    tables = await pricing_tables.get(session, week_starts)
+    now = business_now()
+    calculators = {week_start: OrderCalculator(table, now=now) for week_start, table in tables.items()}
+
+    results: list[CalcOrderBatchResult] = []
+    for basket in payload.baskets:
+        try:
+            if not basket.selections:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No selections provided")
+            items = [BasketItem(sel.day_of_week, sel.portions) for sel in basket.selections]
+            weeks = calc_weeks(calculators, items, week_starts[: basket.weeks_ahead])
+        except HTTPException as exc:
+            results.append(CalcOrderBatchResult(key=basket.key, error=str(exc.detail)))
+            continue
+        results.append(CalcOrderBatchResult(key=basket.key, result=_calc_response(weeks, basket.promo_code, basket.mode)))
+    return CalcOrderBatchResponse(results=results)
+
+
 @router.post("/checkout", response_model=CheckoutResponse)
 async def checkout_order(payload: CheckoutRequest, session: AsyncSession = Depends(get_session)) -> CheckoutResponse:
     if payload.mode != "single":
@@ -80,11 +104,14 @@ async def checkout_order(payload: CheckoutRequest, session: AsyncSession = Depen
             detail="Multiweek and subscription checkout to be implemented",
         )
 
-    result = await session.execute(select(MenuWeek).where(MenuWeek.week_start == payload.week_start))
+    result = await session.execute(
+        select(MenuWeek)
+        .where(MenuWeek.week_start == payload.week_start)
+        .options(joinedload(MenuWeek.day_offers), noload(MenuWeek.presets))
+    )
     menu_week = result.scalars().unique().first()
     if not menu_week:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Menu not found")
-    await session.refresh(menu_week, attribute_names=["day_offers"])
 
     calc_response = await calculate_order(
         CalcOrderRequest(
@@ -106,7 +133,7 @@ async def checkout_order(payload: CheckoutRequest, session: AsyncSession = Depen
 
     day_offer = next((offer for offer in menu_week.day_offers if offer.day_of_week == first_day.day_of_week), None)
     order = Order(
-        order_code="WEB-PLACEHOLDER",
+        order_code=f"WEB-{secrets.token_hex(6).upper()}",
         user_id=None,
         address_id=payload.address.address_id,
         menu_week_id=menu_week.id,
@@ -123,7 +150,12 @@ async def checkout_order(payload: CheckoutRequest, session: AsyncSession = Depen
         is_next_week=menu_week.week_start > payload.week_start,
     )
     session.add(order)
+    await session.flush()
+    # Last statement before commit: the day offer's row lock is held only until then
+    reservation = await reserve(session, day_offer.id, first_day.portions, order_id=order.id) if day_offer else None
     await session.commit()
+    if reservation is not None and reservation.sold_out_changed:
+        await invalidate_menu_cache()
     await session.refresh(order)
 
     return CheckoutResponse(order_id=order.id, payment_intent_client_secret=None, next_action="complete")
@@ -83,6 +83,29 @@ class CalcOrderResponse(BaseModel):
     promo_code_applied: bool
 
 
+class CalcBatchBasket(BaseModel):
+    key: str | None = Field(default=None, max_length=64)
+    selections: list[BasketSelection]
+    promo_code: str | None = None
+    weeks_ahead: int = Field(default=1, ge=1, le=8)
+    mode: Literal['single', 'multiweek', 'subscription'] = 'single'
+
+
+class CalcOrderBatchRequest(BaseModel):
+    week_start: date
+    baskets: list[CalcBatchBasket] = Field(min_length=1, max_length=64)
+
+
+class CalcOrderBatchResult(BaseModel):
+    key: str | None = None
+    result: CalcOrderResponse | None = None
+    error: str | None = None
+
+
+class CalcOrderBatchResponse(BaseModel):
+    results: list[CalcOrderBatchResult]
+
+
 class CheckoutAddress(BaseModel):
     address_id: int | None = None
     address_line: str | None = None
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from .logging import get_logger
+
+try:  # redis is a hard requirement of the API, but the cache must import without it
+    from redis import asyncio as redis_asyncio
+except ImportError:  # pragma: no cover - depends on the environment
+    redis_asyncio = None
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    """A serialized response body and its strong ETag."""
+
+    body: bytes
+    etag: str
+
+    @classmethod
+    def from_body(cls, body: bytes) -> "CachedBody":
+        return cls(body=body, etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match check (RFC 9110): weak comparison, ``*`` matches any representation."""
+
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+class LRUCache:
+    """Bounded in-process LRU with a per-entry time to live."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TwoTierCache:
+    """In-process LRU (L1) in front of a shared Redis (L2) for serialized bodies.
+
+    Redis is optional at runtime: any error is logged, Redis is skipped for
+    ``retry_after`` seconds and requests are served from L1 or the source. Pass
+    ``redis_url=None`` for an L1-only cache, or ``client`` to reuse an existing
+    ``redis.asyncio`` client.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        redis_url: str | None,
+        l1_size: int,
+        l1_ttl: float,
+        l2_ttl: int,
+        retry_after: float = 30.0,
+        client: Any = None,
+    ) -> None:
+        self.namespace = namespace
+        self.l1 = LRUCache(l1_size, l1_ttl)
+        self.l2_ttl = l2_ttl
+        self.retry_after = retry_after
+        self._redis_url = redis_url if redis_asyncio is not None or client is not None else None
+        self._client: Any = client
+        self._down_until = 0.0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _redis(self) -> Any:
+        if self._redis_url is None or time.monotonic() < self._down_until:
+            return None
+        if self._client is None:
+            self._client = redis_asyncio.from_url(
+                self._redis_url, socket_timeout=0.25, socket_connect_timeout=0.25
+            )
+        return self._client
+
+    def _redis_failed(self, exc: Exception) -> None:
+        self._down_until = time.monotonic() + self.retry_after
+        logger.warning("cache_redis_unavailable", extra={"namespace": self.namespace, "error": repr(exc)})
+
+    async def get(self, key: str) -> CachedBody | None:
+        cached = self.l1.get(key)
+        if cached is not None:
+            return cached
+        client = self._redis()
+        if client is None:
+            return None
+        try:
+            raw = await client.hmget(self._key(key), "etag", "body")
+        except Exception as exc:  # redis.RedisError, OSError, timeouts
+            self._redis_failed(exc)
+            return None
+        if not raw or raw[0] is None or raw[1] is None:
+            return None
+        cached = CachedBody(body=raw[1], etag=raw[0].decode())
+        self.l1.set(key, cached)
+        return cached
+
+    async def set(self, key: str, value: CachedBody) -> None:
+        self.l1.set(key, value)
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.hset(self._key(key), mapping={"etag": value.etag, "body": value.body})
+                pipe.expire(self._key(key), self.l2_ttl)
+                await pipe.execute()
+        except Exception as exc:
+            self._redis_failed(exc)
+
+    async def get_counter(self, key: str) -> int | None:
+        """Shared counter value (0 if unset); None when Redis is not available."""
+
+        client = self._redis()
+        if client is None:
+            return None
+        try:
+            raw = await client.get(self._key(key))
+        except Exception as exc:
+            self._redis_failed(exc)
+            return None
+        return int(raw or 0)
+
+    @property
+    def shared(self) -> bool:
+        """True when Redis is configured (it may still be unreachable right now)."""
+
+        return self._redis_url is not None
+
+    async def incr_counter(self, key: str, amount: int = 1) -> int | None:
+        client = self._redis()
+        if client is None:
+            return None
+        try:
+            return int(await client.incr(self._key(key), amount))
+        except Exception as exc:
+            self._redis_failed(exc)
+            return None
+
+    async def close(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+
+class VersionedCache:
+    """Builds bodies on a miss, keyed by ``key`` and a shared version counter.
+
+    Invalidation bumps the version: every process stops using old entries once it
+    re-reads the counter (at most ``version_ttl`` seconds later; immediately in the
+    invalidating process), and stale Redis entries expire on their own. The version
+    never goes backwards, and a bump that could not reach Redis is retried until it
+    does, so an invalidation during an outage is not lost. Concurrent misses for one
+    key share a single build.
+    """
+
+    VERSION_KEY = "version"
+
+    def __init__(self, cache: TwoTierCache, version_ttl: float, enabled: bool = True) -> None:
+        self.cache = cache
+        self.version_ttl = version_ttl
+        self.enabled = enabled
+        self._version = 0
+        self._version_checked = float("-inf")
+        self._bump_pending = False
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def version(self) -> int:
+        now = time.monotonic()
+        if now - self._version_checked >= self.version_ttl:
+            if self._bump_pending:
+                await self._bump()
+            if not self._bump_pending:
+                remote = await self.cache.get_counter(self.VERSION_KEY)
+                if remote is not None:
+                    self._version = max(self._version, remote)
+            self._version_checked = now
+        return self._version
+
+    async def _bump(self) -> None:
+        remote = await self.cache.incr_counter(self.VERSION_KEY)
+        if remote is not None and remote < self._version:
+            # The shared counter is behind this process (e.g. Redis lost its data): catch it up
+            remote = await self.cache.incr_counter(self.VERSION_KEY, self._version - remote)
+        if remote is None:
+            self._bump_pending = self.cache.shared
+            return
+        self._bump_pending = False
+        self._version = max(self._version, remote)
+
+    async def get_or_build(self, key: str, build: Callable[[], Awaitable[bytes | None]]) -> CachedBody | None:
+        """Cached body for ``key``; ``build`` returns the body or None (not cached)."""
+
+        if not self.enabled:
+            body = await build()
+            return CachedBody.from_body(body) if body is not None else None
+        versioned = f"{key}:v{await self.version()}"
+        cached = await self.cache.get(versioned)
+        if cached is not None:
+            return cached
+        inflight = self._inflight.get(versioned)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[versioned] = future
+        try:
+            body = await build()
+            cached = CachedBody.from_body(body) if body is not None else None
+            if cached is not None:
+                await self.cache.set(versioned, cached)
+            future.set_result(cached)
+            return cached
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # retrieved here, so a build nobody waited for is not reported
+            raise
+        finally:
+            del self._inflight[versioned]
+
+    async def invalidate(self) -> None:
+        self._version += 1  # this process stops serving old entries even if Redis is down
+        self._version_checked = time.monotonic()
+        self.cache.l1.clear()
+        await self._bump()
+
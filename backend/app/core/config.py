@@ -14,6 +14,8 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=('.env', '.env.local'), env_file_encoding='utf-8', case_sensitive=False)
 
     project_name: str = Field(default="Batumi Lunch Platform")
+    # Order deadlines and delivery dates are wall-clock time in Batumi
+    business_timezone: str = Field(default="Asia/Tbilisi")
     environment: Literal['local', 'test', 'development', 'staging', 'production'] = Field(default='local')
     api_v1_str: str = Field(default="/api/v1")
     database_url: str = Field(default="postgresql+asyncpg:///batumi_lunch")
@@ -33,6 +35,17 @@ class Settings(BaseSettings):
     log_level: str = Field(default="INFO")
     log_json: bool = Field(default=True)
     log_to_stdout: bool = Field(default=True)
+    log_queue_size: int = Field(default=10_000)
+    # Share of INFO records kept per logger prefix, e.g. {"app.events.buttons": 0.1}
+    log_sample_rates: dict[str, float] = Field(default_factory=dict)
+
+    # Menu responses: in-process LRU in front of Redis, invalidated by a shared version counter
+    menu_cache_enabled: bool = Field(default=True)
+    menu_cache_redis: bool = Field(default=True)
+    menu_cache_l1_size: int = Field(default=128)
+    menu_cache_l1_ttl: float = Field(default=300.0)
+    menu_cache_ttl: int = Field(default=3600)
+    menu_cache_version_ttl: float = Field(default=1.0)
 
     stripe_public_key: str | None = Field(default=None)
     stripe_secret_key: str | None = Field(default=None)
@@ -1,12 +1,33 @@
 from __future__ import annotations
 
+import atexit
 import json
 import logging
+import queue
 import sys
-from logging.config import dictConfig
-from typing import Any, MutableMapping
+from logging.handlers import QueueListener
+from typing import Any, Mapping, MutableMapping
 
 from .config import settings
+from .logqueue import NonBlockingQueueHandler, SamplingFilter
+
+try:  # optional fast encoder
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def dumps_json(payload: Mapping[str, Any]) -> str:
+    """Encode a log record: orjson when installed, otherwise a reused stdlib encoder."""
+
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, default=str).decode()
+        except TypeError:  # e.g. non-str keys or integers beyond 64 bits
+            pass
+    return _json_encoder.encode(payload)
 
 
 class JsonFormatter(logging.Formatter):
@@ -21,44 +42,61 @@ class JsonFormatter(logging.Formatter):
         }
         if hasattr(record, "trace_id"):
             log_record["trace_id"] = getattr(record, "trace_id")
-        if record.exc_info:
-            log_record["exc_info"] = self.formatException(record.exc_info)
-        return json.dumps(log_record, ensure_ascii=False)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            log_record["exc_info"] = record.exc_text
+        return dumps_json(log_record)
 
 
-def configure_logging() -> None:
-    """Configure logging for the application."""
+_listener: QueueListener | None = None
 
-    handlers: dict[str, Any] = {
-        "console": {
-            "class": "logging.StreamHandler",
-            "level": settings.log_level,
-            "stream": sys.stdout,
-            "formatter": "json" if settings.log_json else "standard",
-        }
-    }
-
-    formatters: dict[str, Any] = {
-        "standard": {
-            "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        },
-        "json": {
-            "()": JsonFormatter,
-        },
-    }
-
-    dictConfig(
-        {
-            "version": 1,
-            "disable_existing_loggers": False,
-            "formatters": formatters,
-            "handlers": handlers,
-            "root": {
-                "level": settings.log_level,
-                "handlers": ["console"],
-            },
-        }
-    )
+
+def configure_logging(force: bool = False) -> None:
+    """Configure logging for the application.
+
+    Runs once per process: the root logger gets a queue handler and the console handler
+    is served by a background listener thread. ``force=True`` rebuilds the pipeline.
+    """
+
+    global _listener
+    if _listener is not None:
+        if not force:
+            return
+        shutdown_logging()
+
+    if settings.log_json:
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(settings.log_level)
+    console.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = NonBlockingQueueHandler(log_queue, settings.log_queue_size)
+    if settings.log_sample_rates:
+        queue_handler.addFilter(SamplingFilter(settings.log_sample_rates))
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(queue_handler)
+    root.setLevel(settings.log_level)
+
+    _listener = QueueListener(log_queue, console, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+atexit.register(shutdown_logging)
 
 
 def get_logger(name: str) -> logging.Logger:
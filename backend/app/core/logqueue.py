@@ -0,0 +1,74 @@
+"""Queue logging primitives shared by the API and the Telegram bot (``logqueue.py``).
+
+Standard library only: the bot imports this module without the API's settings
+and dependencies.
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler
+from typing import Mapping
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of INFO/DEBUG records per logger name (prefix match).
+
+    WARNING and above always pass.
+    """
+
+    def __init__(self, rates: Mapping[str, float]):
+        super().__init__()
+        self.rates = {name: max(0.0, min(1.0, float(rate))) for name, rate in rates.items()}
+        self._cache: dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            for prefix, value in self.rates.items():
+                if name == prefix or name.startswith(prefix + "."):
+                    rate = value
+                    break
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hand records to the listener thread; drop them instead of waiting when the queue is full.
+
+    Only the message arguments and the traceback are rendered in the calling thread, so the
+    record no longer references mutable request state. Formatting and the write itself
+    happen in the listener thread.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, maxsize: int):
+        super().__init__(log_queue)
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Like QueueHandler.prepare: other handlers of the logger keep the caller's record
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.maxsize:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
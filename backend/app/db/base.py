@@ -4,6 +4,7 @@ from .models.base import Base  # noqa: F401  re-export for Alembic
 from .models.address import Address  # noqa: F401
 from .models.allergy import AllergyTag  # noqa: F401
 from .models.delivery import DeliverySlot, DeliveryZone  # noqa: F401
+from .models.inventory import InventoryLedgerEntry  # noqa: F401
 from .models.menu import DayOffer, MenuWeek, Preset  # noqa: F401
 from .models.orders import Order, OrderTemplate, WeekSelection  # noqa: F401
 from .models.payments import PaymentIntent, PaymentToken  # noqa: F401
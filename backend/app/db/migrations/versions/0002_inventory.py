@@ -0,0 +1,38 @@
+"""Portion inventory: reserved counter on day offers and the inventory ledger"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002_inventory"
+down_revision = "0001_initial"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("day_offers", sa.Column("portions_reserved", sa.Integer(), nullable=False, server_default="0"))
+    op.create_check_constraint("ck_day_offers_portions_reserved", "day_offers", "portions_reserved >= 0")
+
+    op.create_table(
+        "inventory_ledger",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column("day_offer_id", sa.Integer(), sa.ForeignKey("day_offers.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("order_id", sa.Integer(), sa.ForeignKey("orders.id", ondelete="SET NULL")),
+        sa.Column("portions", sa.Integer(), nullable=False),
+        sa.Column("reason", sa.String(length=32), nullable=False),
+    )
+    op.create_index("ix_inventory_ledger_day_offer_id", "inventory_ledger", ["day_offer_id"])
+    op.create_index("ix_inventory_ledger_order_id", "inventory_ledger", ["order_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inventory_ledger_order_id", table_name="inventory_ledger")
+    op.drop_index("ix_inventory_ledger_day_offer_id", table_name="inventory_ledger")
+    op.drop_table("inventory_ledger")
+    op.drop_constraint("ck_day_offers_portions_reserved", "day_offers", type_="check")
+    op.drop_column("day_offers", "portions_reserved")
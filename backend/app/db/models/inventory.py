@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from sqlalchemy import ForeignKey, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class InventoryLedgerEntry(Base):
+    """One reservation (positive ``portions``) or release (negative) of a day offer's capacity."""
+
+    __tablename__ = "inventory_ledger"
+
+    day_offer_id: Mapped[int] = mapped_column(ForeignKey("day_offers.id", ondelete="CASCADE"), index=True, nullable=False)
+    order_id: Mapped[int | None] = mapped_column(ForeignKey("orders.id", ondelete="SET NULL"), index=True)
+    portions: Mapped[int] = mapped_column(Integer, nullable=False)
+    reason: Mapped[str] = mapped_column(String(32), nullable=False)
@@ -4,7 +4,7 @@ from datetime import date
 from enum import Enum as PyEnum
 from typing import List
 
-from sqlalchemy import Boolean, Date, Enum, ForeignKey, Integer, JSON, Numeric, String, UniqueConstraint
+from sqlalchemy import Boolean, CheckConstraint, Date, Enum, ForeignKey, Integer, JSON, Numeric, String, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -33,7 +33,10 @@ class MenuWeek(Base):
 
 class DayOffer(Base):
     __tablename__ = "day_offers"
-    __table_args__ = (UniqueConstraint("menu_week_id", "day_of_week", name="uq_day_offers_week_day"),)
+    __table_args__ = (
+        UniqueConstraint("menu_week_id", "day_of_week", name="uq_day_offers_week_day"),
+        CheckConstraint("portions_reserved >= 0", name="ck_day_offers_portions_reserved"),
+    )
 
     menu_week_id: Mapped[int] = mapped_column(ForeignKey("menu_weeks.id", ondelete="CASCADE"), nullable=False)
     day_of_week: Mapped[str] = mapped_column(String(16), nullable=False)
@@ -43,6 +46,8 @@ class DayOffer(Base):
     price_lari: Mapped[float | None] = mapped_column(Numeric(10, 2))
     status: Mapped[DayStatus] = mapped_column(Enum(DayStatus), default=DayStatus.AVAILABLE, nullable=False)
     portion_limit: Mapped[int | None] = mapped_column(Integer)
+    # Changed only through domain.orders.inventory (atomic UPDATE plus a ledger entry)
+    portions_reserved: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
     sold_out: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     photo_url: Mapped[str | None] = mapped_column(String(512))
 
@@ -28,7 +28,7 @@ class Order(Base):
     __tablename__ = "orders"
 
     order_code: Mapped[str] = mapped_column(String(32), unique=True, nullable=False, index=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="SET NULL"), index=True)
+    user_id: Mapped[int | None] = mapped_column(ForeignKey("users.id", ondelete="SET NULL"), index=True)
     address_id: Mapped[int | None] = mapped_column(ForeignKey("addresses.id", ondelete="SET NULL"))
     menu_week_id: Mapped[int | None] = mapped_column(ForeignKey("menu_weeks.id", ondelete="SET NULL"))
     template_id: Mapped[int | None] = mapped_column(ForeignKey("order_templates.id", ondelete="SET NULL"))
@@ -73,4 +73,4 @@ class WeekSelection(Base):
     config: Mapped[dict] = mapped_column(JSON, default=dict)
     subtotal_lari: Mapped[float] = mapped_column(Numeric(10, 2), default=0, nullable=False)
 
-    order: Mapped[Order] = relationship(back_populates="week_selection")
+    order: Mapped[Order] = relationship(back_populates="week_selections")
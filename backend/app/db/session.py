@@ -3,6 +3,7 @@ from __future__ import annotations
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from ..core.config import settings
+from . import base  # noqa: F401  registers every model, so string relationships resolve
 
 engine = create_async_engine(settings.database_url, pool_pre_ping=True, echo=settings.is_debug)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from ...core.cache import TwoTierCache, VersionedCache
+from ...core.config import settings
+
+menu_cache = VersionedCache(
+    TwoTierCache(
+        "menu",
+        settings.redis_url if settings.menu_cache_redis else None,
+        l1_size=settings.menu_cache_l1_size,
+        l1_ttl=settings.menu_cache_l1_ttl,
+        l2_ttl=settings.menu_cache_ttl,
+    ),
+    version_ttl=settings.menu_cache_version_ttl,
+    enabled=settings.menu_cache_enabled,
+)
+
+
+async def invalidate_menu_cache() -> None:
+    """Call after any committed change to menu weeks, day offers or presets."""
+
+    await menu_cache.invalidate()
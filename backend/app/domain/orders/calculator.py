@@ -1,22 +1,17 @@
 from __future__ import annotations
 
-from datetime import date, datetime, timedelta
-from typing import Iterable
+from datetime import date, datetime
+from typing import Iterable, Mapping, Sequence
 
 from fastapi import HTTPException, status
 
-from ...db.models.menu import DayOffer, DayStatus, MenuWeek
-
-DAY_TO_INDEX = {
-    "Понедельник": 0,
-    "Вторник": 1,
-    "Среда": 2,
-    "Четверг": 3,
-    "Пятница": 4,
-}
+from ...db.models.menu import MenuWeek
+from .pricing import DAY_TO_INDEX, WeekPricing, business_now, compile_week, to_timestamp
 
 
 class BasketItem:
+    __slots__ = ("day_of_week", "portions")
+
     def __init__(self, day_of_week: str, portions: int) -> None:
         if day_of_week not in DAY_TO_INDEX:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown day {day_of_week}")
@@ -25,54 +20,84 @@ class BasketItem:
 
 
 class OrderCalculator:
-    def __init__(self, menu_week: MenuWeek, now: datetime | None = None) -> None:
-        self.menu_week = menu_week
-        self.now = now or datetime.utcnow()
-        self.base_price = float(menu_week.base_price_lari)
-        self.offers: dict[str, DayOffer] = {offer.day_of_week: offer for offer in menu_week.day_offers}
-
-    def calc_day(self, basket_item: BasketItem, week_start: date) -> dict:
-        offer = self.offers.get(basket_item.day_of_week)
-        if not offer:
+    """Prices baskets against a compiled ``WeekPricing`` (a ``MenuWeek`` is compiled on the spot).
+
+    Money is summed in integer tetri and reported in lari. ``now`` defaults to the
+    current time in Batumi; a naive ``now`` is read as Batumi wall-clock time.
+    """
+
+    def __init__(self, menu_week: MenuWeek | WeekPricing, now: datetime | None = None) -> None:
+        self.table = menu_week if isinstance(menu_week, WeekPricing) else compile_week(menu_week)
+        self.now = now or business_now()
+        now_ts = to_timestamp(self.now)
+        # Day statuses depend only on the clock: evaluated once, shared by every basket priced here
+        self._statuses = tuple(day.status(now_ts) if day is not None else None for day in self.table.days)
+
+    def _price(self, basket_item: BasketItem) -> tuple[dict, int]:
+        idx = DAY_TO_INDEX[basket_item.day_of_week]
+        day = self.table.days[idx]
+        if day is None:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"No menu for {basket_item.day_of_week}")
-        delivery_date = week_start + timedelta(days=DAY_TO_INDEX[basket_item.day_of_week])
-        status_info = self._determine_status(offer, delivery_date)
-        price = float(offer.price_lari) if offer.price_lari is not None else self.base_price
-        subtotal = price * basket_item.portions
-        return {
+        sold_out, closed, reason = self._statuses[idx]
+        subtotal_tetri = day.price_tetri * basket_item.portions
+        breakdown = {
             "day_of_week": basket_item.day_of_week,
-            "date": delivery_date,
+            "date": day.date,
             "portions": basket_item.portions,
-            "price_lari": price,
-            "subtotal_lari": subtotal,
-            "sold_out": status_info["sold_out"],
-            "closed": status_info["closed"],
-            "reason": status_info["reason"],
+            "price_lari": day.price_tetri / 100,
+            "subtotal_lari": subtotal_tetri / 100,
+            "sold_out": sold_out,
+            "closed": closed,
+            "reason": reason,
         }
+        return breakdown, 0 if sold_out or closed else subtotal_tetri
 
-    def calc_week(self, selections: Iterable[BasketItem], week_start: date) -> dict:
-        days = [self.calc_day(item, week_start) for item in selections]
-        total = sum(day["subtotal_lari"] for day in days if not day["sold_out"] and not day["closed"])
-        has_menu = bool(days)
+    def _check_week(self, week_start: date | None) -> date:
+        # Prices and dates come from the bound table: another week cannot be priced here
+        if week_start is not None and week_start != self.table.week_start:
+            raise ValueError(f"calculator is bound to week {self.table.week_start}, not {week_start}")
+        return self.table.week_start
+
+    def calc_day(self, basket_item: BasketItem, week_start: date | None = None) -> dict:
+        self._check_week(week_start)
+        return self._price(basket_item)[0]
+
+    def calc_week(self, selections: Iterable[BasketItem], week_start: date | None = None) -> dict:
+        week_start = self._check_week(week_start)
+        days: list[dict] = []
+        total_tetri = 0
+        for item in selections:
+            breakdown, payable_tetri = self._price(item)
+            days.append(breakdown)
+            total_tetri += payable_tetri
         return {
             "week_start": week_start,
-            "total_lari": total,
+            "total_lari": total_tetri / 100,
             "days": days,
-            "has_menu": has_menu,
+            "has_menu": bool(days),
         }
 
-    def _determine_status(self, offer: DayOffer, delivery_date: date) -> dict:
-        sold_out = offer.status == DayStatus.SOLD_OUT or offer.sold_out
-        closed = False
-        reason: str | None = None
-        if offer.status == DayStatus.CLOSED:
-            closed = True
-            reason = "День закрыт администратором"
-        else:
-            if delivery_date == self.now.date() and self.now.hour >= self.menu_week.order_deadline_hour:
-                closed = True
-                reason = "После дедлайна"
-            if delivery_date < self.now.date():
-                closed = True
-                reason = "Дата в прошлом"
-        return {"sold_out": sold_out, "closed": closed, "reason": reason}
+
+def calc_weeks(
+    menu_weeks: Mapping[date, MenuWeek | WeekPricing | OrderCalculator],
+    selections: Sequence[BasketItem],
+    week_starts: Iterable[date],
+    now: datetime | None = None,
+) -> list[dict]:
+    """Prices the same basket for every week in ``week_starts`` against one clock.
+
+    ``menu_weeks`` maps week_start to its pricing table (or a week with
+    ``day_offers`` loaded, or a calculator to reuse across baskets); weeks without
+    a menu come back empty with ``has_menu=False``.
+    """
+
+    now = now or business_now()
+    weeks: list[dict] = []
+    for week_start in week_starts:
+        menu_week = menu_weeks.get(week_start)
+        if menu_week is None:
+            weeks.append({"week_start": week_start, "total_lari": 0.0, "days": [], "has_menu": False})
+            continue
+        calc = menu_week if isinstance(menu_week, OrderCalculator) else OrderCalculator(menu_week, now=now)
+        weeks.append(calc.calc_week(selections, week_start))
+    return weeks
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, case, insert, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...db.models.inventory import InventoryLedgerEntry
+from ...db.models.menu import DayOffer, DayStatus
+
+# Portion capacity of a day offer is ``portion_limit`` (NULL = unlimited) minus
+# ``portions_reserved``. Both operations are a single conditional UPDATE of that one
+# row: concurrent checkouts for the same day queue on its row lock (Postgres
+# re-checks the WHERE clause after the lock is granted), other days and the rest of
+# the table are unaffected. Every change is also written to ``inventory_ledger`` in
+# the same transaction. Reserve as the last statement before commit so the row lock
+# is held briefly, and call ``invalidate_menu_cache()`` after the commit when
+# ``sold_out_changed`` is set.
+
+
+@dataclass(frozen=True, slots=True)
+class InventoryChange:
+    day_offer_id: int
+    portions_reserved: int
+    portion_limit: int | None
+    sold_out: bool
+    sold_out_changed: bool
+
+    @property
+    def remaining(self) -> int | None:
+        return None if self.portion_limit is None else self.portion_limit - self.portions_reserved
+
+
+async def reserve(session: AsyncSession, day_offer_id: int, portions: int, order_id: int | None = None) -> InventoryChange:
+    """Takes ``portions`` from the day offer or raises 409 when they are not available.
+
+    The offer is marked ``sold_out`` by the reservation that takes the last portion.
+    """
+
+    if portions < 1:
+        raise ValueError("portions must be positive")
+    reserved_after = DayOffer.portions_reserved + portions
+    result = await session.execute(
+        update(DayOffer)
+        .where(
+            DayOffer.id == day_offer_id,
+            DayOffer.status == DayStatus.AVAILABLE,
+            DayOffer.sold_out.is_(False),
+            or_(DayOffer.portion_limit.is_(None), reserved_after <= DayOffer.portion_limit),
+        )
+        .values(
+            portions_reserved=reserved_after,
+            sold_out=case(
+                (and_(DayOffer.portion_limit.is_not(None), reserved_after >= DayOffer.portion_limit), True),
+                else_=DayOffer.sold_out,
+            ),
+        )
+        .returning(DayOffer.portions_reserved, DayOffer.portion_limit, DayOffer.sold_out)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.one_or_none()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Not enough portions left")
+    await _record(session, day_offer_id, portions, order_id, "reserve")
+    return InventoryChange(
+        day_offer_id=day_offer_id,
+        portions_reserved=row.portions_reserved,
+        portion_limit=row.portion_limit,
+        sold_out=row.sold_out,
+        # The WHERE clause saw sold_out = false, so it is set now only if this took the last portion
+        sold_out_changed=row.sold_out,
+    )
+
+
+async def release(session: AsyncSession, day_offer_id: int, portions: int, order_id: int | None = None) -> InventoryChange:
+    """Returns ``portions`` (e.g. of a cancelled order) to the day offer.
+
+    An offer that was sold out because it was full becomes available again; a
+    ``sold_out`` set by hand below the limit is left alone.
+    """
+
+    if portions < 1:
+        raise ValueError("portions must be positive")
+    frees_capacity = and_(
+        DayOffer.portion_limit.is_not(None),
+        DayOffer.portions_reserved >= DayOffer.portion_limit,
+        DayOffer.portions_reserved - portions < DayOffer.portion_limit,
+    )
+    result = await session.execute(
+        update(DayOffer)
+        .where(DayOffer.id == day_offer_id, DayOffer.portions_reserved >= portions)
+        .values(
+            portions_reserved=DayOffer.portions_reserved - portions,
+            sold_out=case((frees_capacity, False), else_=DayOffer.sold_out),
+        )
+        .returning(DayOffer.portions_reserved, DayOffer.portion_limit, DayOffer.sold_out)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.one_or_none()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Nothing reserved to release")
+    await _record(session, day_offer_id, -portions, order_id, "release")
+    return InventoryChange(
+        day_offer_id=day_offer_id,
+        portions_reserved=row.portions_reserved,
+        portion_limit=row.portion_limit,
+        sold_out=row.sold_out,
+        sold_out_changed=(
+            row.portion_limit is not None
+            and row.portions_reserved < row.portion_limit <= row.portions_reserved + portions
+        ),
+    )
+
+
+async def _record(session: AsyncSession, day_offer_id: int, portions: int, order_id: int | None, reason: str) -> None:
+    await session.execute(
+        insert(InventoryLedgerEntry).values(day_offer_id=day_offer_id, order_id=order_id, portions=portions, reason=reason)
+    )
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, noload
+
+from ...core.cache import LRUCache
+from ...core.config import settings
+from ...db.models.menu import DayStatus, MenuWeek
+from ..menu.cache import menu_cache
+
+BUSINESS_TZ = ZoneInfo(settings.business_timezone)
+
+DAYS = ("Понедельник", "Вторник", "Среда", "Четверг", "Пятница")
+DAY_TO_INDEX = {day: idx for idx, day in enumerate(DAYS)}
+
+REASON_CLOSED = "День закрыт администратором"
+REASON_DEADLINE = "После дедлайна"
+REASON_PAST = "Дата в прошлом"
+
+
+def to_tetri(amount: object) -> int:
+    """Lari amount (Numeric/Decimal, float or str) as integer tetri, rounded half up."""
+
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def to_timestamp(moment: datetime) -> float:
+    """POSIX timestamp; naive datetimes are wall-clock time in Batumi."""
+
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=BUSINESS_TZ)
+    return moment.timestamp()
+
+
+def business_now() -> datetime:
+    return datetime.now(BUSINESS_TZ)
+
+
+@dataclass(frozen=True, slots=True)
+class DayPricing:
+    """One day offer, precompiled: price in tetri and the moments it stops being orderable."""
+
+    day_of_week: str
+    date: date
+    price_tetri: int
+    sold_out: bool
+    closed: bool
+    portion_limit: int | None
+    cutoff_ts: float  # order deadline on the delivery date
+    past_ts: float  # midnight after the delivery date
+
+    def status(self, now_ts: float) -> tuple[bool, bool, str | None]:
+        """``(sold_out, closed, reason)`` at ``now_ts``."""
+
+        if self.closed:
+            return self.sold_out, True, REASON_CLOSED
+        if now_ts >= self.past_ts:
+            return self.sold_out, True, REASON_PAST
+        if now_ts >= self.cutoff_ts:
+            return self.sold_out, True, REASON_DEADLINE
+        return self.sold_out, False, None
+
+
+@dataclass(frozen=True, slots=True)
+class WeekPricing:
+    """Immutable pricing table of one menu week; ``days`` is indexed by ``DAY_TO_INDEX``."""
+
+    menu_week_id: int | None
+    week_start: date
+    days: tuple[DayPricing | None, ...]
+
+    def day(self, day_of_week: str) -> DayPricing | None:
+        return self.days[DAY_TO_INDEX[day_of_week]]
+
+
+def compile_week(menu_week: MenuWeek, week_start: date | None = None) -> WeekPricing:
+    """Builds the pricing table of ``menu_week`` (its ``day_offers`` must be loaded).
+
+    ``week_start`` defaults to the menu's own week.
+    """
+
+    week_start = week_start or menu_week.week_start
+    base_price = to_tetri(menu_week.base_price_lari)
+    deadline = time(hour=menu_week.order_deadline_hour)
+    days: list[DayPricing | None] = [None] * len(DAYS)
+    for offer in menu_week.day_offers:
+        idx = DAY_TO_INDEX.get(offer.day_of_week)
+        if idx is None:
+            continue
+        delivery_date = week_start + timedelta(days=idx)
+        days[idx] = DayPricing(
+            day_of_week=offer.day_of_week,
+            date=delivery_date,
+            price_tetri=to_tetri(offer.price_lari) if offer.price_lari is not None else base_price,
+            sold_out=offer.status == DayStatus.SOLD_OUT or bool(offer.sold_out),
+            closed=offer.status == DayStatus.CLOSED,
+            portion_limit=offer.portion_limit,
+            cutoff_ts=datetime.combine(delivery_date, deadline, BUSINESS_TZ).timestamp(),
+            past_ts=datetime.combine(delivery_date + timedelta(days=1), time(), BUSINESS_TZ).timestamp(),
+        )
+    return WeekPricing(menu_week_id=menu_week.id, week_start=week_start, days=tuple(days))
+
+
+_NO_MENU = object()
+
+
+class PricingTables:
+    """Compiled ``WeekPricing`` per week_start, shared by calc and checkout requests.
+
+    Entries are keyed by the menu cache version, so ``invalidate_menu_cache()``
+    retires them everywhere; weeks without a menu are remembered as well.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._tables = LRUCache(maxsize, ttl)
+
+    async def get(self, session: AsyncSession, week_starts: Iterable[date]) -> dict[date, WeekPricing]:
+        """Tables for the requested weeks that have a menu; misses are loaded in one query."""
+
+        version = await menu_cache.version()
+        tables: dict[date, WeekPricing] = {}
+        missing: list[date] = []
+        for week_start in week_starts:
+            table = self._tables.get(f"{week_start.isoformat()}:v{version}")
+            if table is None:
+                missing.append(week_start)
+            elif table is not _NO_MENU:
+                tables[week_start] = table
+        if not missing:
+            return tables
+
+        result = await session.execute(
+            select(MenuWeek)
+            .where(MenuWeek.week_start.in_(missing))
+            .options(joinedload(MenuWeek.day_offers), noload(MenuWeek.presets))
+        )
+        loaded = {menu_week.week_start: compile_week(menu_week) for menu_week in result.scalars().unique()}
+        for week_start in missing:
+            table = loaded.get(week_start)
+            self._tables.set(f"{week_start.isoformat()}:v{version}", table if table is not None else _NO_MENU)
+            if table is not None:
+                tables[week_start] = table
+        return tables
+
+    def clear(self) -> None:
+        self._tables.clear()
+
+
+pricing_tables = PricingTables(maxsize=settings.menu_cache_l1_size, ttl=settings.menu_cache_l1_ttl)
@@ -1,15 +1,25 @@
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .api.v1 import api_router
 from .core.config import settings
 from .core.logging import configure_logging
+from .domain.menu.cache import menu_cache
 
 configure_logging()
 
-app = FastAPI(title=settings.project_name, docs_url=f"{settings.api_v1_str}/docs")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await menu_cache.cache.close()
+
+
+app = FastAPI(title=settings.project_name, docs_url=f"{settings.api_v1_str}/docs", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
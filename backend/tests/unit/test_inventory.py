@@ -0,0 +1,156 @@
+"""Concurrency stress test for portion reservations.
+
+Runs against ``TEST_DATABASE_URL`` (an empty scratch database, e.g.
+``postgresql+asyncpg:///batumi_lunch_test`` to exercise Postgres row locks) or,
+by default, a temporary SQLite file when aiosqlite is installed.
+"""
+
+import asyncio
+import os
+import random
+from datetime import date
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.api.v1 import orders
+from app.api.v1.schemas import BasketSelection, CheckoutAddress, CheckoutRequest
+from app.db.base import Base
+from app.db.models.inventory import InventoryLedgerEntry
+from app.db.models.menu import DayOffer, MenuWeek
+from app.db.models.orders import Order
+from app.domain.orders.inventory import release, reserve
+from app.domain.orders.pricing import pricing_tables
+
+
+@pytest_asyncio.fixture
+async def sessions(tmp_path):
+    url = os.environ.get("TEST_DATABASE_URL")
+    if url is None:
+        pytest.importorskip("aiosqlite")
+        url = f"sqlite+aiosqlite:///{tmp_path / 'inventory.db'}"
+    if url.startswith("sqlite"):
+        engine = create_async_engine(
+            url, poolclass=AsyncAdaptedQueuePool, pool_size=8, max_overflow=0, connect_args={"timeout": 30}
+        )
+
+        # SQLite locks the whole file, and deferred transactions deadlock when two
+        # connections upgrade to a write lock: start every transaction as a writer
+        @event.listens_for(engine.sync_engine, "connect")
+        def _autocommit_driver(dbapi_connection, _record) -> None:
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine.sync_engine, "begin")
+        def _begin_immediate(conn) -> None:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        engine = create_async_engine(url, pool_size=20, max_overflow=80)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+
+
+async def _day_offer(sessions, portion_limit: int | None) -> int:
+    async with sessions() as session:
+        week = MenuWeek(week_start=date(2030, 1, 7), title="Склад", is_published=True)
+        week.day_offers = [DayOffer(day_of_week="Понедельник", items=["Суп"], portion_limit=portion_limit)]
+        session.add(week)
+        await session.commit()
+        return week.day_offers[0].id
+
+
+async def _checkout(sessions, day_offer_id: int, portions: int) -> int:
+    async with sessions() as session:
+        try:
+            await reserve(session, day_offer_id, portions)
+        except HTTPException:
+            return 0
+        await session.commit()
+        return portions
+
+
+async def _state(sessions, day_offer_id: int) -> tuple[int, bool, int]:
+    async with sessions() as session:
+        offer = await session.get(DayOffer, day_offer_id)
+        ledger = await session.scalar(
+            select(func.coalesce(func.sum(InventoryLedgerEntry.portions), 0)).where(InventoryLedgerEntry.day_offer_id == day_offer_id)
+        )
+        return offer.portions_reserved, offer.sold_out, ledger
+
+
+@pytest.mark.asyncio
+async def test_concurrent_checkouts_never_oversell(sessions) -> None:
+    limit = 50
+    day_offer_id = await _day_offer(sessions, limit)
+    rng = random.Random(7)
+    demand = [rng.randint(1, 3) for _ in range(120)]
+
+    sold = await asyncio.gather(*(_checkout(sessions, day_offer_id, portions) for portions in demand))
+
+    reserved, sold_out, ledger = await _state(sessions, day_offer_id)
+    assert sum(sold) == reserved == ledger
+    assert limit - 3 < reserved <= limit
+    assert sold_out is (reserved == limit)
+
+
+@pytest.mark.asyncio
+async def test_last_portion_flips_sold_out_and_release_restores_it(sessions) -> None:
+    day_offer_id = await _day_offer(sessions, 2)
+    async with sessions() as session:
+        first = await reserve(session, day_offer_id, 1)
+        last = await reserve(session, day_offer_id, 1)
+        with pytest.raises(HTTPException):
+            await reserve(session, day_offer_id, 1)
+        returned = await release(session, day_offer_id, 1)
+        await session.commit()
+
+    assert (first.sold_out_changed, last.sold_out_changed, returned.sold_out_changed) == (False, True, True)
+    assert returned.remaining == 1
+    assert await _state(sessions, day_offer_id) == (1, False, 1)
+
+
+@pytest.mark.asyncio
+async def test_checkout_reserves_portions_and_invalidates_menu_on_sell_out(sessions, monkeypatch) -> None:
+    day_offer_id = await _day_offer(sessions, 2)
+    invalidations = []
+
+    async def invalidate() -> None:
+        invalidations.append(True)
+        pricing_tables.clear()
+
+    monkeypatch.setattr(orders, "invalidate_menu_cache", invalidate)
+    pricing_tables.clear()
+
+    async def checkout(portions: int) -> int | None:
+        payload = CheckoutRequest(
+            week_start=date(2030, 1, 7),
+            selections=[BasketSelection(day_of_week="Понедельник", portions=portions)],
+            address=CheckoutAddress(),
+        )
+        async with sessions() as session:
+            return (await orders.checkout_order(payload, session)).order_id
+
+    assert await checkout(1) is not None
+    assert invalidations == []
+    # The menu still shows the day as available, the reservation itself refuses
+    with pytest.raises(HTTPException) as exc:
+        await checkout(2)
+    assert exc.value.status_code == 409
+    assert await checkout(1) is not None
+    assert invalidations == [True]
+    with pytest.raises(HTTPException) as exc:
+        await checkout(1)
+    assert exc.value.status_code == 409
+
+    assert await _state(sessions, day_offer_id) == (2, True, 2)
+    async with sessions() as session:
+        assert await session.scalar(select(func.count()).select_from(Order)) == 2
@@ -0,0 +1,56 @@
+import json
+import logging
+import sys
+
+from app.core.logging import JsonFormatter, NonBlockingQueueHandler, SamplingFilter
+
+
+def _record(name: str, level: int, msg: str, *args) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_json_formatter_encodes_unicode_and_trace_id() -> None:
+    record = _record("app.test", logging.INFO, "Заказ %s", "BLB-1")
+    record.trace_id = "abc"
+    payload = json.loads(JsonFormatter().format(record))
+    assert payload["message"] == "Заказ BLB-1"
+    assert payload["trace_id"] == "abc"
+    assert payload["level"] == "INFO"
+
+
+def test_sampling_filter_keeps_warnings_and_unlisted_loggers() -> None:
+    sampler = SamplingFilter({"app.events": 0.0})
+    assert not sampler.filter(_record("app.events.buttons", logging.INFO, "click"))
+    assert sampler.filter(_record("app.events.buttons", logging.WARNING, "slow"))
+    assert sampler.filter(_record("app.eventsx", logging.INFO, "other"))
+
+
+def test_queue_handler_drops_when_full() -> None:
+    import queue
+
+    handler = NonBlockingQueueHandler(queue.SimpleQueue(), maxsize=2)
+    for i in range(5):
+        handler.emit(_record("app.test", logging.INFO, "n=%d", i))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    first = handler.queue.get_nowait()
+    assert first.getMessage() == "n=0" and first.args is None
+
+
+def test_queue_handler_leaves_the_callers_record_alone() -> None:
+    import queue
+
+    handler = NonBlockingQueueHandler(queue.SimpleQueue(), maxsize=2)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = _record("app.test", logging.ERROR, "order %s", "BLB-1")
+        record.exc_info = sys.exc_info()
+    handler.handle(record)
+
+    queued = handler.queue.get_nowait()
+    assert (queued.msg, queued.args, queued.exc_info) == ("order BLB-1", None, None)
+    assert "ValueError: boom" in queued.exc_text
+    # Handlers after the queue handler still see the original record
+    assert (record.msg, record.args) == ("order %s", ("BLB-1",))
+    assert record.exc_info is not None
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+from app.core.cache import CachedBody, LRUCache, TwoTierCache, VersionedCache, etag_matches
+
+
+class FakeRedis:
+    """Just the commands the cache uses, backed by a dict."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, object] = {}
+        self.down = False
+
+    def _check(self) -> None:
+        if self.down:
+            raise ConnectionError("redis is down")
+
+    async def hmget(self, key, *fields):
+        self._check()
+        entry = self.data.get(key) or {}
+        return [entry.get(field) for field in fields]
+
+    async def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    async def incr(self, key, amount=1):
+        self._check()
+        self.data[key] = int(self.data.get(key) or 0) + amount
+        return self.data[key]
+
+    def pipeline(self, transaction=True):
+        redis = self
+
+        class Pipeline:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            def hset(self, key, mapping):
+                redis.data[key] = {k: v.encode() if isinstance(v, str) else v for k, v in mapping.items()}
+
+            def expire(self, key, ttl):
+                pass
+
+            async def execute(self):
+                redis._check()
+                return []
+
+        return Pipeline()
+
+
+def _cache(client=None) -> VersionedCache:
+    return VersionedCache(
+        TwoTierCache(
+            "menu", "redis://test" if client else None, l1_size=4, l1_ttl=60, l2_ttl=60, retry_after=0, client=client
+        ),
+        version_ttl=0,
+    )
+
+
+def test_etag_matches_uses_weak_comparison() -> None:
+    etag = CachedBody.from_body(b'{"id":1}').etag
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_lru_evicts_least_recently_used() -> None:
+    lru = LRUCache(maxsize=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_build_and_invalidate_rebuilds() -> None:
+    cache = _cache()
+    builds = 0
+
+    async def build() -> bytes:
+        nonlocal builds
+        builds += 1
+        await asyncio.sleep(0.01)
+        return b"menu-%d" % builds
+
+    results = await asyncio.gather(*(cache.get_or_build("week:latest", build) for _ in range(5)))
+    assert builds == 1
+    assert {r.body for r in results} == {b"menu-1"}
+
+    await cache.invalidate()
+    fresh = await cache.get_or_build("week:latest", build)
+    assert fresh.body == b"menu-2"
+    assert fresh.etag != results[0].etag
+
+
+@pytest.mark.asyncio
+async def test_redis_tier_is_shared_and_version_invalidates_other_processes() -> None:
+    redis = FakeRedis()
+    first, second = _cache(redis), _cache(redis)
+
+    async def build() -> bytes:
+        return b"v1"
+
+    async def must_not_build() -> bytes:
+        raise AssertionError("served from Redis")
+
+    await first.get_or_build("weeks:8", build)
+    assert (await second.get_or_build("weeks:8", must_not_build)).body == b"v1"
+
+    async def rebuilt() -> bytes:
+        return b"v2"
+
+    await first.invalidate()
+    assert (await second.get_or_build("weeks:8", rebuilt)).body == b"v2"
+
+
+@pytest.mark.asyncio
+async def test_invalidation_during_redis_outage_is_not_lost() -> None:
+    redis = FakeRedis()
+    first, second = _cache(redis), _cache(redis)
+
+    async def old() -> bytes:
+        return b"old"
+
+    async def new() -> bytes:
+        return b"new"
+
+    assert (await first.get_or_build("weeks:8", old)).body == b"old"
+    assert (await second.get_or_build("weeks:8", old)).body == b"old"
+
+    redis.down = True
+    await first.invalidate()
+    assert (await first.get_or_build("weeks:8", new)).body == b"new"
+
+    redis.down = False
+    assert (await first.get_or_build("weeks:8", new)).body == b"new"
+    # The bump reached Redis once it was back, so the other process moves on too
+    assert (await second.get_or_build("weeks:8", new)).body == b"new"
+    assert await first.version() == await second.version() == 1
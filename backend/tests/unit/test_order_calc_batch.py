@@ -0,0 +1,115 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.api.v1 import orders
+from app.api.v1.schemas import BasketSelection, CalcBatchBasket, CalcOrderBatchRequest, CalcOrderRequest
+from app.db.models.menu import DayOffer, DayStatus, MenuWeek
+from app.domain.orders.pricing import compile_week
+
+WEEK = date(2030, 1, 7)
+
+
+class FakeTables:
+    """Stands in for ``pricing_tables``: two weeks with a menu, then none."""
+
+    def __init__(self) -> None:
+        first = MenuWeek(id=1, week_start=WEEK, title="Первая", order_deadline_hour=10, base_price_lari=15)
+        first.day_offers = [
+            DayOffer(day_of_week="Понедельник", items=["Суп"], status=DayStatus.AVAILABLE, price_lari=15, sold_out=False),
+            DayOffer(day_of_week="Вторник", items=["Салат"], status=DayStatus.SOLD_OUT, price_lari=15, sold_out=True),
+        ]
+        second = MenuWeek(id=2, week_start=WEEK + timedelta(days=7), title="Вторая", order_deadline_hour=10, base_price_lari=17)
+        second.day_offers = [
+            DayOffer(day_of_week="Понедельник", items=["Плов"], status=DayStatus.AVAILABLE, price_lari=None, sold_out=False),
+        ]
+        self.tables = {week.week_start: compile_week(week) for week in (first, second)}
+        self.requests: list[list[date]] = []
+
+    async def get(self, session, week_starts):
+        week_starts = list(week_starts)
+        self.requests.append(week_starts)
+        return {week_start: self.tables[week_start] for week_start in week_starts if week_start in self.tables}
+
+
+@pytest.fixture
+def tables(monkeypatch) -> FakeTables:
+    fake = FakeTables()
+    monkeypatch.setattr(orders, "pricing_tables", fake)
+    return fake
+
+
+def _basket(key: str, *days: str, weeks_ahead: int = 1, promo_code: str | None = None) -> CalcBatchBasket:
+    return CalcBatchBasket(
+        key=key,
+        selections=[BasketSelection(day_of_week=day, portions=2) for day in days],
+        weeks_ahead=weeks_ahead,
+        promo_code=promo_code,
+    )
+
+
+@pytest.mark.asyncio
+async def test_batch_loads_weeks_once_and_slices_them_per_basket(tables: FakeTables) -> None:
+    payload = CalcOrderBatchRequest(
+        week_start=WEEK,
+        baskets=[_basket("one", "Понедельник"), _basket("three", "Понедельник", weeks_ahead=3)],
+    )
+
+    response = await orders.calculate_order_batch(payload, session=None)
+
+    assert tables.requests == [[WEEK, WEEK + timedelta(days=7), WEEK + timedelta(days=14)]]
+    one, three = (item.result for item in response.results)
+    assert [week.week_start for week in one.weeks] == [WEEK]
+    assert [week.has_menu for week in three.weeks] == [True, True, False]
+    assert (one.total_lari, three.total_lari) == (30.0, 64.0)
+
+
+@pytest.mark.asyncio
+async def test_bad_basket_gets_an_error_and_the_rest_are_priced(tables: FakeTables) -> None:
+    payload = CalcOrderBatchRequest(
+        week_start=WEEK,
+        baskets=[
+            _basket("ok", "Понедельник"),
+            _basket("empty"),
+            _basket("unknown", "Воскресенье"),
+            _basket("no-menu", "Среда"),
+            CalcBatchBasket(selections=[BasketSelection(day_of_week="Понедельник", portions=1)]),
+        ],
+    )
+
+    response = await orders.calculate_order_batch(payload, session=None)
+
+    assert [item.key for item in response.results] == ["ok", "empty", "unknown", "no-menu", None]
+    assert [item.error for item in response.results] == [
+        None,
+        "No selections provided",
+        "Unknown day Воскресенье",
+        "No menu for Среда",
+        None,
+    ]
+    assert response.results[0].result.total_lari == 30.0
+    assert response.results[4].result.total_lari == 15.0
+
+
+@pytest.mark.asyncio
+async def test_batch_results_match_single_calc(tables: FakeTables) -> None:
+    baskets = [
+        _basket("mon", "Понедельник"),
+        _basket("sold-out", "Понедельник", "Вторник"),
+        _basket("promo", "Понедельник", weeks_ahead=3, promo_code="LUNCH"),
+    ]
+
+    response = await orders.calculate_order_batch(CalcOrderBatchRequest(week_start=WEEK, baskets=baskets), session=None)
+
+    for basket, item in zip(baskets, response.results):
+        single = await orders.calculate_order(
+            CalcOrderRequest(
+                week_start=WEEK,
+                selections=basket.selections,
+                promo_code=basket.promo_code,
+                weeks_ahead=basket.weeks_ahead,
+                mode=basket.mode,
+            ),
+            session=None,
+        )
+        assert item.result == single
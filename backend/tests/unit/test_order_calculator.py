@@ -1,9 +1,11 @@
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
 
 import pytest
 
 from app.db.models.menu import DayOffer, DayStatus, MenuWeek
-from app.domain.orders.calculator import BasketItem, OrderCalculator
+from app.domain.orders.calculator import BasketItem, OrderCalculator, calc_weeks
+from app.domain.orders.pricing import compile_week, to_tetri
 
 
 @pytest.fixture
@@ -44,3 +46,44 @@ def test_calc_week_sums(menu_week: MenuWeek) -> None:
     selections = [BasketItem("Понедельник", 2)]
     result = calc.calc_week(selections, menu_week.week_start)
     assert result["total_lari"] == pytest.approx(30)
+
+
+def test_calc_weeks_prices_each_week_and_flags_missing(menu_week: MenuWeek) -> None:
+    next_week = menu_week.week_start + timedelta(days=7)
+    weeks = calc_weeks(
+        {menu_week.week_start: menu_week},
+        [BasketItem("Понедельник", 2)],
+        [menu_week.week_start, next_week],
+        now=datetime(2024, 3, 17, 9, 0),
+    )
+    assert [week["week_start"] for week in weeks] == [menu_week.week_start, next_week]
+    assert weeks[0]["total_lari"] == pytest.approx(30)
+    assert weeks[1] == {"week_start": next_week, "total_lari": 0.0, "days": [], "has_menu": False}
+
+
+def test_cutoff_is_batumi_time(menu_week: MenuWeek) -> None:
+    # 06:30 UTC is 10:30 in Batumi (UTC+4), past the 10:00 deadline
+    calc = OrderCalculator(menu_week, now=datetime(2024, 3, 18, 6, 30, tzinfo=timezone.utc))
+    assert calc.calc_day(BasketItem("Понедельник", 1), menu_week.week_start)["reason"] == "После дедлайна"
+    calc = OrderCalculator(menu_week, now=datetime(2024, 3, 18, 5, 30, tzinfo=timezone.utc))
+    assert calc.calc_day(BasketItem("Понедельник", 1), menu_week.week_start)["closed"] is False
+
+
+def test_prices_are_exact_tetri(menu_week: MenuWeek) -> None:
+    menu_week.day_offers[0].price_lari = Decimal("12.35")
+    assert to_tetri(Decimal("12.35")) == 1235
+    assert to_tetri(0.1 + 0.2) == 30
+    table = compile_week(menu_week)
+    assert table.day("Понедельник").price_tetri == 1235
+    calc = OrderCalculator(table, now=datetime(2024, 3, 17, 9, 0))
+    result = calc.calc_week([BasketItem("Понедельник", 3)], menu_week.week_start)
+    assert result["total_lari"] == 37.05
+
+
+def test_calculator_refuses_another_week(menu_week: MenuWeek) -> None:
+    calc = OrderCalculator(menu_week, now=datetime(2024, 3, 17, 9, 0))
+    assert calc.calc_week([BasketItem("Понедельник", 1)])["week_start"] == menu_week.week_start
+    with pytest.raises(ValueError):
+        calc.calc_day(BasketItem("Понедельник", 1), menu_week.week_start + timedelta(days=7))
+    with pytest.raises(ValueError):
+        calc_weeks({menu_week.week_start + timedelta(days=7): menu_week}, [BasketItem("Понедельник", 1)], [menu_week.week_start + timedelta(days=7)])
@@ -20,13 +20,90 @@ try:
 except Exception:
     OPERATOR_INSTAGRAM = ""
 
+# Бэкенд хранилища: "json" (файлы users.json/orders.json/order_window.json) или "sqlite"
+try:
+    from config_secret import STORAGE_BACKEND
+except Exception:
+    STORAGE_BACKEND = "json"
+
+# Режим получения обновлений: "polling" (long polling) или "webhook" (локальный HTTP за reverse proxy)
+try:
+    from config_secret import BOT_MODE
+except Exception:
+    BOT_MODE = "polling"
+
+# Публичный https-адрес, который прокси отдаёт на WEBHOOK_LISTEN:WEBHOOK_PORT (без WEBHOOK_PATH)
+try:
+    from config_secret import WEBHOOK_URL
+except Exception:
+    WEBHOOK_URL = ""
+
+try:
+    from config_secret import WEBHOOK_LISTEN
+except Exception:
+    WEBHOOK_LISTEN = "127.0.0.1"
+
+try:
+    from config_secret import WEBHOOK_PORT
+except Exception:
+    WEBHOOK_PORT = 8081
+
+try:
+    from config_secret import WEBHOOK_PATH
+except Exception:
+    WEBHOOK_PATH = "telegram"
+
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token; пустой — генерируется при каждом старте
+try:
+    from config_secret import WEBHOOK_SECRET
+except Exception:
+    WEBHOOK_SECRET = ""
+
+# Предел очереди входящих обновлений: при переполнении приём ждёт (Telegram повторит доставку)
+try:
+    from config_secret import UPDATE_QUEUE_SIZE
+except Exception:
+    UPDATE_QUEUE_SIZE = 256
+
+# Сколько обновлений обрабатывается одновременно (разные чаты; внутри чата — строго по очереди)
+try:
+    from config_secret import MAX_CONCURRENT_UPDATES
+except Exception:
+    MAX_CONCURRENT_UPDATES = 16
+
+# Сколько необработанных обновлений одного чата идёт в счёт UPDATE_QUEUE_SIZE; остальные ждут
+# своей очереди, не задерживая приём обновлений от других чатов
+try:
+    from config_secret import MAX_CHAT_PENDING_UPDATES
+except Exception:
+    MAX_CHAT_PENDING_UPDATES = 32
+
+# Доля сохраняемых INFO-записей по логгерам, например {"bot.buttons": 0.1, "bot.actions": 0.5}
+try:
+    from config_secret import LOG_SAMPLE_RATES
+except Exception:
+    LOG_SAMPLE_RATES = {}
+
+# Потоков для отрисовки отчётов и выгрузок (больше — не берётся, задачи ждут в очереди)
+try:
+    from config_secret import RENDER_WORKERS
+except Exception:
+    RENDER_WORKERS = 2
+
+# Адрес Bot API (локальный telegram-bot-api или стенд scripts/bot_latency_harness.py)
+try:
+    from config_secret import BOT_API_BASE_URL
+except Exception:
+    BOT_API_BASE_URL = ""
+
 import logging
 import json
+import copy
 import re
 import secrets
 from urllib.parse import urlparse
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters, ConversationHandler, PicklePersistence
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters, ConversationHandler, TypeHandler
 from keyboards import (
     add_start_button,
     get_main_menu_keyboard,
@@ -47,6 +124,15 @@ from keyboards import (
     get_admin_confirm_keyboard,
     get_admin_back_keyboard,
 )
+from storage import Storage, is_cancelled, open_storage, order_user_id, order_week
+from broadcast import Audience, BroadcastEngine
+from media import FileIdCache
+from outbox import Outbox
+from reports import EXPORT_HEADER, EXPORT_WRITERS, export_rows, split_message
+from persistence import SqlitePersistence
+from routing import ButtonRouter
+from concurrency import PerChatUpdateProcessor, RenderPool, UpdateQueue
+from logqueue import start_queue_logging
 
 from datetime import datetime, timedelta, date
 from telegram.constants import ParseMode
@@ -57,12 +143,46 @@ import time
 import os
 import html
 import asyncio
+import io
 
 USERS_FILE = "users.json"
 ORDERS_FILE = "orders.json"
+ORDERS_DIR = "orders"
 ORDER_WINDOW_FILE = "order_window.json"
+MENU_FILE = "menu.json"
+SQLITE_FILE = "bot.sqlite3"
 PRICE_LARI = 15
 
+# Заказы, профили и окно приёма — за общим интерфейсом хранилища (см. storage.py).
+# JSON-бэкенд пишет на диск в отдельном потоке с групповым коммитом, обработчики не ждут fsync.
+# При первом запуске на SQLite данные импортируются из JSON-файлов.
+# Заказы JSON-бэкенда лежат по неделям в ORDERS_DIR, прошедшие недели — в ORDERS_DIR/archive.
+# Хранилище и всё, что на нём держится, создаёт open_bot_storage() при запуске бота (on_startup),
+# так что импорт модуля не трогает файлы данных.
+storage: Storage | None = None
+audience: Audience | None = None
+broadcasts: BroadcastEngine | None = None
+media_cache: FileIdCache | None = None
+outbox: Outbox | None = None
+
+
+def open_bot_storage() -> Storage:
+    global storage, audience, broadcasts, media_cache, outbox
+    storage = open_storage(STORAGE_BACKEND, ORDERS_FILE, USERS_FILE, ORDER_WINDOW_FILE, SQLITE_FILE, ORDERS_DIR)
+    # Рассылка /sms идёт в фоне, её курсор и список заблокировавших бота — в хранилище
+    # Аудитория рассылок обновляется на месте (регистрация, заказ, Forbidden), без пересборки
+    audience = Audience(storage, excluded=lambda: broadcasts.suppressed())
+    broadcasts = BroadcastEngine(storage, audience)
+    # Фото и анимации загружаются в Telegram один раз, дальше отправляются по file_id
+    media_cache = FileIdCache(storage)
+    # Уведомления админу и анимация после заказа уходят в фоне и не задерживают ответ клиенту
+    outbox = Outbox(storage, media_cache)
+    return storage
+
+
+# Отчёты, «Мои заказы» и выгрузки собираются в пуле потоков, а не в цикле событий
+render_pool = RenderPool(RENDER_WORKERS)
+
 DAY_TO_INDEX = {
     "Понедельник": 0,
     "Вторник": 1,
@@ -122,23 +242,25 @@ console_handler = logging.StreamHandler()
 console_handler.setFormatter(logging.Formatter('%(message)s'))
 console_handler.setLevel(logging.INFO)
 
-# Перенастройка логгера
-logger.handlers.clear()
+# Сообщения log_console идут только в терминал, как и раньше
+console_log = logging.getLogger("bot.console")
+log_handler.addFilter(lambda record: record.name != console_log.name)
+
 # Подавляем шумные логи httpx (например, запросы Telegram API)
 logging.getLogger("httpx").setLevel(logging.WARNING)
-logger.addHandler(log_handler)
-logger.addHandler(console_handler)
+# Обработчики из цикла событий только кладут запись в очередь; файл и терминал пишет
+# отдельный поток. Частые INFO-события можно прореживать через LOG_SAMPLE_RATES
+log_listener = start_queue_logging(logger, [log_handler, console_handler], LOG_SAMPLE_RATES)
 
 # Функция для явного логирования в консоль
 def log_console(message):
-    console_handler.stream.write(message + "\n")
-    console_handler.flush()
+    console_log.info(message)
 
 # Загрузка меню
 
-def load_menu():
+def _read_menu_file():
     try:
-        with open("menu.json", "r", encoding="utf-8") as f:
+        with open(MENU_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
             # простая валидация схемы
             if not isinstance(data, dict) or "week" not in data or "menu" not in data or not isinstance(data["menu"], dict):
@@ -150,15 +272,65 @@ def load_menu():
         return None
 
 
+class MenuSnapshot:
+    """Разобранное menu.json с заранее подготовленными текстами. Только для чтения."""
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.week = str(data.get("week") or "")
+        self.day_items: dict[str, list[str]] = {}
+        for day, items in data["menu"].items():
+            raw = items if isinstance(items, list) else [items]
+            self.day_items[day] = [str(it).strip() for it in raw if str(it).strip()]
+        # Текст дня для заказа (через запятую) и строки для карточки дня
+        self.day_text = {day: ", ".join(items) for day, items in self.day_items.items()}
+        self.day_html = {
+            day: "\n".join(f" - {html.escape(it)}" for it in items)
+            for day, items in self.day_items.items()
+        }
+        self.user_html = format_menu_html(data)
+        self.admin_html = _format_admin_menu_days(data)
+
+
+# Кэш меню: перечитываем файл, только если изменились mtime/размер (или после save_menu)
+_menu_cache: tuple[tuple[int, int], MenuSnapshot] | None = None
+
+
+def get_menu_snapshot() -> MenuSnapshot | None:
+    global _menu_cache
+    try:
+        st = os.stat(MENU_FILE)
+    except OSError as e:
+        logging.error(f"Ошибка загрузки меню: {e}")
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    if _menu_cache is not None and _menu_cache[0] == key:
+        return _menu_cache[1]
+    data = _read_menu_file()
+    if data is None:
+        return None
+    snapshot = MenuSnapshot(data)
+    _menu_cache = (key, snapshot)
+    return snapshot
+
+
+def load_menu():
+    """Копия меню для редактирования; для чтения используйте get_menu_snapshot()."""
+    snapshot = get_menu_snapshot()
+    return copy.deepcopy(snapshot.data) if snapshot else None
+
+
 def save_menu(menu_data: dict) -> bool:
+    global _menu_cache
     try:
-        tmp = "menu.json.tmp"
+        tmp = MENU_FILE + ".tmp"
         with open(tmp, "w", encoding="utf-8") as f:
             json.dump(menu_data, f, ensure_ascii=False, indent=2)
-        os.replace(tmp, "menu.json")
+        os.replace(tmp, MENU_FILE)
+        _menu_cache = None
         return True
     except Exception as e:
-        logging.error(f"Не удалось сохранить menu.json: {e}")
+        logging.error(f"Не удалось сохранить {MENU_FILE}: {e}")
         return False
 
 
@@ -172,26 +344,11 @@ def _get_current_menu() -> dict:
     return data
 
 
-def _format_admin_menu(menu_data: dict) -> str:
-    week = html.escape(str(menu_data.get("week") or "не указано"))
-    lines = [f"<b>Неделя:</b> {week}"]
-    window = _load_order_window()
-    week_start_str = window.get("week_start")
-    if window.get("next_week_enabled") and week_start_str:
-        try:
-            ws = date.fromisoformat(week_start_str)
-            status = ws.strftime("приём открыт до старта недели %d.%m.%Y")
-        except Exception:
-            status = "приём открыт (дата старта неизвестна)"
-    elif window.get("next_week_enabled"):
-        status = "приём открыт (дата старта неизвестна)"
-    else:
-        status = "приём закрыт"
-    lines.append(f"<i>Приём заказов на следующую неделю: {html.escape(status)}</i>")
+def _format_admin_menu_days(menu_data: dict) -> str:
     menu_block = menu_data.get("menu") or {}
     if not menu_block:
-        lines.append("<i>Меню пока пустое.</i>")
-        return "\n".join(lines)
+        return "<i>Меню пока пустое.</i>"
+    lines: list[str] = []
     for day, items in menu_block.items():
         lines.append("")
         lines.append(f"<b>{html.escape(str(day))}</b>")
@@ -203,6 +360,19 @@ def _format_admin_menu(menu_data: dict) -> str:
     return "\n".join(lines)
 
 
+def _format_admin_menu(snapshot: MenuSnapshot | None) -> str:
+    week = html.escape((snapshot.week if snapshot else "") or "не указано")
+    lines = [f"<b>Неделя:</b> {week}"]
+    ws = order_window.active_week(date.today())
+    if ws:
+        status = ws.strftime("приём открыт до старта недели %d.%m.%Y")
+    else:
+        status = "приём закрыт"
+    lines.append(f"<i>Приём заказов на следующую неделю: {html.escape(status)}</i>")
+    lines.append(snapshot.admin_html if snapshot else "<i>Меню пока пустое.</i>")
+    return "\n".join(lines)
+
+
 def _parse_menu_items(text: str) -> list[str]:
     items: list[str] = []
     for line in text.splitlines():
@@ -222,128 +392,57 @@ def _is_day_available_for_order(day: str) -> tuple[bool, str | None, bool, date
     idx = DAY_TO_INDEX.get(day)
     if idx is None:
         return False, "Неверный день недели.", False, None
+    # Только чтение из памяти: окно закрывает задача JobQueue в момент week_start
     now = datetime.now()
-    today_idx = now.weekday()
-
-    window = _load_order_window()
-    week_start_str = window.get("week_start")
-    next_week_enabled = bool(window.get("next_week_enabled"))
-    week_start_date: date | None = None
-    if week_start_str:
-        try:
-            week_start_date = date.fromisoformat(week_start_str)
-        except Exception:
-            week_start_date = None
-            next_week_enabled = False
-    today_date = now.date()
-    next_week_active = False
-    if next_week_enabled:
-        if week_start_date and today_date < week_start_date:
-            next_week_active = True
-        else:
-            _set_next_week_orders(False, None)
-            next_week_enabled = False
-            week_start_date = None
-
+    cutoff = order_window.cutoffs(now)[day]
+    next_week_start = order_window.active_week(now.date())
     current_week_start = _current_week_start(now)
 
-    if idx < today_idx:
-        if next_week_active and week_start_date is not None:
-            return True, None, True, week_start_date
+    if cutoff.date() < now.date():
+        if next_week_start is not None:
+            return True, None, True, next_week_start
         return False, (
             f"Заказы на <b>{html.escape(day)}</b> уже закрыты для текущей недели. "
             "День снова станет доступен после обновления меню на следующую неделю (утро субботы)."
         ), False, current_week_start
-    if idx == today_idx and now.hour >= ORDER_CUTOFF_HOUR:
-        cutoff_str = f"{ORDER_CUTOFF_HOUR:02d}:00"
+    if now >= cutoff:
+        cutoff_str = cutoff.strftime("%H:%M")
         return False, (
             f"Заказы на <b>{html.escape(day)}</b> принимаются до {cutoff_str} этого дня. "
             "Пожалуйста, выберите другой день недели."
         ), False, current_week_start
 
-    target_week = week_start_date if next_week_active and week_start_date is not None else current_week_start
-    return True, None, bool(next_week_active and week_start_date is not None), target_week
+    if next_week_start is not None:
+        return True, None, True, next_week_start
+    return True, None, False, current_week_start
 
-def log_user_action(user, action):
-    username = f"@{user.username}" if user.username else "(нет username)"
-    logging.info(f"User {user.id} {username}: {action}")
-
-# Работа с постоянным хранилищем профилей (users.json)
-
-def _load_users() -> dict:
-    try:
-        if not os.path.exists(USERS_FILE):
-            return {}
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data if isinstance(data, dict) else {}
-    except Exception as e:
-        logging.error(f"Не удалось загрузить {USERS_FILE}: {e}")
-        return {}
-
-
-def _save_users(data: dict) -> None:
-    try:
-        tmp = USERS_FILE + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        os.replace(tmp, USERS_FILE)
-    except Exception as e:
-        logging.error(f"Не удалось сохранить {USERS_FILE}: {e}")
-
-
-# Работа с заказами и человекочитаемым ID
-
-def _load_orders() -> dict:
-    try:
-        if not os.path.exists(ORDERS_FILE):
-            return {}
-        with open(ORDERS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data if isinstance(data, dict) else {}
-    except Exception as e:
-        logging.error(f"Не удалось загрузить {ORDERS_FILE}: {e}")
-        return {}
+action_log = logging.getLogger("bot.actions")
+button_log = logging.getLogger("bot.buttons")
 
 
-def _save_orders(data: dict) -> None:
-    try:
-        tmp = ORDERS_FILE + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        os.replace(tmp, ORDERS_FILE)
-    except Exception as e:
-        logging.error(f"Не удалось сохранить {ORDERS_FILE}: {e}")
-
+def log_user_action(user, action, log: logging.Logger = action_log):
+    username = f"@{user.username}" if user.username else "(нет username)"
+    log.info("User %s %s: %s", user.id, username, action)
 
 def _load_order_window() -> dict:
     default = {"next_week_enabled": False, "week_start": None}
     try:
-        if not os.path.exists(ORDER_WINDOW_FILE):
+        data = storage.load_order_window()
+        if not isinstance(data, dict):
             return default
-        with open(ORDER_WINDOW_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if not isinstance(data, dict):
-                return default
-            result = default | data
-            if not isinstance(result.get("next_week_enabled"), bool):
-                result["next_week_enabled"] = False
-            if result.get("week_start") and not isinstance(result.get("week_start"), str):
-                result["week_start"] = None
-            return result
+        result = default | data
+        if not isinstance(result.get("next_week_enabled"), bool):
+            result["next_week_enabled"] = False
+        if result.get("week_start") and not isinstance(result.get("week_start"), str):
+            result["week_start"] = None
+        return result
     except Exception as e:
-        logging.error(f"Не удалось загрузить {ORDER_WINDOW_FILE}: {e}")
+        logging.error(f"Не удалось загрузить окно приёма заказов: {e}")
         return default
 
 
 def _save_order_window(data: dict) -> None:
-    try:
-        tmp = ORDER_WINDOW_FILE + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        os.replace(tmp, ORDER_WINDOW_FILE)
-    except Exception as e:
-        logging.error(f"Не удалось сохранить {ORDER_WINDOW_FILE}: {e}")
+    storage.save_order_window(data)
 
 
 def _next_week_start(now: datetime | None = None) -> date:
@@ -355,11 +454,7 @@ def _next_week_start(now: datetime | None = None) -> date:
 
 
 def _set_next_week_orders(enabled: bool, week_start: date | None = None) -> None:
-    payload = {
-        "next_week_enabled": bool(enabled),
-        "week_start": week_start.isoformat() if (enabled and week_start) else None,
-    }
-    _save_order_window(payload)
+    order_window.set(enabled, week_start)
 
 
 def _current_week_start(now: datetime | None = None) -> date:
@@ -367,6 +462,93 @@ def _current_week_start(now: datetime | None = None) -> date:
     return (now - timedelta(days=now.weekday())).date()
 
 
+class OrderWindow:
+    """Окно приёма заказов на следующую неделю и дедлайны по дням — в памяти.
+
+    Состояние читается из хранилища один раз. Пишется оно только при открытии окна
+    админом и задачей JobQueue, которая закрывает окно ровно в week_start, поэтому
+    проверки доступности дня не трогают диск.
+    """
+
+    def __init__(self):
+        self._loaded = False
+        self.next_week_enabled = False
+        self.week_start: date | None = None
+        self._cutoffs_week: date | None = None
+        self._cutoffs: dict[str, datetime] = {}
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        window = _load_order_window()
+        self.next_week_enabled = bool(window.get("next_week_enabled"))
+        self.week_start = None
+        if window.get("week_start"):
+            try:
+                self.week_start = date.fromisoformat(window["week_start"])
+            except Exception:
+                self.next_week_enabled = False
+        self._loaded = True
+
+    def active_week(self, today: date) -> date | None:
+        """Дата старта следующей недели, если приём на неё сейчас открыт."""
+        self._ensure_loaded()
+        if self.next_week_enabled and self.week_start is not None and today < self.week_start:
+            return self.week_start
+        return None
+
+    def set(self, enabled: bool, week_start: date | None) -> None:
+        self._ensure_loaded()
+        self.next_week_enabled = bool(enabled)
+        self.week_start = week_start if (enabled and week_start) else None
+        _save_order_window({
+            "next_week_enabled": self.next_week_enabled,
+            "week_start": self.week_start.isoformat() if self.week_start else None,
+        })
+
+    def expire_if_due(self, today: date) -> bool:
+        """Закрывает окно, если неделя уже началась. Возвращает True, если окно закрыто сейчас."""
+        self._ensure_loaded()
+        if self.next_week_enabled and self.active_week(today) is None:
+            self.set(False, None)
+            return True
+        return False
+
+    def cutoffs(self, now: datetime) -> dict[str, datetime]:
+        """Дедлайны приёма по дням текущей недели; пересчитываются раз в неделю."""
+        week = _current_week_start(now)
+        if self._cutoffs_week != week:
+            self._cutoffs = {
+                day: datetime.combine(week + timedelta(days=idx), datetime.min.time()).replace(hour=ORDER_CUTOFF_HOUR)
+                for day, idx in DAY_TO_INDEX.items()
+            }
+            self._cutoffs_week = week
+        return self._cutoffs
+
+
+order_window = OrderWindow()
+ORDER_WINDOW_JOB = "order_window_close"
+
+
+async def close_order_window_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    if order_window.expire_if_due(date.today()):
+        logging.info("Приём заказов на следующую неделю закрыт: неделя началась")
+
+
+def schedule_order_window_close(job_queue) -> None:
+    """Ставит (или переставляет) задачу закрытия окна на начало week_start."""
+    if job_queue is None:
+        logging.warning("JobQueue недоступна: окно приёма будет закрыто при следующем запуске")
+        return
+    for job in job_queue.get_jobs_by_name(ORDER_WINDOW_JOB):
+        job.schedule_removal()
+    week_start = order_window.active_week(date.today())
+    if week_start is None:
+        return
+    delay = datetime.combine(week_start, datetime.min.time()) - datetime.now()
+    job_queue.run_once(close_order_window_job, when=max(delay.total_seconds(), 0), name=ORDER_WINDOW_JOB)
+
+
 def _build_order_actions_keyboard(order_id: str, allow_change: bool = True, allow_cancel: bool = True) -> InlineKeyboardMarkup | None:
     buttons: list[list[InlineKeyboardButton]] = []
     row: list[InlineKeyboardButton] = []
@@ -401,114 +583,109 @@ def make_order_id(user_id: int) -> str:
 
 
 def save_order(order_id: str, payload: dict) -> None:
-    data = _load_orders()
-    data[order_id] = payload
-    _save_orders(data)
+    storage.put_order(order_id, payload)
+    weekly_reports.apply(order_id, payload)
+    audience.record_order(order_user_id(payload), order_week(payload))
 
 
 # Update status of an existing order
 def set_order_status(order_id: str, new_status: str) -> bool:
     """Update status of an existing order. Returns True if changed."""
-    data = _load_orders()
-    if order_id not in data:
-        return False
-    data[order_id]["status"] = new_status
-    _save_orders(data)
-    return True
+    return update_order_fields(order_id, status=new_status)
+
+
+def update_order_fields(order_id: str, require_status: str | None = None, **fields) -> bool:
+    """Частичное обновление заказа (count, updated_at ...). Returns True if changed.
+
+    require_status — менять, только если статус заказа сейчас такой. Проверка и запись идут
+    без await между ними, поэтому параллельная отмена из другого чата (администратор)
+    не может проскочить между ними.
+    """
+    if require_status is not None:
+        current = storage.get_order(order_id)
+        if not current or str(current.get("status") or "").lower() != require_status:
+            return False
+    changed = storage.update_order(order_id, **fields)
+    if changed:
+        weekly_reports.apply(order_id, storage.get_order(order_id))
+    return changed
 
 
 def get_order(order_id: str) -> dict | None:
-    return _load_orders().get(order_id)
+    return storage.get_order(order_id)
 
 def find_user_order_same_day(uid: int, day_name: str, week_start: date | None = None) -> tuple[str, dict] | None:
     """Ищет активный (не отмененный) заказ пользователя на указанный день в текущую неделю.
     Возвращает пару (order_id, payload) с самым поздним созданием, либо None.
     """
-    orders = _load_orders()
-    now = datetime.now()
     if week_start is None:
-        week_start = _current_week_start(now)
-    start_dt = datetime.combine(week_start, datetime.min.time())
-    end_dt = start_dt + timedelta(days=7) - timedelta(seconds=1)
-    start_ts = int(start_dt.timestamp())
-    end_ts = int(end_dt.timestamp())
-    best: tuple[str, dict] | None = None
-    for oid, payload in orders.items():
-        try:
-            if int(payload.get("user_id") or 0) != int(uid):
-                continue
-        except Exception:
-            continue
-        dname = str(payload.get("day") or "")
-        if dname != day_name:
-            continue
-        status = str(payload.get("status") or "").lower()
-        if status.startswith("cancel"):
-            continue
-        ts = int(payload.get("created_at") or 0)
-        delivery_week = payload.get('delivery_week_start')
-        if delivery_week:
-            try:
-                delivery_week_date = date.fromisoformat(str(delivery_week))
-            except Exception:
-                delivery_week_date = None
-            if delivery_week_date and delivery_week_date != week_start:
-                continue
-        else:
-            if not (start_ts <= ts <= end_ts):
-                continue
-        if best is None or ts > int(best[1].get("created_at") or 0):
-            best = (oid, payload)
-    return best
+        week_start = _current_week_start()
+    return storage.find_active_order(uid, day_name, week_start)
 
 
 def get_user_profile(uid: int) -> dict:
-    data = _load_users()
-    return data.get(str(uid), {})
+    return storage.get_user(uid)
 
 
 def set_user_profile(uid: int, profile: dict) -> None:
-    data = _load_users()
-    data[str(uid)] = profile
-    _save_users(data)
+    storage.put_user(uid, profile)
 
 
 def ensure_user_registered(uid: int) -> None:
     """Гарантирует наличие записи пользователя в users.json."""
-    data = _load_users()
-    key = str(uid)
-    if key not in data:
-        data[key] = data.get(key, {})
-        _save_users(data)
+    storage.ensure_user(uid)
+    broadcasts.unsuppress(uid)
+    audience.add(uid)
 
 
-def get_broadcast_recipients() -> list[int]:
-    """Собирает список chat_id для рассылки: все, кто есть в users.json и в orders.json. Админа исключаем."""
-    uids: set[int] = set()
-    try:
-        for k in _load_users().keys():
-            try:
-                uids.add(int(k))
-            except Exception:
-                pass
-    except Exception:
-        pass
-    try:
-        for _, payload in _load_orders().items():
-            uid = payload.get("user_id")
-            if uid is not None:
-                try:
-                    uids.add(int(uid))
-                except Exception:
-                    pass
-    except Exception:
-        pass
+async def track_active_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Любое входящее обновление (сообщение, кнопка, разблокировка бота) возвращает
+    чат в рассылки, если раньше он ответил Forbidden. Без записи, если чат не исключён."""
+    if update.effective_user is not None:
+        broadcasts.unsuppress(update.effective_user.id)
+
+
+def get_broadcast_recipients(segment: str = "all", weeks: int = 0) -> list[int]:
+    """chat_id для рассылки из поддерживаемой на месте аудитории. Админа исключаем.
+
+    segment: "all" — все, кто писал боту или заказывал; "weeks" — заказывали за последние
+    ``weeks`` недель (включая текущую и будущие); "next_week" — есть активный заказ на
+    следующую неделю.
+    """
+    if segment == "weeks":
+        uids = audience.ordered_in_last_weeks(weeks, _current_week_start())
+    elif segment == "next_week":
+        uids = audience.with_active_orders(_next_week_start())
+    else:
+        uids = audience.all()
     try:
         uids.discard(int(ADMIN_ID))
     except Exception:
         pass
     return sorted(uids)
 
+
+def _parse_broadcast_args(args: list[str]) -> tuple[str, int, str] | None:
+    """Разбирает "/sms [--weeks=N | --next-week] текст" -> (сегмент, недели, текст)."""
+    segment, weeks = "all", 0
+    rest = list(args)
+    while rest and rest[0].startswith("--"):
+        option = rest.pop(0)
+        if option == "--next-week":
+            segment = "next_week"
+        elif option.startswith("--weeks="):
+            try:
+                weeks = int(option.split("=", 1)[1])
+            except ValueError:
+                return None
+            if weeks < 1:
+                return None
+            segment = "weeks"
+        else:
+            return None
+    return segment, weeks, " ".join(rest)
+
+
 def format_menu(menu_data: dict) -> str:
     lines = [f"Неделя: {menu_data['week']}"]
     for day, items in menu_data["menu"].items():
@@ -555,8 +732,7 @@ async def admin_manage_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.pop('admin_menu_day', None)
     context.user_data.pop('admin_menu_action', None)
 
-    menu_data = _get_current_menu()
-    overview = _format_admin_menu(menu_data)
+    overview = _format_admin_menu(get_menu_snapshot())
     text = (
         "<b>Управление меню</b>\n\n"
         "Отсюда можно обновить название недели, блюда по дням и фотографию меню.\n\n"
@@ -656,14 +832,9 @@ async def admin_open_next_week_orders(update: Update, context: ContextTypes.DEFA
         await update.message.reply_text("Недоступно.")
         return MENU
 
-    window = _load_order_window()
-    week_start_str = window.get('week_start')
-    if window.get('next_week_enabled') and week_start_str:
-        try:
-            ws = date.fromisoformat(week_start_str)
-            formatted = ws.strftime('%d.%m.%Y')
-        except Exception:
-            formatted = week_start_str
+    ws = order_window.active_week(date.today())
+    if ws is not None:
+        formatted = ws.strftime('%d.%m.%Y')
         await update.message.reply_text(
             f"Приём заказов уже открыт на неделю, начинающуюся {formatted}.",
         )
@@ -671,6 +842,7 @@ async def admin_open_next_week_orders(update: Update, context: ContextTypes.DEFA
 
     week_start = _next_week_start()
     _set_next_week_orders(True, week_start)
+    schedule_order_window_close(context.job_queue)
     formatted = week_start.strftime('%d.%m.%Y')
     await update.message.reply_text(
         (
@@ -872,8 +1044,9 @@ async def admin_menu_handle_photo(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text("Недоступно.")
         return MENU
     file_id = None
+    photo_file_id = None
     if update.message.photo:
-        file_id = update.message.photo[-1].file_id
+        file_id = photo_file_id = update.message.photo[-1].file_id
     elif update.message.document and str(update.message.document.mime_type or "").startswith("image/"):
         file_id = update.message.document.file_id
     if not file_id:
@@ -888,6 +1061,8 @@ async def admin_menu_handle_photo(update: Update, context: ContextTypes.DEFAULT_
         tmp_path = target_path + ".tmp"
         await file.download_to_drive(tmp_path)
         os.replace(tmp_path, target_path)
+        # Присланное фото уже лежит в Telegram: его file_id годится для show_menu
+        await media_cache.replace(target_path, "photo", photo_file_id)
     except Exception as e:
         logging.error(f"Не удалось обновить фото меню: {e}")
         await update.message.reply_text("Не вышло сохранить фото. Попробуйте еще раз.")
@@ -967,13 +1142,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "📣 <b>Рассылка</b>: <code>/sms текст</code>"
         )
         try:
-            with open("Admin.png", "rb") as logo:
-                await update.message.reply_photo(
-                    photo=logo,
-                    caption=admin_caption,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=get_admin_main_keyboard(),
-                )
+            await media_cache.send(
+                update.message.reply_photo, "photo", "Admin.png",
+                caption=admin_caption,
+                parse_mode=ParseMode.HTML,
+                reply_markup=get_admin_main_keyboard(),
+            )
         except FileNotFoundError:
             await update.message.reply_text(
                 admin_caption,
@@ -1028,12 +1202,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     try:
-        with open("Logo.png", "rb") as logo:
-            await update.message.reply_photo(
-                photo=logo,
-                caption=greeting_caption,
-                parse_mode=ParseMode.HTML,
-            )
+        await media_cache.send(
+            update.message.reply_photo, "photo", "Logo.png",
+            caption=greeting_caption,
+            parse_mode=ParseMode.HTML,
+        )
     except FileNotFoundError:
         await update.message.reply_text(
             greeting_caption,
@@ -1061,9 +1234,198 @@ async def admin_show_week_orders(update: Update, context: ContextTypes.DEFAULT_T
         parse_mode=ParseMode.HTML,
         reply_markup=get_admin_report_keyboard(),
     )
+    context.user_data.pop('report_week', None)
     return MENU
 
 
+REPORT_DAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+
+
+def _order_count_int(value) -> int:
+    try:
+        return int(str(value).split()[0])
+    except Exception:
+        return 1
+
+
+class WeeklyReports:
+    """Агрегаты отчёта админа по неделям доставки, обновляемые на месте.
+
+    Для каждой недели хранятся дни с активными и отменёнными заказами: число порций
+    и уже отрисованные строки отчёта. Неделя собирается один раз из шарда хранилища
+    (в render_pool, по копиям заказов), дальше её обновляют save_order/set_order_status/
+    update_order_fields. Отчёт за день — O(заказов дня). Держим несколько последних
+    недель; вытесненная неделя (в том числе архивная) пересобирается при следующем запросе.
+    """
+
+    MAX_WEEKS = 8
+
+    def __init__(self):
+        self._weeks: dict[date, dict[str, dict]] = {}
+        self._where: dict[str, tuple[date, str, bool]] = {}  # ID заказа -> (неделя, день, отменён)
+        # Недели, которые сейчас собираются в потоке: заказы, изменённые за это время, и
+        # future, которого ждут остальные запросы этой недели
+        self._building: dict[date, tuple[set[str], asyncio.Future]] = {}
+
+    async def week(self, week_start: date) -> dict[str, dict]:
+        while week_start not in self._weeks:
+            building = self._building.get(week_start)
+            if building is not None:
+                await asyncio.shield(building[1])
+                continue
+            changed: set[str] = set()
+            done = asyncio.get_running_loop().create_future()
+            self._building[week_start] = (changed, done)
+            try:
+                orders = storage.week_orders(week_start)
+                days, where = await render_pool.run("report-week", self._build, week_start, orders)
+                self._weeks[week_start] = days
+                self._where.update(where)
+                # Заказы, изменённые пока неделя собиралась, перечитываем из хранилища
+                for oid in changed:
+                    self.apply(oid, storage.get_order(oid))
+                while len(self._weeks) > self.MAX_WEEKS:
+                    self._evict(next(iter(self._weeks)))
+            finally:
+                del self._building[week_start]
+                done.set_result(None)
+        days = self._weeks.pop(week_start)
+        self._weeks[week_start] = days  # в конец: недавно использованная
+        return days
+
+    def apply(self, oid: str, payload: dict | None) -> None:
+        """Переносит заказ в актуальную корзину (или убирает, если payload=None)."""
+        self._discard(oid)
+        for building_week, (changed, _) in self._building.items():
+            if payload is None or order_week(payload) == building_week:
+                changed.add(oid)
+        if payload is None:
+            return
+        week_start = order_week(payload)
+        if week_start in self._weeks:
+            self._add(self._weeks[week_start], self._where, week_start, oid, payload)
+
+    @classmethod
+    def _build(cls, week_start: date, orders: list[tuple[str, dict]]):
+        days: dict[str, dict] = {}
+        where: dict[str, tuple[date, str, bool]] = {}
+        for oid, payload in orders:
+            cls._add(days, where, week_start, oid, payload)
+        return days, where
+
+    @staticmethod
+    def _add(days: dict[str, dict], where: dict, week_start: date, oid: str, payload: dict) -> None:
+        day = str(payload.get("day") or "-")
+        cancelled = is_cancelled(payload)
+        bucket = days.setdefault(day, {"count": 0, "active": {}, "cancelled": {}})
+        count = _order_count_int(payload.get("count", 1))
+        addr_txt = str(payload.get("address") or "-").strip()
+        uid = int(payload.get("user_id") or 0)
+        uname = payload.get("username") or ""
+        cust = f"<a href=\"tg://user?id={uid}\">{uid}</a>" if uid else "-"
+        username_part = f" {html.escape('@' + uname)}" if uname else ""
+        line = f"<code>/order {html.escape(oid)}</code> ×{count} - {html.escape(addr_txt)} - {cust}{username_part}"
+        if cancelled:
+            line = f"<s>{line}</s>"
+        else:
+            bucket["count"] += count
+        bucket["cancelled" if cancelled else "active"][oid] = (int(payload.get("created_at") or 0), count, f"• {line}")
+        where[oid] = (week_start, day, cancelled)
+
+    def _discard(self, oid: str) -> None:
+        where = self._where.pop(oid, None)
+        if where is None:
+            return
+        week_start, day, cancelled = where
+        bucket = self._weeks[week_start][day]
+        _, count, _ = bucket["cancelled" if cancelled else "active"].pop(oid)
+        if not cancelled:
+            bucket["count"] -= count
+        if not bucket["active"] and not bucket["cancelled"]:
+            del self._weeks[week_start][day]
+
+    def _evict(self, week_start: date) -> None:
+        for bucket in self._weeks.pop(week_start).values():
+            for oid in (*bucket["active"], *bucket["cancelled"]):
+                self._where.pop(oid, None)
+
+
+weekly_reports = WeeklyReports()
+
+
+async def _report_snapshot(week_start: date, day_filter: str | None) -> dict[str, tuple[int, list, list]]:
+    """Копия агрегатов для отрисовки в потоке: день -> (порций, активные, отменённые)."""
+    days = await weekly_reports.week(week_start)
+    days_iter = [day_filter] if day_filter else REPORT_DAYS
+    return {
+        d: (days[d]["count"], list(days[d]["active"].values()), list(days[d]["cancelled"].values()))
+        for d in days_iter if d in days
+    }
+
+
+def _format_admin_report(week_start: date, day_filter: str | None, days: dict[str, tuple[int, list, list]]) -> list[str]:
+    """Текст отчёта, разбитый на сообщения; выполняется в render_pool."""
+    week_label = f"{week_start:%d.%m}–{week_start + timedelta(days=6):%d.%m.%Y}"
+    if day_filter:
+        day_date = week_start + timedelta(days=DAY_TO_INDEX.get(day_filter, 0))
+        header = f"<b>📊 Заказы за день:</b> {html.escape(day_filter)} ({day_date:%d.%m.%Y})"
+    else:
+        header = f"<b>📊 Заказы за неделю:</b> {week_label}"
+
+    lines = [header]
+    if not days:
+        lines.append("Заказов пока нет.")
+        return split_message("\n".join(lines))
+    grand = 0
+    for d_name in ([day_filter] if day_filter else REPORT_DAYS):
+        if d_name not in days:
+            continue
+        count, active, cancelled = days[d_name]
+        grand += count
+        # Активные
+        if active:
+            lines.append(f"\n<b>{html.escape(d_name)}</b> - {count} шт. / {count * PRICE_LARI} лари")
+            lines.extend(entry[2] for entry in sorted(active))
+        # Отмененные (не входят в итоги)
+        if cancelled:
+            lines.append(f"<i>❌ Отмененные ({html.escape(d_name)})</i>")
+            lines.extend(entry[2] for entry in sorted(cancelled))
+    lines.append(f"\n<b>Итого (без отмененных):</b> {grand} шт. / {grand*PRICE_LARI} лари")
+    return split_message("\n".join(lines))
+
+
+async def _render_admin_report(week_start: date, day_filter: str | None) -> list[str]:
+    snapshot = await _report_snapshot(week_start, day_filter)
+    return await render_pool.run("report", _format_admin_report, week_start, day_filter, snapshot)
+
+
+def _report_week_keyboard(week_start: date, day_filter: str | None) -> InlineKeyboardMarkup:
+    day_code = str(DAY_TO_INDEX[day_filter]) if day_filter else "all"
+    prev_week = week_start - timedelta(days=7)
+    next_week = week_start + timedelta(days=7)
+    export_data = f"report_export:{week_start.isoformat()}:{day_code}"
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(f"◀ {prev_week:%d.%m}", callback_data=f"report_week:{prev_week.isoformat()}:{day_code}"),
+            InlineKeyboardButton(f"{next_week:%d.%m} ▶", callback_data=f"report_week:{next_week.isoformat()}:{day_code}"),
+        ],
+        [
+            InlineKeyboardButton("📄 CSV", callback_data=f"{export_data}:csv"),
+            InlineKeyboardButton("📊 Excel", callback_data=f"{export_data}:xlsx"),
+        ],
+    ])
+
+
+async def _send_report(message, chunks: list[str], reply_markup=None) -> None:
+    """Отчёт частями по лимиту Telegram; клавиатура — под последней частью."""
+    for i, chunk in enumerate(chunks):
+        await message.reply_text(
+            chunk,
+            parse_mode=ParseMode.HTML,
+            reply_markup=reply_markup if i == len(chunks) - 1 else None,
+        )
+
+
 async def admin_report_pick(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     if user.id != ADMIN_ID:
@@ -1076,114 +1438,91 @@ async def admin_report_pick(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return MENU
 
     day_filter = None if selection == "Неделя целиком" else selection
+    # Неделя доставки, выбранная стрелками под отчётом; по умолчанию — текущая
+    try:
+        week_start = date.fromisoformat(context.user_data.get('report_week') or "")
+    except ValueError:
+        week_start = _current_week_start()
 
-    now = datetime.now()
-    monday = now - timedelta(days=now.weekday())
-    start_dt = datetime(monday.year, monday.month, monday.day, 0, 0, 0)
-    end_dt = start_dt + timedelta(days=6, hours=23, minutes=59, seconds=59)
-    start_ts = int(start_dt.timestamp())
-    end_ts = int(end_dt.timestamp())
-
-    orders = _load_orders()
-    week_orders_active = []
-    week_orders_cancelled = []
-
-    for oid, payload in orders.items():
-        ts = int(payload.get("created_at") or 0)
-        dname = str(payload.get("day") or "")
-        if not (start_ts <= ts <= end_ts):
-            continue
-        if day_filter is not None and dname != day_filter:
-            continue
-        status = str(payload.get("status") or "").lower()
-        p = dict(payload)
-        p["__id"] = oid
-        p["__status"] = status
-        if status.startswith("cancel"):
-            week_orders_cancelled.append(p)
-        else:
-            week_orders_active.append(p)
-
-    day_order = {"Понедельник":0, "Вторник":1, "Среда":2, "Четверг":3, "Пятница":4, "Суббота":5, "Воскресенье":6}
-    sort_key = lambda x: (day_order.get(str(x.get("day")), 99), int(x.get("created_at") or 0))
-    week_orders_active.sort(key=sort_key)
-    week_orders_cancelled.sort(key=sort_key)
+    chunks = await _render_admin_report(week_start, day_filter)
+    await _send_report(update.message, chunks, _report_week_keyboard(week_start, day_filter))
+    return MENU
 
-    totals_by_day = {}
-    cancelled_by_day = {}
-    grand = 0
 
-    def _count_int(v):
-        try:
-            return int(str(v).split()[0])
-        except Exception:
-            return 1
+async def admin_report_week_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if update.effective_user.id != ADMIN_ID:
+        await query.answer("Недоступно.")
+        return
+    await query.answer()
+    try:
+        _, week_iso, day_code = (query.data or "").split(":", 2)
+        week_start = date.fromisoformat(week_iso)
+        day_filter = None if day_code == "all" else REPORT_DAYS[int(day_code)]
+    except (ValueError, IndexError):
+        return
+    context.user_data['report_week'] = week_start.isoformat()
+    keyboard = _report_week_keyboard(week_start, day_filter)
+    chunks = await _render_admin_report(week_start, day_filter)
+    try:
+        # Первая часть заменяет текущее сообщение, остальные приходят следом
+        await query.edit_message_text(
+            chunks[0],
+            parse_mode=ParseMode.HTML,
+            reply_markup=keyboard if len(chunks) == 1 else None,
+        )
+    except BadRequest as e:
+        logging.warning(f"Не удалось обновить отчёт: {e}")
+        return
+    if len(chunks) > 1:
+        await _send_report(query.message, chunks[1:], keyboard)
 
-    for o in week_orders_active:
-        cnt = _count_int(o.get("count", 1))
-        grand += cnt
-        d = str(o.get("day") or "-")
-        b = totals_by_day.setdefault(d, {"count": 0, "items": []})
-        b["count"] += cnt
-        b["items"].append(o)
 
-    for o in week_orders_cancelled:
-        d = str(o.get("day") or "-")
-        b = cancelled_by_day.setdefault(d, [])
-        b.append(o)
+def _build_export(orders: list[tuple[str, dict]], week_start: date, fmt: str):
+    """Пишет выгрузку в буфер (PTB всё равно читает документ в память); выполняется в render_pool."""
+    out = io.BytesIO()
+    rows = export_rows(orders, week_start, DAY_TO_INDEX, PRICE_LARI, _order_count_int)
+    EXPORT_WRITERS[fmt](out, EXPORT_HEADER, rows)
+    out.seek(0)
+    return out
 
-    menu_data = load_menu() or {}
-    week_label = menu_data.get("week") or "эта неделя"
 
+async def admin_report_export_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if update.effective_user.id != ADMIN_ID:
+        await query.answer("Недоступно.")
+        return
+    try:
+        _, week_iso, day_code, fmt = (query.data or "").split(":", 3)
+        week_start = date.fromisoformat(week_iso)
+        day_filter = None if day_code == "all" else REPORT_DAYS[int(day_code)]
+    except (ValueError, IndexError):
+        await query.answer()
+        return
+    if fmt not in EXPORT_WRITERS:
+        await query.answer()
+        return
+    await query.answer("Готовлю файл…")
+    # Копии заказов берём в цикле событий, а форматирование и запись файла — в пуле
+    orders = storage.week_orders(week_start, day_filter)
+    out = await render_pool.run(f"export-{fmt}", _build_export, orders, week_start, fmt)
     if day_filter:
-        header = f"<b>📊 Заказы за день:</b> {html.escape(day_filter)}"
+        day_date = week_start + timedelta(days=DAY_TO_INDEX[day_filter])
+        filename = f"orders_{day_date.isoformat()}.{fmt}"
+        caption = f"Заказы за {day_filter} ({day_date:%d.%m.%Y}): {len(orders)}"
     else:
-        header = f"<b>📊 Заказы за неделю:</b> {html.escape(str(week_label))}"
-
-    lines = [header]
-    if not week_orders_active and not week_orders_cancelled:
-        lines.append("Заказов пока нет.")
-    else:
-        days_iter = [day_filter] if day_filter else ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
-        for d_name in days_iter:
-            active_block = totals_by_day.get(d_name)
-            cancelled_block = cancelled_by_day.get(d_name, [])
-            if not active_block and not cancelled_block:
-                continue
-
-            # Активные
-            if active_block:
-                day_sum = active_block["count"] * PRICE_LARI
-                lines.append(f"\n<b>{html.escape(d_name)}</b> - {active_block['count']} шт. / {day_sum} лари")
-                for o in active_block["items"]:
-                    oid = o.get("__id")
-                    cnt = _count_int(o.get("count", 1))
-                    addr_txt = str(o.get("address") or "-").strip()
-                    uid = int(o.get("user_id") or 0)
-                    uname = o.get("username") or ""
-                    uname_tag = f"@{uname}" if uname else ""
-                    cust = f"<a href=\"tg://user?id={uid}\">{uid}</a>" if uid else "-"
-                    username_part = f" {html.escape(uname_tag)}" if uname_tag else ""
-                    lines.append(f"• <code>/order {html.escape(oid)}</code> ×{cnt} - {html.escape(addr_txt)} - {cust}{username_part}")
-
-            # Отмененные (не входят в итоги)
-            if cancelled_block:
-                lines.append(f"<i>❌ Отмененные ({html.escape(d_name)})</i>")
-                for o in cancelled_block:
-                    oid = o.get("__id")
-                    cnt = _count_int(o.get("count", 1))
-                    addr_txt = str(o.get("address") or "-").strip()
-                    uid = int(o.get("user_id") or 0)
-                    uname = o.get("username") or ""
-                    uname_tag = f"@{uname}" if uname else ""
-                    cust = f"<a href=\"tg://user?id={uid}\">{uid}</a>" if uid else "-"
-                    username_part = f" {html.escape(uname_tag)}" if uname_tag else ""
-                    lines.append(f"• <s><code>/order {html.escape(oid)}</code> ×{cnt} - {html.escape(addr_txt)} - {cust}{username_part}</s>")
-
-        lines.append(f"\n<b>Итого (без отмененных):</b> {grand} шт. / {grand*PRICE_LARI} лари")
-
-    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML, reply_markup=get_admin_report_keyboard())
-    return MENU
+        filename = f"orders_week_{week_start.isoformat()}.{fmt}"
+        caption = f"Заказы за неделю {week_start:%d.%m}–{week_start + timedelta(days=6):%d.%m.%Y}: {len(orders)}"
+    try:
+        await context.bot.send_document(
+            chat_id=query.message.chat_id,
+            document=out,
+            filename=filename,
+            caption=caption,
+        )
+    finally:
+        out.close()
+    log_user_action(update.effective_user, f"выгрузка заказов {filename}")
 
 # --- Переключение интерфейса админа ---
 async def switch_to_user_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1228,42 +1567,21 @@ def _ru_obed_plural(n: int) -> str:
         return "обеда"
     return "обедов"
 
-async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает заказы на текущую или следующую неделю в зависимости от статуса приёма."""
-    user = update.effective_user
-    uid = user.id
+def _format_my_orders(orders: list[tuple[str, dict]], now: datetime, target_week_start: date,
+                      show_next_week: bool, menu_week: str | None) -> str | None:
+    """Текст «Моих заказов» из копий заказов пользователя (None — показывать нечего).
 
-    now = datetime.now()
+    Выполняется в render_pool.
+    """
     today_idx = now.weekday()  # 0..6
 
-    window = _load_order_window()
-    show_next_week = False
-    target_week_start = _current_week_start(now)
-    week_start_str = window.get('week_start')
-    if window.get('next_week_enabled') and week_start_str:
-        try:
-            ws = date.fromisoformat(week_start_str)
-            if now.date() < ws:
-                show_next_week = True
-                target_week_start = ws
-            else:
-                _set_next_week_orders(False, None)
-        except Exception:
-            _set_next_week_orders(False, None)
-
     start_dt = datetime.combine(target_week_start, datetime.min.time())
     end_dt = start_dt + timedelta(days=7) - timedelta(seconds=1)
     start_ts = int(start_dt.timestamp())
     end_ts = int(end_dt.timestamp())
 
-    orders = _load_orders()
     mine: list[dict] = []
-    for oid, payload in orders.items():
-        try:
-            if int(payload.get("user_id") or 0) != uid:
-                continue
-        except Exception:
-            continue
+    for oid, payload in orders:
         status = str(payload.get("status") or "").lower()
         if status.startswith("cancel"):
             continue
@@ -1299,9 +1617,7 @@ async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
         mine.append(item)
 
     if not mine:
-        msg = "У вас нет заказов на следующую неделю." if show_next_week else "У вас нет актуальных заказов на эту неделю."
-        await update.message.reply_text(msg)
-        return MENU
+        return None
 
     mine.sort(key=lambda x: (x.get("__didx", 99), x.get("__ts", 0)))
 
@@ -1309,12 +1625,8 @@ async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
         header_parts = ["🧾 <b>Заказы на следующую неделю</b>", f"<i>Неделя начинается {target_week_start.strftime('%d.%m.%Y')}</i>"]
     else:
         header_parts = ["🧾 <b>Ваши текущие заказы</b>"]
-        try:
-            md = load_menu() or {}
-            if md.get("week"):
-                header_parts.append(f"<i>Неделя:</i> {html.escape(str(md.get('week')))}")
-        except Exception:
-            pass
+        if menu_week:
+            header_parts.append(f"<i>Неделя:</i> {html.escape(menu_week)}")
 
     lines = ["\n".join(header_parts)]
 
@@ -1347,7 +1659,31 @@ async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
         lines.append(f"<code>/order {html.escape(order_id)}</code>")
         lines.append("")
 
-    await update.message.reply_text("\n".join(lines).rstrip(), parse_mode=ParseMode.HTML)
+    return "\n".join(lines).rstrip()
+
+
+async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает заказы на текущую или следующую неделю в зависимости от статуса приёма."""
+    user = update.effective_user
+    uid = user.id
+
+    now = datetime.now()
+    next_week_start = order_window.active_week(now.date())
+    show_next_week = next_week_start is not None
+    target_week_start = next_week_start or _current_week_start(now)
+    snapshot = None if show_next_week else get_menu_snapshot()
+
+    text = await render_pool.run(
+        "my_orders", _format_my_orders,
+        storage.user_orders(uid, target_week_start), now, target_week_start, show_next_week,
+        snapshot.week if snapshot else None,
+    )
+    if text is None:
+        msg = "У вас нет заказов на следующую неделю." if show_next_week else "У вас нет актуальных заказов на эту неделю."
+        await update.message.reply_text(msg)
+        return MENU
+
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     return MENU
 
 async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1357,30 +1693,32 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Недоступно.")
         return
 
-    # Текст берем из аргументов команды
-    text = " ".join(context.args) if getattr(context, "args", None) else ""
-    if not text:
-        await update.message.reply_text("Использование: /sms <текст>\nМожно использовать HTML-разметку.")
+    # Сегмент и текст берем из аргументов команды
+    parsed = _parse_broadcast_args(getattr(context, "args", None) or [])
+    if not parsed or not parsed[2]:
+        await update.message.reply_text(
+            "Использование: /sms [--weeks=N | --next-week] <текст>\n"
+            "--weeks=N — только заказывавшим за последние N недель, "
+            "--next-week — только тем, у кого есть заказ на следующую неделю.\n"
+            "Можно использовать HTML-разметку."
+        )
+        return
+    segment, weeks, text = parsed
+
+    if broadcasts.running:
+        await update.message.reply_text("Предыдущая рассылка ещё идёт. Дождитесь её завершения.")
         return
 
-    recipients = get_broadcast_recipients()
+    recipients = get_broadcast_recipients(segment, weeks)
     if not recipients:
         await update.message.reply_text("Нет получателей для рассылки.")
         return
 
-    sent = 0
-    failed = 0
-    for uid in recipients:
-        try:
-            await context.bot.send_message(chat_id=uid, text=text, parse_mode=ParseMode.HTML)
-            sent += 1
-        except Exception as e:
-            logging.warning(f"Broadcast failed for {uid}: {e}")
-            failed += 1
-        await asyncio.sleep(0.05)  # анти-спам лимиты Telegram
-
-    await update.message.reply_text(
-        f"Рассылка завершена: отправлено {sent}, ошибок {failed}. Получателей: {len(recipients)}.")
+    # Отправка идёт в фоне; прогресс приходит отдельным сообщением, которое обновляется
+    total = broadcasts.start(context.bot, text, recipients, admin_chat=update.effective_chat.id)
+    skipped = len(recipients) - total
+    note = f" Пропущено заблокировавших бота: {skipped}." if skipped else ""
+    await update.message.reply_text(f"Рассылка запущена: получателей {total}.{note}")
 
 
 async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1392,17 +1730,13 @@ async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return MENU
     log_user_action(update.message.from_user, "show_menu")
-    menu_data = load_menu()
-    if not menu_data:
+    snapshot = get_menu_snapshot()
+    if not snapshot:
         await update.message.reply_text("Техническая ошибка: меню недоступно. Попробуйте позже.", reply_markup=add_start_button())
         return MENU
-    text_html = format_menu_html(menu_data)
+    text_html = snapshot.user_html
     try:
-        with open("Menu.jpeg", "rb") as photo:
-            await update.message.reply_photo(
-                photo=photo,
-                reply_markup=add_start_button()
-            )
+        await media_cache.send(update.message.reply_photo, "photo", "Menu.jpeg", reply_markup=add_start_button())
     except FileNotFoundError:
         pass
     await update.message.reply_text(text_html, parse_mode=ParseMode.HTML, reply_markup=add_start_button())
@@ -1429,8 +1763,8 @@ async def order_lunch(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def select_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log_user_action(update.message.from_user, f"select_day: {update.message.text}")
     day = update.message.text
-    menu_data = load_menu()
-    if not menu_data or day not in menu_data['menu']:
+    snapshot = get_menu_snapshot()
+    if not snapshot or day not in snapshot.day_items:
         await update.message.reply_text("<b>Ошибка:</b> выберите день недели из списка.", parse_mode=ParseMode.HTML, reply_markup=get_day_keyboard())
         return ORDER_DAY
     day_allowed, day_warning, is_next_week, week_start_date = _is_day_available_for_order(day)
@@ -1445,13 +1779,8 @@ async def select_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         context.user_data['order_week_start'] = _current_week_start().isoformat()
 
-    menu_for_day = menu_data['menu'][day]
-    if isinstance(menu_for_day, list):
-        menu_for_day_text = ", ".join(str(it).strip() for it in menu_for_day)
-        menu_lines_html = "\n".join(f" - {html.escape(str(it).strip())}" for it in menu_for_day if str(it).strip())
-    else:
-        menu_for_day_text = str(menu_for_day).strip()
-        menu_lines_html = f" - {html.escape(menu_for_day_text)}"
+    menu_for_day_text = snapshot.day_text[day]
+    menu_lines_html = snapshot.day_html[day]
 
     # Сохраним текст меню в user_data, пригодится на подтверждении
     context.user_data['menu_for_day'] = menu_for_day_text
@@ -1465,13 +1794,12 @@ async def select_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
     photo_path = DAY_PHOTO_MAP.get(day)
     if photo_path:
         try:
-            with open(photo_path, "rb") as photo:
-                await update.message.reply_photo(
-                    photo=photo,
-                    caption=message_text,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=get_count_keyboard(),
-                )
+            await media_cache.send(
+                update.message.reply_photo, "photo", photo_path,
+                caption=message_text,
+                parse_mode=ParseMode.HTML,
+                reply_markup=get_count_keyboard(),
+            )
             return ORDER_COUNT
         except FileNotFoundError:
             logging.warning(f"Фото для {day} не найдено по пути {photo_path}")
@@ -1529,12 +1857,8 @@ async def select_count(update: Update, context: ContextTypes.DEFAULT_TYPE):
             week_start_date = date.fromisoformat(str(week_start_iso))
         except Exception:
             week_start_date = None
-    menu_data = load_menu()
-    menu_for_day = menu_data['menu'].get(day, '') if menu_data else ''
-    if isinstance(menu_for_day, list):
-        menu_for_day_text = ", ".join(menu_for_day)
-    else:
-        menu_for_day_text = str(menu_for_day)
+    snapshot = get_menu_snapshot()
+    menu_for_day_text = snapshot.day_text.get(day, '') if snapshot else ''
 
     context.user_data['selected_count'] = count
     context.user_data['menu_for_day'] = menu_for_day_text
@@ -1628,16 +1952,20 @@ async def select_count(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 #
-# Отправка гифки-"стикера" успеха
-async def send_success_gif(update: Update):
-    try:
-        with open("cat-driving.mp4", "rb") as anim:
-            # Используем анимацию (mp4 поддерживается как анимация в Telegram)
-            await update.message.reply_animation(animation=anim)
-    except FileNotFoundError:
-        logging.warning("Файл cat-driving.mp4 не найден. Пропускаем анимацию.")
-    except Exception as e:
-        logging.error(f"Не удалось отправить анимацию: {e}")
+# Гифка-"стикер" успеха: через outbox, после подтверждения заказа
+SUCCESS_ANIMATION = "cat-driving.mp4"
+
+
+def queue_success_gif(chat_id: int) -> None:
+    if not os.path.exists(SUCCESS_ANIMATION):
+        logging.warning(f"Файл {SUCCESS_ANIMATION} не найден. Пропускаем анимацию.")
+        return
+    outbox.enqueue(f"chat:{chat_id}", chat_id, animation=SUCCESS_ANIMATION)
+
+
+def notify_admin(order_id: str, text: str) -> None:
+    """Уведомление администратору о заказе; по одному заказу — строго в порядке событий."""
+    outbox.enqueue(f"order:{order_id}", ADMIN_ID, text)
 
 # Выбор предлога перед днем недели
 def _prep_for_day(day: str) -> str:
@@ -1719,18 +2047,12 @@ async def confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     admin_id = ADMIN_ID
     admin_handle = OPERATOR_HANDLE if 'OPERATOR_HANDLE' in globals() and OPERATOR_HANDLE else ""
-    log_console(f"Заказ от пользователя {user.id}. Готовлю отправку админу {admin_id} {admin_handle}")
-    try:
-        await context.bot.send_message(chat_id=admin_id, text=admin_text, parse_mode=ParseMode.HTML)
-        logging.info(
-            f"ORDER_SENT_TO_ADMIN order_id={order_id} admin_id={admin_id} admin_handle={admin_handle or '-'} user_id={user.id}"
-        )
-        log_console(f"Заказ {order_id} отправлен администратору {admin_id} {admin_handle}")
-    except Exception as e:
-        logging.error(f"Ошибка отправки админу {admin_id} {admin_handle}: {e}")
-
-    # Гифка об успешном оформлении
-    await send_success_gif(update)
+    # Между save_order и постановкой в очередь нет await: заказ не останется без уведомления
+    notify_admin(order_id, admin_text)
+    logging.info(
+        f"ORDER_QUEUED_FOR_ADMIN order_id={order_id} admin_id={admin_id} admin_handle={admin_handle or '-'} user_id={user.id}"
+    )
+    log_console(f"Заказ {order_id} поставлен в очередь для администратора {admin_id} {admin_handle}")
 
     context.user_data['last_order_ts'] = time.time()
     is_next_week_delivery = bool(context.user_data.get('order_for_next_week'))
@@ -1769,6 +2091,8 @@ async def confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Что дальше?",
         reply_markup=get_after_confirm_keyboard(),
     )
+    # Гифка об успешном оформлении — после подтверждения, через очередь
+    queue_success_gif(user.id)
     return MENU
 
 
@@ -1862,18 +2186,12 @@ async def resolve_duplicate_order(update: Update, context: ContextTypes.DEFAULT_
     if choice == "Удалить предыдущий заказ" and oid:
         # Отменяем предыдущий заказ
         if set_order_status(oid, "cancelled_by_user"):
-            try:
-                who = admin_link_html(update.effective_user)
-                await context.bot.send_message(
-                    chat_id=ADMIN_ID,
-                    text=(
-                        f"<b>🚫 Отмена заказа</b> <code>{html.escape(oid)}</code>\n"
-                        f"Кем: {who} (user_id={update.effective_user.id})"
-                    ),
-                    parse_mode=ParseMode.HTML,
-                )
-            except Exception:
-                pass
+            who = admin_link_html(update.effective_user)
+            notify_admin(
+                oid,
+                f"<b>🚫 Отмена заказа</b> <code>{html.escape(oid)}</code>\n"
+                f"Кем: {who} (user_id={update.effective_user.id})"
+            )
         # Продолжаем оформление нового заказа с ранее выбранным количеством
         try:
             count_int = int(str(count))
@@ -1936,26 +2254,25 @@ async def resolve_duplicate_order(update: Update, context: ContextTypes.DEFAULT_
             add_cnt = int(str(count))
         except Exception:
             add_cnt = 1
-        prev_cnt = dup.get('prev_count') or 0
-        new_total = max(1, int(prev_cnt) + add_cnt)
-        orders = _load_orders()
-        if oid in orders:
-            orders[oid]['count'] = str(new_total)
-            _save_orders(orders)
-        # Уведомим админа об изменении
-        try:
-            who = admin_link_html(update.effective_user)
-            await context.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=(
-                    f"<b>✏️ Обновление заказа</b> <code>{html.escape(oid)}</code>\n"
-                    f"Кем: {who} (user_id={update.effective_user.id})\n"
-                    f"Количество: было {prev_cnt}, стало {new_total}"
-                ),
-                parse_mode=ParseMode.HTML,
+        # Берём текущее количество из хранилища: с момента вопроса заказ могли изменить
+        current = get_order(oid) or {}
+        prev_cnt = _order_count_int(current.get('count', dup.get('prev_count') or 0))
+        new_total = max(1, prev_cnt + add_cnt)
+        if not update_order_fields(oid, require_status="new", count=str(new_total)):
+            context.user_data.pop('duplicate_target', None)
+            await update.message.reply_text(
+                "Не удалось обновить заказ: он уже отменен или в обработке.",
+                reply_markup=get_after_confirm_keyboard(),
             )
-        except Exception:
-            pass
+            return MENU
+        # Уведомим админа об изменении
+        who = admin_link_html(update.effective_user)
+        notify_admin(
+            oid,
+            f"<b>✏️ Обновление заказа</b> <code>{html.escape(oid)}</code>\n"
+            f"Кем: {who} (user_id={update.effective_user.id})\n"
+            f"Количество: было {prev_cnt}, стало {new_total}"
+        )
         # Сообщение пользователю
         await update.message.reply_text(
             (
@@ -2164,18 +2481,12 @@ async def cancel_order_command(update: Update, context: ContextTypes.DEFAULT_TYP
 
     if set_order_status(order_id, "cancelled_by_user" if is_owner and not is_admin else "cancelled"):
         # Уведомим админа
-        try:
-            who = admin_link_html(user)
-            await context.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=(
-                    f"<b>🚫 Отмена заказа</b> <code>{html.escape(order_id)}</code>\n"
-                    f"Кем: {who} (user_id={user.id})"
-                ),
-                parse_mode=ParseMode.HTML,
-            )
-        except Exception:
-            pass
+        who = admin_link_html(user)
+        notify_admin(
+            order_id,
+            f"<b>🚫 Отмена заказа</b> <code>{html.escape(order_id)}</code>\n"
+            f"Кем: {who} (user_id={user.id})"
+        )
         await update.message.reply_text(
             f"Заказ <code>{html.escape(order_id)}</code> отменен.",
             parse_mode=ParseMode.HTML,
@@ -2209,18 +2520,12 @@ async def cancel_order_callback(update: Update, context: ContextTypes.DEFAULT_TY
         await query.edit_message_text("Отмена недоступна. Заказ уже в обработке или завершен.")
         return
     if set_order_status(order_id, "cancelled_by_user" if is_owner and not is_admin else "cancelled"):
-        try:
-            who = admin_link_html(query.from_user)
-            await context.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=(
-                    f"<b>🚫 Отмена заказа</b> <code>{html.escape(order_id)}</code>\n"
-                    f"Кем: {who} (user_id={query.from_user.id})"
-                ),
-                parse_mode=ParseMode.HTML,
-            )
-        except Exception:
-            pass
+        who = admin_link_html(query.from_user)
+        notify_admin(
+            order_id,
+            f"<b>🚫 Отмена заказа</b> <code>{html.escape(order_id)}</code>\n"
+            f"Кем: {who} (user_id={query.from_user.id})"
+        )
         await query.edit_message_text(
             f"Заказ <code>{html.escape(order_id)}</code> отменен.",
             parse_mode=ParseMode.HTML,
@@ -2310,29 +2615,18 @@ async def update_order_count_choice(update: Update, context: ContextTypes.DEFAUL
 
     new_count = int(selected)
     order_id = update_ctx['id']
-    orders = _load_orders()
-    if order_id not in orders:
+    if not update_order_fields(order_id, require_status="new", count=str(new_count), updated_at=int(time.time())):
         await update.message.reply_text("Не удалось найти заказ. Возможно, он уже был изменен или отменен.")
         context.user_data.pop('update_order', None)
         return MENU
 
-    orders[order_id]['count'] = str(new_count)
-    orders[order_id]['updated_at'] = int(time.time())
-    _save_orders(orders)
-
     # Уведомим администратора
-    try:
-        await context.bot.send_message(
-            chat_id=ADMIN_ID,
-            text=(
-                f"<b>✏️ Изменение заказа</b> <code>{html.escape(order_id)}</code>\n"
-                f"Клиент: {admin_link_html(update.effective_user)}\n"
-                f"Новый объем: {new_count} {_ru_obed_plural(new_count)}"
-            ),
-            parse_mode=ParseMode.HTML,
-        )
-    except Exception:
-        pass
+    notify_admin(
+        order_id,
+        f"<b>✏️ Изменение заказа</b> <code>{html.escape(order_id)}</code>\n"
+        f"Клиент: {admin_link_html(update.effective_user)}\n"
+        f"Новый объем: {new_count} {_ru_obed_plural(new_count)}"
+    )
 
     context.user_data.pop('update_order', None)
     context.user_data.pop('menu_for_day', None)
@@ -2534,11 +2828,22 @@ BUTTON_TEXTS = [
     "Связаться с человеком",
 ]
 
-BUTTONS_REGEX = r"^(" + "|".join(re.escape(s) for s in BUTTON_TEXTS) + r")$"
+# Проверка принадлежности — поиск в множестве, а не прогон общей регулярки по каждому сообщению
+BUTTON_TEXT_SET = frozenset(BUTTON_TEXTS)
+
+WORKDAYS = ("Понедельник", "Вторник", "Среда", "Четверг", "Пятница")
+COUNT_BUTTONS = ("1 обед", "2 обеда", "3 обеда", "4 обеда", "1", "2", "3", "4")
+# Кнопки, доступные в любом состоянии диалога
+COMMON_BUTTONS = {
+    "🔄 В начало": start,
+    "В начало": start,
+    "❗ Связаться с человеком": contact_human,
+    "Связаться с человеком": contact_human,
+}
 
 async def log_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message and update.message.text:
-        log_user_action(update.message.from_user, f"button_click: {update.message.text}")
+        log_user_action(update.message.from_user, f"button_click: {update.message.text}", button_log)
 
 #
 # Глобальный обработчик ошибок
@@ -2576,174 +2881,199 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     except Exception:
         pass
 
+ARCHIVE_JOB = "orders_archive"
+ARCHIVE_HOUR = 4  # час ежедневной архивации прошедших недель (часовой пояс JobQueue)
+
+
+async def archive_orders_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # gzip и перезапись индекса — в пуле потоков; хранилище само сериализует доступ
+    before = _current_week_start()
+    archived = await asyncio.get_running_loop().run_in_executor(None, storage.archive_weeks, before)
+    if archived:
+        logging.info(f"В архив перенесено недель: {archived}")
+
+
+async def on_startup(application: Application) -> None:
+    # Открытие и первичное чтение файлов хранилища — в пуле потоков, а не в цикле событий
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, open_bot_storage)
+    await loop.run_in_executor(None, storage.preload)
+    if application.job_queue is not None:
+        application.job_queue.run_daily(
+            archive_orders_job,
+            time=datetime.min.time().replace(hour=ARCHIVE_HOUR),
+            name=ARCHIVE_JOB,
+        )
+        application.job_queue.run_once(archive_orders_job, when=0, name=ARCHIVE_JOB)
+    # Рассылка, прерванная перезапуском, продолжается с сохранённого курсора
+    broadcasts.resume(application.bot)
+    # Уведомления администратору и анимации, не отправленные до перезапуска
+    outbox.start(application.bot)
+    # Окно, истёкшее пока бот был выключен, закрываем сразу; иначе — задачей в week_start
+    order_window.expire_if_due(date.today())
+    schedule_order_window_close(application.job_queue)
+
+
+async def on_shutdown(application: Application) -> None:
+    await broadcasts.stop()
+    await outbox.stop()
+    render_pool.shutdown()
+    # Дожидаемся фоновой записи и сворачиваем журнал
+    storage.close()
+
 # Основная функция запуска
 
 if __name__ == "__main__":
-    persistence = PicklePersistence(filepath="bot_state.pickle")
-    # Настройка таймаутов HTTPX для стабильного long polling
+    # Состояние диалогов и user_data — построчно в SQLite; bot_state.pickle прежних версий импортируется
+    persistence = SqlitePersistence(filepath="bot_state.sqlite3", legacy_pickle="bot_state.pickle")
+    webhook_mode = str(BOT_MODE).lower() == "webhook"
+    # Настройка таймаутов HTTPX: для long polling read_timeout больше таймаута getUpdates
     request = HTTPXRequest(
         connect_timeout=10,
-        read_timeout=80,
+        read_timeout=10 if webhook_mode else 80,
         write_timeout=10,
         pool_timeout=5,
     )
-    application = (
+    # Медленный обработчик одного клиента не задерживает остальных; обновления одного
+    # чата по-прежнему идут по одному, так что диалоги и user_data не перемешиваются
+    update_processor = PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES, UPDATE_QUEUE_SIZE, MAX_CHAT_PENDING_UPDATES)
+    builder = (
         Application
         .builder()
         .token(BOT_TOKEN)
         .persistence(persistence)
         .request(request)
-        .build()
+        .update_queue(UpdateQueue(UPDATE_QUEUE_SIZE, update_processor))
+        .concurrent_updates(update_processor)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
     )
+    if BOT_API_BASE_URL:
+        base_url = BOT_API_BASE_URL.rstrip("/")
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    application = builder.build()
 
     application.add_error_handler(error_handler)
 
+    # Раньше всех остальных обработчиков и не мешая им: пользователь снова пишет боту
+    application.add_handler(TypeHandler(Update, track_active_user), group=-1)
+
     application.add_handler(CommandHandler("my_profile", my_profile))
     application.add_handler(CommandHandler("order", order_info))
     application.add_handler(CommandHandler("sms", broadcast))
     application.add_handler(CallbackQueryHandler(copy_order_callback, pattern=r"^copy_order:"))
+    application.add_handler(CallbackQueryHandler(admin_report_week_callback, pattern=r"^report_week:"))
+    application.add_handler(CallbackQueryHandler(admin_report_export_callback, pattern=r"^report_export:"))
     application.add_handler(CommandHandler("cancel", cancel_order_command))
     application.add_handler(CallbackQueryHandler(cancel_order_callback, pattern=r"^cancel_order:"))
 
     # Логирование нажатий любых кнопок (универсальный handler, не блокирует дальнейшую обработку)
-    application.add_handler(MessageHandler(filters.Regex(BUTTONS_REGEX), log_button), group=1)
+    application.add_handler(MessageHandler(filters.Text(BUTTON_TEXT_SET), log_button), group=1)
 
     conv_handler = ConversationHandler(
         name="lunch_conv",
         persistent=True,
         entry_points=[
             CommandHandler("start", start),
-            MessageHandler(filters.Regex("^🔄 В начало$"), start)
+            ButtonRouter({"🔄 В начало": start}),
         ],
+        # В каждом состоянии кнопки разбираются одним ButtonRouter (поиск по точному тексту);
+        # обработчики после него получают только то, что не совпало ни с одной кнопкой
         states={
             MENU: [
                 CallbackQueryHandler(change_order_callback, pattern=r"^change_order:"),
-                MessageHandler(filters.Regex("^Показать меню на неделю$"), show_menu),
-                MessageHandler(filters.Regex("^Показать заказы на эту неделю$"), admin_show_week_orders),
-                MessageHandler(filters.Regex("^Мои заказы$"), my_orders),
-                MessageHandler(filters.Regex("^Перейти в режим пользователя$"), switch_to_user_mode),
-                MessageHandler(filters.Regex("^Перейти в режим администратора$"), switch_to_admin_mode),
-                MessageHandler(filters.Regex("^Управление меню$"), admin_manage_menu),
-                MessageHandler(filters.Regex("^(Неделя целиком|Понедельник|Вторник|Среда|Четверг|Пятница)$"), admin_report_pick),
-                MessageHandler(filters.Regex("^Заказать обед$"), order_lunch),
-                MessageHandler(filters.Regex("^Посмотреть меню$"), show_menu),
-                MessageHandler(filters.Regex("^Выбрать еще один день$"), order_lunch),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({
+                    "Показать меню на неделю": show_menu,
+                    "Показать заказы на эту неделю": admin_show_week_orders,
+                    "Мои заказы": my_orders,
+                    "Перейти в режим пользователя": switch_to_user_mode,
+                    "Перейти в режим администратора": switch_to_admin_mode,
+                    "Управление меню": admin_manage_menu,
+                    **dict.fromkeys(("Неделя целиком", *WORKDAYS), admin_report_pick),
+                    "Заказать обед": order_lunch,
+                    "Посмотреть меню": show_menu,
+                    "Выбрать еще один день": order_lunch,
+                    **COMMON_BUTTONS,
+                }),
             ],
             ORDER_DAY: [
-                MessageHandler(filters.Regex("^(Понедельник|Вторник|Среда|Четверг|Пятница)$"), select_day),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({**dict.fromkeys(WORKDAYS, select_day), **COMMON_BUTTONS}),
             ],
             ORDER_COUNT: [
                 CallbackQueryHandler(change_order_callback, pattern=r"^change_order:"),
-                MessageHandler(filters.Regex("^Назад$"), back_to_day),
-                MessageHandler(filters.Regex("^Выбрать день заново$"), order_lunch),
-                MessageHandler(filters.Regex("^(1 обед|2 обеда|3 обеда|4 обеда|[1-4])$"), select_count),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({
+                    "Назад": back_to_day,
+                    "Выбрать день заново": order_lunch,
+                    **dict.fromkeys(COUNT_BUTTONS, select_count),
+                    **COMMON_BUTTONS,
+                }),
             ],
             UPDATE_ORDER_COUNT: [
-                MessageHandler(filters.Regex("^Назад$"), cancel_update_order),
-                MessageHandler(filters.Regex("^(1 обед|2 обеда|3 обеда|4 обеда|[1-4])$"), update_order_count_choice),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({
+                    "Назад": cancel_update_order,
+                    **dict.fromkeys(COUNT_BUTTONS, update_order_count_choice),
+                    **COMMON_BUTTONS,
+                }),
             ],
             ADDRESS: [
-                MessageHandler(filters.Regex("^Назад$"), back_to_count),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({"Назад": back_to_count, **COMMON_BUTTONS}),
                 MessageHandler((filters.TEXT | filters.CONTACT) & ~filters.COMMAND, address_phone),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
             ],
             CONFIRM: [
-                MessageHandler(filters.Regex("^Назад$"), back_to_count),
+                ButtonRouter({
+                    "Назад": back_to_count,
+                    "Подтверждаю": confirm_order,
+                    "Изменить адрес": confirm_order,
+                    **COMMON_BUTTONS,
+                }),
                 MessageHandler(filters.CONTACT, confirm_save_phone),
-                MessageHandler(filters.Regex("^(Подтверждаю|Изменить адрес)$"), confirm_order),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, confirm_order),
             ],
             DUPLICATE: [
-                MessageHandler(filters.Regex("^Удалить предыдущий заказ$"), resolve_duplicate_order),
-                MessageHandler(filters.Regex("^Добавить к существующему$"), resolve_duplicate_order),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({
+                    "Удалить предыдущий заказ": resolve_duplicate_order,
+                    "Добавить к существующему": resolve_duplicate_order,
+                    **COMMON_BUTTONS,
+                }),
             ],
             ADMIN_MENU: [
-                MessageHandler(filters.Regex("^Изменить название недели$"), admin_menu_request_week),
-                MessageHandler(filters.Regex("^Редактировать блюда дня$"), admin_menu_show_day_prompt),
-                MessageHandler(filters.Regex("^Обновить фото меню$"), admin_menu_request_photo),
-                MessageHandler(filters.Regex("^Открыть заказы на следующую неделю$"), admin_open_next_week_orders),
-                MessageHandler(filters.Regex("^Назад$"), admin_menu_exit),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({
+                    "Изменить название недели": admin_menu_request_week,
+                    "Редактировать блюда дня": admin_menu_show_day_prompt,
+                    "Обновить фото меню": admin_menu_request_photo,
+                    "Открыть заказы на следующую неделю": admin_open_next_week_orders,
+                    "Назад": admin_menu_exit,
+                    **COMMON_BUTTONS,
+                }),
             ],
             ADMIN_MENU_DAY_SELECT: [
-                MessageHandler(filters.Regex("^Назад$"), admin_menu_back_to_main),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({"Назад": admin_menu_back_to_main, **COMMON_BUTTONS}),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, admin_menu_day_chosen),
             ],
             ADMIN_MENU_ACTION: [
-                MessageHandler(filters.Regex("^Добавить блюдо$"), admin_menu_day_action_add),
-                MessageHandler(filters.Regex("^Изменить блюдо$"), admin_menu_day_action_edit),
-                MessageHandler(filters.Regex("^Удалить блюдо$"), admin_menu_day_action_delete),
-                MessageHandler(filters.Regex("^Заменить список блюд$"), admin_menu_day_action_replace),
-                MessageHandler(filters.Regex("^Назад$"), admin_menu_back_to_day_select),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({
+                    "Добавить блюдо": admin_menu_day_action_add,
+                    "Изменить блюдо": admin_menu_day_action_edit,
+                    "Удалить блюдо": admin_menu_day_action_delete,
+                    "Заменить список блюд": admin_menu_day_action_replace,
+                    "Назад": admin_menu_back_to_day_select,
+                    **COMMON_BUTTONS,
+                }),
             ],
             ADMIN_MENU_ITEM_SELECT: [
-                MessageHandler(filters.Regex("^Назад$"), admin_menu_back_to_day_actions),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({"Назад": admin_menu_back_to_day_actions, **COMMON_BUTTONS}),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, admin_menu_handle_item_index),
             ],
             ADMIN_MENU_ITEM_TEXT: [
-                MessageHandler(filters.Regex("^Назад$"), admin_menu_back_to_day_actions),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({"Назад": admin_menu_back_to_day_actions, **COMMON_BUTTONS}),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, admin_menu_handle_text_input),
             ],
             ADMIN_MENU_WEEK: [
-                MessageHandler(filters.Regex("^Назад$"), admin_manage_menu),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({"Назад": admin_manage_menu, **COMMON_BUTTONS}),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, admin_menu_save_week),
             ],
             ADMIN_MENU_PHOTO: [
-                MessageHandler(filters.Regex("^Назад$"), admin_manage_menu),
-                MessageHandler(filters.Regex("^🔄 В начало$"), start),
-                MessageHandler(filters.Regex("^В начало$"), start),
-                MessageHandler(filters.Regex("^❗ Связаться с человеком$"), contact_human),
-                MessageHandler(filters.Regex("^Связаться с человеком$"), contact_human),
+                ButtonRouter({"Назад": admin_manage_menu, **COMMON_BUTTONS}),
                 MessageHandler((filters.PHOTO | filters.Document.IMAGE), admin_menu_handle_photo),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, admin_menu_handle_photo),
             ],
@@ -2751,5 +3081,20 @@ if __name__ == "__main__":
         fallbacks=[CommandHandler("start", start), MessageHandler(filters.ALL, fallback)]
     )
     application.add_handler(conv_handler)
-    log_console("Бот запущен")
-    application.run_polling(drop_pending_updates=True)
+    if webhook_mode:
+        if not WEBHOOK_URL:
+            raise SystemExit("BOT_MODE = \"webhook\" требует WEBHOOK_URL в config_secret.py")
+        url_path = WEBHOOK_PATH.strip("/")
+        log_console(f"Бот запущен (webhook {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{url_path})")
+        # Обновления без верного X-Telegram-Bot-Api-Secret-Token отклоняются с 403
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=int(WEBHOOK_PORT),
+            url_path=url_path,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{url_path}",
+            secret_token=WEBHOOK_SECRET or secrets.token_urlsafe(32),
+            drop_pending_updates=True,
+        )
+    else:
+        log_console("Бот запущен")
+        application.run_polling(drop_pending_updates=True)
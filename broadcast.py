@@ -0,0 +1,325 @@
+# Фоновая рассылка /sms.
+# Отправка идёт пулом из нескольких отправителей через общий token bucket (ниже
+# глобального лимита Telegram ~30 сообщений/с). RetryAfter приостанавливает весь
+# bucket на указанное Telegram время, сетевые ошибки повторяются с backoff.
+# Прогресс (курсор по списку получателей) периодически сохраняется в хранилище,
+# так что после перезапуска рассылка продолжается с места остановки. Чаты, ответившие
+# Forbidden (бот заблокирован), попадают в список исключений для будущих рассылок.
+# Аудитория (Audience) собирается из хранилища один раз и дальше обновляется на месте.
+
+import asyncio
+import logging
+import time
+import uuid
+from collections.abc import Callable
+from datetime import date, timedelta
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from storage import is_cancelled
+
+GLOBAL_RATE = 25  # сообщений в секунду на бота
+SENDERS = 8  # одновременных отправителей
+MAX_ATTEMPTS = 4  # попыток на одно сообщение при сетевых ошибках и RetryAfter
+PROGRESS_EVERY = 5.0  # секунд между правками сообщения о прогрессе
+CHECKPOINT_EVERY = 1.0  # секунд между сохранениями курсора: при сбое повторно уйдёт не больше ~GLOBAL_RATE сообщений
+SETTING_KEY = "broadcast"
+
+
+class TokenBucket:
+    """Асинхронный token bucket: не больше ``rate`` выдач в секунду, всплеск до ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Останавливает выдачу (RetryAfter касается всего бота, а не одного чата)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Audience:
+    """Получатели рассылок: все, кто писал боту или заказывал, без заблокировавших бота.
+
+    Строится из индексов хранилища при первом обращении (user_ids, order_user_ids,
+    last_order_weeks) и дальше поддерживается на месте: add() при регистрации,
+    record_order() при сохранении заказа, discard() при Forbidden. Для сегмента «заказывал
+    за последние N недель» пользователи разложены по неделе последнего заказа, так что
+    выборка перебирает недели, а не всех пользователей.
+    """
+
+    def __init__(self, storage, excluded: Callable[[], set[int]] = set):
+        self.storage = storage
+        self.excluded = excluded
+        self._members: set[int] | None = None
+        self._last_week: dict[int, date] = {}
+        self._by_week: dict[date, set[int]] = {}
+
+    def _ensure_loaded(self) -> set[int]:
+        if self._members is None:
+            members = self.storage.user_ids() | self.storage.order_user_ids()
+            self._last_week = {}
+            self._by_week = {}
+            for uid, week in self.storage.last_order_weeks().items():
+                self._set_week(uid, week)
+            self._members = members - self.excluded()
+        return self._members
+
+    def _set_week(self, uid: int, week: date) -> None:
+        previous = self._last_week.get(uid)
+        if previous is not None and previous >= week:
+            return
+        if previous is not None:
+            users = self._by_week.get(previous)
+            if users is not None:
+                users.discard(uid)
+                if not users:
+                    del self._by_week[previous]
+        self._last_week[uid] = week
+        self._by_week.setdefault(week, set()).add(uid)
+
+    def add(self, uid: int) -> None:
+        """Пользователь написал боту (в том числе после разблокировки)."""
+        self._ensure_loaded().add(int(uid))
+
+    def record_order(self, uid: int | None, week: date | None) -> None:
+        if uid is None:
+            return
+        self._ensure_loaded().add(int(uid))
+        if week is not None:
+            self._set_week(int(uid), week)
+
+    def discard(self, uid: int) -> None:
+        """Чат ответил Forbidden — до следующего сообщения от пользователя не пишем ему."""
+        self._ensure_loaded().discard(int(uid))
+
+    def all(self) -> set[int]:
+        return set(self._ensure_loaded())
+
+    def ordered_since(self, week: date) -> set[int]:
+        """Заказывали с доставкой на неделе ``week`` или позже."""
+        members = self._ensure_loaded()
+        result: set[int] = set()
+        for w, users in self._by_week.items():
+            if w >= week:
+                result |= users
+        return result & members
+
+    def ordered_in_last_weeks(self, weeks: int, current_week: date) -> set[int]:
+        """Заказывали на текущую неделю, на одну из ``weeks - 1`` предыдущих или вперёд."""
+        return self.ordered_since(current_week - timedelta(weeks=max(weeks, 1) - 1))
+
+    def with_active_orders(self, week: date) -> set[int]:
+        """Есть неотменённый заказ с доставкой на неделе ``week`` (индекс недели хранилища)."""
+        members = self._ensure_loaded()
+        return {
+            int(payload["user_id"])
+            for _, payload in self.storage.week_orders(week)
+            if payload.get("user_id") is not None and not is_cancelled(payload)
+        } & members
+
+
+class BroadcastEngine:
+    """Одна активная рассылка за раз; состояние — настройка ``broadcast`` в хранилище.
+
+    Состояние: {"job": {...} | None, "suppressed": [chat_id, ...]}. В job хранятся текст,
+    список получателей, курсор (все получатели до него обработаны) и номера уже
+    обработанных получателей за курсором, чтобы при продолжении никому не писать дважды.
+    """
+
+    def __init__(self, storage, audience: Audience | None = None):
+        self.storage = storage
+        self.audience = audience
+        self._job: dict | None = None
+        self._suppressed: set[int] = set()
+        self._task: asyncio.Task | None = None
+        self._loaded = False
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        state = self.storage.load_setting(SETTING_KEY)
+        self._job = state.get("job")
+        self._suppressed = {int(uid) for uid in state.get("suppressed") or []}
+        self._loaded = True
+
+    def _save(self) -> None:
+        self.storage.save_setting(SETTING_KEY, {"job": self._job, "suppressed": sorted(self._suppressed)})
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def suppressed(self) -> set[int]:
+        self._ensure_loaded()
+        return set(self._suppressed)
+
+    def unsuppress(self, chat_id: int) -> None:
+        """Пользователь снова пишет боту — значит, разблокировал его."""
+        self._ensure_loaded()
+        if int(chat_id) in self._suppressed:
+            self._suppressed.discard(int(chat_id))
+            self._save()
+            if self.audience is not None:
+                self.audience.add(chat_id)
+
+    def start(self, bot, text: str, recipients: list[int], admin_chat: int) -> int:
+        """Запускает рассылку в фоне. Возвращает число получателей (без исключённых)."""
+        self._ensure_loaded()
+        targets = [uid for uid in recipients if uid not in self._suppressed]
+        self._job = {
+            "id": uuid.uuid4().hex[:8],
+            "text": text,
+            "recipients": targets,
+            "cursor": 0,
+            "done_ahead": [],
+            "sent": 0,
+            "failed": 0,
+            "blocked": 0,
+            "admin_chat": admin_chat,
+            "progress_message_id": None,
+            "started_at": int(time.time()),
+        }
+        self._save()
+        self._task = asyncio.create_task(self._run(bot), name="broadcast")
+        return len(targets)
+
+    def resume(self, bot) -> bool:
+        """Продолжает рассылку, прерванную перезапуском. Возвращает True, если она была."""
+        self._ensure_loaded()
+        if self.running or not self._job:
+            return False
+        job = self._job
+        logging.info(f"Продолжаем рассылку {job['id']} с позиции {job['cursor']} из {len(job['recipients'])}")
+        self._task = asyncio.create_task(self._run(bot), name="broadcast")
+        return True
+
+    async def stop(self) -> None:
+        """Останавливает рассылку при выключении бота; курсор сохраняется для resume()."""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    # --- отправка ---
+
+    def _progress_text(self, job: dict, done: bool = False) -> str:
+        total = len(job["recipients"])
+        processed = job["sent"] + job["failed"] + job["blocked"]
+        head = "Рассылка завершена" if done else f"Рассылка идёт: {processed}/{total}"
+        return f"{head}: отправлено {job['sent']}, ошибок {job['failed']}, заблокировали бота {job['blocked']}. Получателей: {total}."
+
+    async def _report(self, bot, job: dict, done: bool = False) -> None:
+        text = self._progress_text(job, done)
+        try:
+            if job.get("progress_message_id"):
+                await bot.edit_message_text(text, chat_id=job["admin_chat"], message_id=job["progress_message_id"])
+            else:
+                message = await bot.send_message(chat_id=job["admin_chat"], text=text)
+                job["progress_message_id"] = message.message_id
+        except BadRequest as e:
+            # "message is not modified" и удалённое сообщение прогресса не мешают рассылке
+            logging.debug(f"Прогресс рассылки не обновлён: {e}")
+        except Exception as e:
+            logging.warning(f"Прогресс рассылки не обновлён: {e}")
+
+    async def _send(self, bot, bucket: TokenBucket, job: dict, chat_id: int) -> str:
+        delay = 1.0
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await bucket.acquire()
+            try:
+                await bot.send_message(chat_id=chat_id, text=job["text"], parse_mode=ParseMode.HTML)
+                return "sent"
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                logging.warning(f"Broadcast: RetryAfter {retry_after}s (chat {chat_id})")
+                bucket.pause(retry_after)
+            except Forbidden:
+                return "blocked"
+            except (TimedOut, NetworkError) as e:
+                if attempt == MAX_ATTEMPTS:
+                    logging.warning(f"Broadcast failed for {chat_id}: {e}")
+                    return "failed"
+                await asyncio.sleep(delay)
+                delay *= 2
+            except Exception as e:
+                logging.warning(f"Broadcast failed for {chat_id}: {e}")
+                return "failed"
+        return "failed"
+
+    async def _run(self, bot) -> None:
+        job = self._job
+        recipients = job["recipients"]
+        done_ahead = set(job["done_ahead"])
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for idx in range(job["cursor"], len(recipients)):
+            if idx not in done_ahead:
+                queue.put_nowait(idx)
+        bucket = TokenBucket(GLOBAL_RATE)
+
+        def checkpoint() -> None:
+            # Курсор — первый необработанный получатель; всё обработанное за ним — в done_ahead
+            while job["cursor"] in done_ahead:
+                done_ahead.discard(job["cursor"])
+                job["cursor"] += 1
+            job["done_ahead"] = sorted(done_ahead)
+            self._save()
+
+        async def sender() -> None:
+            while True:
+                try:
+                    idx = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                chat_id = int(recipients[idx])
+                outcome = await self._send(bot, bucket, job, chat_id)
+                job[outcome] += 1
+                if outcome == "blocked":
+                    self._suppressed.add(chat_id)
+                    if self.audience is not None:
+                        self.audience.discard(chat_id)
+                done_ahead.add(idx)
+
+        async def progress() -> None:
+            last_report = time.monotonic()
+            while True:
+                await asyncio.sleep(CHECKPOINT_EVERY)
+                checkpoint()
+                if time.monotonic() - last_report >= PROGRESS_EVERY:
+                    last_report = time.monotonic()
+                    await self._report(bot, job)
+
+        await self._report(bot, job)
+        reporter = asyncio.create_task(progress())
+        try:
+            await asyncio.gather(*(sender() for _ in range(SENDERS)))
+        finally:
+            reporter.cancel()
+            checkpoint()
+        logging.info(f"Рассылка {job['id']} завершена: {self._progress_text(job, done=True)}")
+        await self._report(bot, job, done=True)
+        self._job = None
+        self._save()
@@ -0,0 +1,188 @@
+# Параллельная обработка обновлений с сохранением порядка внутри чата.
+# Без concurrent_updates Application обрабатывает обновления строго по одному, и долгий
+# обработчик (отчёт администратора, загрузка фото меню) задерживает ответы всем клиентам.
+# Здесь обновления разных чатов идут параллельно, а обновления одного чата — по очереди
+# в порядке поступления: ConversationHandler и user_data видят их так же, как раньше.
+# Тяжёлую отрисовку (отчёты, выгрузки) обработчики отдают в RenderPool — отдельный пул
+# потоков, чтобы она не занимала цикл событий.
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class _ChatQueue:
+    __slots__ = ("lock", "waiting")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiting = 0  # обновления чата, которые держат или ждут lock
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Процессор обновлений: не больше ``max_concurrent_updates`` обработчиков одновременно,
+    не больше одного на чат, и ограниченное число принятых, но ещё не обработанных обновлений.
+
+    Application забирает обновление из ``update_queue`` и сразу создаёт для него задачу,
+    поэтому предел самой очереди ничего не ограничивает, пока задачи создаются без
+    ожидания. Ограничение устроено так:
+
+    * обновление сначала ждёт lock своего чата и только потом занимает один из
+      ``max_concurrent_updates`` слотов PTB — ожидающие своей очереди обновления чата
+      слотов не держат, и поток сообщений от одного клиента не задерживает остальных;
+      asyncio.Lock отдаёт владение в порядке очереди, поэтому порядок внутри чата сохраняется;
+    * от каждого чата в счёт ``max_pending_updates`` идут не больше ``max_chat_pending``
+      ожидающих обновлений; остальные ждут своего lock вне счёта и не останавливают приём
+      обновлений других чатов;
+    * UpdateQueue отдаёт Application следующее обновление, только когда принятых меньше
+      ``max_pending_updates``. Иначе очередь заполняется до своего maxsize, и приём (polling
+      или webhook) ждёт, так что память ограничена maxsize + max_pending_updates.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int | None = None,
+                 max_chat_pending: int = 32):
+        super().__init__(max_concurrent_updates)
+        self.max_pending_updates = max(max_pending_updates or 0, max_concurrent_updates)
+        self.max_chat_pending = max_chat_pending
+        self.pending = 0  # принятые обновления в счёт max_pending_updates
+        self._room = asyncio.Event()
+        self._room.set()
+        self._chats: dict[int, _ChatQueue] = {}
+        self._accepted: set[int] = set()  # id() обновлений, уже учтённых UpdateQueue
+
+    @staticmethod
+    def chat_key(update: object) -> int | None:
+        """Ключ очереди: чат обновления, для inline-запросов без чата — пользователь."""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def wait_for_room(self) -> None:
+        """Ждёт, пока принятых обновлений станет меньше ``max_pending_updates``."""
+        while self.pending >= self.max_pending_updates:
+            self._room.clear()
+            await self._room.wait()
+
+    def _release(self) -> None:
+        self.pending -= 1
+        if self.pending < self.max_pending_updates:
+            self._room.set()
+
+    def accept(self, update: object) -> None:
+        """Ставит обновление в очередь его чата и в счёт ``pending``; UpdateQueue вызывает это
+        в момент выдачи, чтобы следующий get() уже видел принятое обновление."""
+        self._accepted.add(id(update))
+        key = self.chat_key(update)
+        if key is None:
+            self.pending += 1
+            return
+        queue = self._chats.get(key)
+        if queue is None:
+            queue = self._chats[key] = _ChatQueue()
+        # Инвариант: чат занимает в self.pending min(waiting, max_chat_pending)
+        if queue.waiting < self.max_chat_pending:
+            self.pending += 1
+        queue.waiting += 1
+
+    async def process_update(self, update, coroutine) -> None:
+        # Базовый process_update (помечен @final только для проверки типов) сначала занимает
+        # слот и лишь затем вызывает do_process_update — здесь порядок обратный: lock чата, слот
+        if id(update) not in self._accepted:
+            self.accept(update)  # обновление пришло не через UpdateQueue
+        self._accepted.discard(id(update))
+        key = self.chat_key(update)
+        if key is None:
+            try:
+                await super().process_update(update, coroutine)
+            finally:
+                self._release()
+            return
+        queue = self._chats[key]
+        try:
+            async with queue.lock:
+                await super().process_update(update, coroutine)
+        finally:
+            queue.waiting -= 1
+            if queue.waiting < self.max_chat_pending:
+                self._release()
+            if not queue.waiting:
+                del self._chats[key]
+
+    async def do_process_update(self, update, coroutine) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+class UpdateQueue(asyncio.Queue):
+    """Очередь входящих обновлений, которая отдаёт их Application только при свободном месте
+    в ``processor`` (см. PerChatUpdateProcessor)."""
+
+    def __init__(self, maxsize: int, processor: PerChatUpdateProcessor):
+        super().__init__(maxsize)
+        self.processor = processor
+
+    async def get(self):
+        await self.processor.wait_for_room()
+        item = await super().get()
+        if isinstance(item, Update):  # служебный сигнал остановки Application не учитывается
+            self.processor.accept(item)
+        return item
+
+
+render_log = logging.getLogger("bot.render")
+
+
+class RenderPool:
+    """Пул потоков для отрисовки отчётов и выгрузок: не больше ``workers`` задач сразу.
+
+    Задачи получают готовые копии данных (снимок берётся в цикле событий) и возвращают
+    текст или файл. Потоки делят GIL с циклом событий, но интерпретатор переключается
+    каждые несколько миллисекунд, так что отчёт на тысячи строк не останавливает приём
+    заказов целиком. Для каждой задачи в лог ``bot.render`` пишется, сколько она ждала
+    свободного потока и сколько выполнялась; ожидание дольше ``slow_wait`` — WARNING.
+    """
+
+    def __init__(self, workers: int = 2, slow_wait: float = 1.0):
+        self.workers = workers
+        self.slow_wait = slow_wait
+        self.pending = 0  # задачи в очереди и в работе
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+
+    async def run(self, name: str, fn, *args):
+        submitted = time.perf_counter()
+        started = None
+
+        def job():
+            nonlocal started
+            started = time.perf_counter()
+            return fn(*args)
+
+        self.pending += 1
+        queued = self.pending
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        finally:
+            self.pending -= 1
+            finished = time.perf_counter()
+            wait = (started or finished) - submitted
+            level = logging.WARNING if wait > self.slow_wait else logging.INFO
+            render_log.log(
+                level, "Рендер %s: ожидание %.1f мс, выполнение %.1f мс, задач в пуле %d",
+                name, wait * 1000, (finished - (started or finished)) * 1000, queued,
+            )
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,13 @@
+import axios from 'axios';
+import type { CalcBatchBasket, CalcOrderBatchResult } from './types';
+
+const API_BASE = process.env.NEXT_PUBLIC_API_BASE ?? 'http://localhost:8000/api/v1';
+
+// Prices up to 64 candidate baskets (presets, portion counts, 1-8 weeks) in one request.
+export async function calcOrderBatch(weekStart: string, baskets: CalcBatchBasket[]): Promise<CalcOrderBatchResult[]> {
+  const response = await axios.post<{ results: CalcOrderBatchResult[] }>(`${API_BASE}/orders/calc/batch`, {
+    week_start: weekStart,
+    baskets,
+  });
+  return response.data.results;
+}
@@ -21,3 +21,50 @@ export interface MenuWeek {
   base_price_lari: number;
   day_offers: DayOffer[];
 }
+
+export interface BasketSelection {
+  day_of_week: string;
+  portions: number;
+}
+
+export type OrderMode = 'single' | 'multiweek' | 'subscription';
+
+export interface CalcOrderDay {
+  day_of_week: string;
+  date: string;
+  portions: number;
+  price_lari: number;
+  subtotal_lari: number;
+  sold_out: boolean;
+  closed: boolean;
+  reason?: string | null;
+}
+
+export interface CalcOrderWeek {
+  week_start: string;
+  total_lari: number;
+  days: CalcOrderDay[];
+  has_menu: boolean;
+}
+
+export interface CalcOrderResponse {
+  total_lari: number;
+  discount_lari: number;
+  mode: OrderMode;
+  weeks: CalcOrderWeek[];
+  promo_code_applied: boolean;
+}
+
+export interface CalcBatchBasket {
+  key?: string | null;
+  selections: BasketSelection[];
+  promo_code?: string | null;
+  weeks_ahead?: number;
+  mode?: OrderMode;
+}
+
+export interface CalcOrderBatchResult {
+  key?: string | null;
+  result?: CalcOrderResponse | null;
+  error?: string | null;
+}
@@ -0,0 +1,41 @@
+# Неблокирующее логирование бота: обработчики кладут запись в очередь, а форматирование
+# и запись в файл/консоль делает отдельный поток QueueListener. Запись в лог из цикла
+# событий сводится к put_nowait: ни ротация файла, ни медленный терминал не задерживают
+# ответы. Для частых INFO-событий (нажатия кнопок) можно задать долю сохраняемых записей.
+
+import atexit
+import logging
+import queue
+from collections.abc import Iterable, Mapping
+from logging.handlers import QueueListener
+
+# Фильтр и обработчик очереди — общие с API (backend/app/core/logqueue.py, только stdlib)
+from backend.app.core.logqueue import NonBlockingQueueHandler, SamplingFilter
+
+LOG_QUEUE_SIZE = 10_000
+
+
+def start_queue_logging(
+    logger: logging.Logger,
+    handlers: Iterable[logging.Handler],
+    sample_rates: Mapping[str, float] | None = None,
+    queue_size: int = LOG_QUEUE_SIZE,
+) -> QueueListener:
+    """Заменяет обработчики ``logger`` одним NonBlockingQueueHandler, а ``handlers`` отдаёт
+    потоку QueueListener. Поток останавливается (с дозаписью очереди) при выходе."""
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = NonBlockingQueueHandler(log_queue, queue_size)
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    logger.handlers.clear()
+    logger.addHandler(queue_handler)
+    listener.start()
+    atexit.register(stop_queue_logging, listener)
+    return listener
+
+
+def stop_queue_logging(listener: QueueListener) -> None:
+    """Дописывает очередь и останавливает поток; повторный вызов ничего не делает."""
+    if listener._thread is not None:
+        listener.stop()
@@ -0,0 +1,85 @@
+# Кэш file_id Telegram для статичных медиа бота (фото меню, фото блюд, логотипы, анимация).
+# После первой загрузки файла Telegram возвращает file_id, по которому тот же файл можно
+# отправлять повторно без выгрузки байтов. Ключ — тип медиа и SHA-256 содержимого, так что
+# замена файла на диске сама по себе даёт новую загрузку. Хэш файла пересчитывается только
+# при смене mtime/размера. Соответствие хранится в хранилище бота (настройка "file_ids").
+
+import asyncio
+import hashlib
+import logging
+import os
+
+from telegram.error import BadRequest
+
+SETTING_KEY = "file_ids"
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_file_id_error(error: BadRequest) -> bool:
+    # "Wrong file identifier/http url specified", "Wrong remote file identifier specified: ...",
+    # "File reference expired" — ошибки самого file_id. Остальное (подпись, разметка, чат) к нему не относится
+    return "file" in str(error.message).lower()
+
+
+class FileIdCache:
+    def __init__(self, storage):
+        self.storage = storage
+        self._ids: dict[str, str] | None = None
+        self._hashes: dict[str, tuple[tuple[int, int], str]] = {}  # путь -> ((mtime_ns, size), sha256)
+
+    def _file_ids(self) -> dict[str, str]:
+        if self._ids is None:
+            self._ids = {k: v for k, v in self.storage.load_setting(SETTING_KEY).items() if isinstance(v, str)}
+        return self._ids
+
+    async def _key(self, path: str, kind: str) -> str:
+        st = os.stat(path)  # FileNotFoundError — забота вызывающего, как и с open()
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._hashes.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, await asyncio.to_thread(_sha256, path))
+            self._hashes[path] = cached
+        return f"{kind}:{cached[1]}"
+
+    def _remember(self, key: str, file_id: str | None) -> None:
+        ids = self._file_ids()
+        if file_id:
+            ids[key] = file_id
+        else:
+            ids.pop(key, None)
+        self.storage.save_setting(SETTING_KEY, ids)
+
+    async def send(self, send, kind: str, path: str, **kwargs):
+        """Отправляет файл через ``send`` (reply_photo, reply_animation ...), где ``kind`` — имя
+        аргумента с медиа ("photo", "animation"). Повторные отправки идут по file_id."""
+        key = await self._key(path, kind)
+        file_id = self._file_ids().get(key)
+        if file_id:
+            try:
+                return await send(**{kind: file_id}, **kwargs)
+            except BadRequest as e:
+                if not _is_file_id_error(e):
+                    raise
+                # file_id протух (например, бот сменил токен) — загрузим файл заново
+                logging.warning(f"file_id для {path} отклонён: {e}")
+                self._remember(key, None)
+        with open(path, "rb") as f:
+            message = await send(**{kind: f}, **kwargs)
+        media = message.photo[-1] if kind == "photo" and message.photo else getattr(message, kind, None)
+        if media is not None:
+            self._remember(key, media.file_id)
+        return message
+
+    async def replace(self, path: str, kind: str, file_id: str | None = None) -> None:
+        """Вызывается после замены файла на диске. Если новый файл пришёл от Telegram,
+        его file_id запоминается сразу — первая отправка обойдётся без загрузки."""
+        self._hashes.pop(path, None)
+        if file_id:
+            self._remember(await self._key(path, kind), file_id)
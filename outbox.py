@@ -0,0 +1,176 @@
+# Исходящая очередь (outbox) для сообщений, которые не должны задерживать ответ клиенту:
+# уведомления администратору о новых, изменённых и отменённых заказах и анимация после
+# подтверждения. Обработчик ставит сообщение в очередь синхронно, сразу после записи
+# заказа (без await между ними), и отвечает клиенту; доставкой занимается фоновый
+# отправитель. Очередь хранится в хранилище (Storage.outbox_items и т.д.: в SQLite — строка
+# на сообщение) и переживает перезапуск.
+# Сообщения с одним ключом (ID заказа) уходят строго по порядку, с разными — параллельно.
+
+import asyncio
+import logging
+import time
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+WORKERS = 3  # одновременных отправок
+MAX_ATTEMPTS = 8  # попыток при сетевых ошибках; RetryAfter попыткой не считается
+MAX_BACKOFF = 300.0  # секунд между повторами
+SAVE_DELAY = 1.0  # как часто сохранять очередь после отправок (постановка сохраняется сразу)
+
+
+class Outbox:
+    """Персистентная очередь исходящих сообщений с повторами и порядком по ключу.
+
+    Доставка «хотя бы один раз»: сообщение удаляется из очереди после ответа Telegram, а
+    удаление записывается в хранилище не сразу, а раз в SAVE_DELAY, так что после таймаута
+    или аварийного перезапуска оно может прийти повторно.
+    RetryAfter приостанавливает все сообщения в этот чат на указанное время.
+    """
+
+    def __init__(self, storage, media=None):
+        self.storage = storage
+        self.media = media  # FileIdCache: анимации отправляются по file_id
+        self._items: list[dict] | None = None
+        self._seq = 0
+        # Отправленные и отложенные сообщения, ещё не записанные в хранилище
+        self._removed: list[int] = []
+        self._changed: dict[int, dict] = {}
+        self._inflight: set[int] = set()
+        self._chat_pause: dict[int, float] = {}
+        self._wake = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._save_timer: asyncio.TimerHandle | None = None
+
+    def _ensure_loaded(self) -> list[dict]:
+        if self._items is None:
+            self._items = self.storage.outbox_items()
+            self._seq = max([self._seq] + [int(item["id"]) for item in self._items])
+        return self._items
+
+    def _save(self) -> None:
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+            self._save_timer = None
+        removed, self._removed = self._removed, []
+        changed, self._changed = self._changed, {}
+        if removed:
+            self.storage.remove_outbox_items(removed)
+        changed = [dict(item) for item in changed.values() if item["id"] not in removed]
+        if changed:
+            self.storage.put_outbox_items(changed)
+
+    def _save_later(self) -> None:
+        if self._save_timer is None:
+            self._save_timer = asyncio.get_running_loop().call_later(SAVE_DELAY, self._save)
+
+    def __len__(self) -> int:
+        return len(self._ensure_loaded())
+
+    def enqueue(self, key: str, chat_id: int, text: str | None = None, *, animation: str | None = None,
+                parse_mode: str | None = ParseMode.HTML) -> None:
+        """Ставит текст (или анимацию из файла ``animation``) в очередь для ``chat_id``."""
+        items = self._ensure_loaded()
+        self._seq += 1
+        item = {"id": self._seq, "key": key, "chat_id": int(chat_id), "attempts": 0, "not_before": 0.0}
+        if animation is not None:
+            item["animation"] = animation
+        else:
+            item["text"] = text
+            item["parse_mode"] = parse_mode
+        items.append(item)
+        self.storage.put_outbox_items([dict(item)])
+        self._wake.set()
+
+    # --- фоновая отправка ---
+
+    def start(self, bot) -> None:
+        if self._tasks:
+            return
+        if self._ensure_loaded():
+            logging.info(f"В очереди исходящих сообщений после перезапуска: {len(self._items)}")
+        self._tasks = [asyncio.create_task(self._worker(bot), name=f"outbox-{i}") for i in range(WORKERS)]
+
+    async def stop(self) -> None:
+        """Останавливает отправку; неотправленное остаётся в хранилище до следующего запуска."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._save()
+
+    def _pick(self, now: float) -> tuple[dict | None, float | None]:
+        """Первое готовое сообщение, перед которым нет неотправленных с тем же ключом;
+        иначе — через сколько секунд освободится ближайшее."""
+        seen: set[str] = set()
+        wait: float | None = None
+        for item in self._ensure_loaded():
+            key = item["key"]
+            if key in seen:
+                continue
+            seen.add(key)
+            if item["id"] in self._inflight:
+                continue
+            ready_at = max(float(item.get("not_before") or 0), self._chat_pause.get(item["chat_id"], 0.0))
+            if ready_at > now:
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+                continue
+            return item, None
+        return None, wait
+
+    async def _worker(self, bot) -> None:
+        while True:
+            item, wait = self._pick(time.time())
+            if item is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._inflight.add(item["id"])
+            try:
+                done = await self._deliver(bot, item)
+            finally:
+                self._inflight.discard(item["id"])
+            if done:
+                self._items.remove(item)
+                self._removed.append(item["id"])
+            else:
+                self._changed[item["id"]] = item
+            self._save_later()
+            # Следующее сообщение с тем же ключом могло стать доступным
+            self._wake.set()
+
+    async def _send(self, bot, item: dict) -> None:
+        chat_id = item["chat_id"]
+        if "animation" not in item:
+            await bot.send_message(chat_id=chat_id, text=item["text"], parse_mode=item.get("parse_mode"))
+        elif self.media is not None:
+            await self.media.send(bot.send_animation, "animation", item["animation"], chat_id=chat_id)
+        else:
+            with open(item["animation"], "rb") as f:
+                await bot.send_animation(chat_id=chat_id, animation=f)
+
+    async def _deliver(self, bot, item: dict) -> bool:
+        """Пытается отправить сообщение. True — убрать из очереди (доставлено или безнадёжно)."""
+        try:
+            await self._send(bot, item)
+            return True
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+            logging.warning(f"Outbox: RetryAfter {retry_after}s (chat {item['chat_id']})")
+            self._chat_pause[item["chat_id"]] = time.time() + retry_after
+            item["not_before"] = time.time() + retry_after
+            return False
+        except (Forbidden, BadRequest, FileNotFoundError) as e:
+            logging.warning(f"Outbox: сообщение {item['id']} в чат {item['chat_id']} не может быть доставлено: {e}")
+            return True
+        except Exception as e:  # TimedOut, NetworkError и прочее — повтор с backoff
+            item["attempts"] = int(item.get("attempts") or 0) + 1
+            if item["attempts"] >= MAX_ATTEMPTS:
+                logging.error(f"Outbox: сообщение {item['id']} в чат {item['chat_id']} отброшено после {item['attempts']} попыток: {e}")
+                return True
+            item["not_before"] = time.time() + min(2.0 ** item["attempts"], MAX_BACKOFF)
+            logging.warning(f"Outbox: повтор сообщения {item['id']} в чат {item['chat_id']} (попытка {item['attempts']}): {e}")
+            return False
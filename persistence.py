@@ -0,0 +1,243 @@
+# Персистентность PTB (user_data, chat_data, bot_data, состояния диалогов) в SQLite.
+# В отличие от PicklePersistence, которая при каждом сбросе пишет один общий pickle со
+# всеми пользователями, здесь у каждого пользователя/чата/ключа диалога своя строка:
+# пишутся только изменившиеся строки, а user_data и chat_data подгружаются лениво —
+# при первом обновлении от пользователя (refresh_user_data), а не целиком на старте.
+
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sqlite3
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS misc (key TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+_TABLES = {"user_data", "chat_data"}
+
+
+class SqlitePersistence(BasePersistence):
+    """BasePersistence на SQLite (WAL) со строкой на пользователя, чат и ключ диалога.
+
+    Значения сериализуются pickle построчно, поэтому в user_data можно хранить то же,
+    что и раньше. Записи, пришедшие от одного прохода Application.update_persistence(),
+    собираются и фиксируются одной транзакцией; строки, чьё содержимое не изменилось
+    с прошлой записи, не переписываются. При первом запуске данные импортируются из
+    ``legacy_pickle`` (файл PicklePersistence), если он есть.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        store_data: PersistenceInput | None = None,
+        update_interval: float = 60,
+        legacy_pickle: str | None = None,
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.filepath = filepath
+        self.legacy_pickle = legacy_pickle
+        self._conn: sqlite3.Connection | None = None
+        self._loaded: dict[str, set[int]] = {table: set() for table in _TABLES}
+        self._written: dict[tuple[str, object], int] = {}  # (таблица, ключ) -> hash записанного blob
+        self._pending: dict[tuple[str, object], bytes | None] = {}
+        self._commit: asyncio.Future | None = None
+
+    # --- соединение ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.filepath, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            if self.legacy_pickle and os.path.exists(self.legacy_pickle) and self._is_empty():
+                self._import_pickle(self.legacy_pickle)
+        return self._conn
+
+    def _is_empty(self) -> bool:
+        return not any(
+            self._conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+            for table in ("user_data", "chat_data", "misc", "conversations")
+        )
+
+    def _import_pickle(self, path: str) -> None:
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logging.error(f"Не удалось прочитать {path}: {e}")
+            return
+        conn = self._conn
+        conn.execute("BEGIN")
+        for table in _TABLES:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)",
+                [(int(key), pickle.dumps(value)) for key, value in (data.get(table) or {}).items()],
+            )
+        for key in ("bot_data", "callback_data"):
+            if data.get(key) is not None:
+                conn.execute("INSERT OR REPLACE INTO misc (key, data) VALUES (?, ?)", (key, pickle.dumps(data[key])))
+        for name, states in (data.get("conversations") or {}).items():
+            conn.executemany(
+                "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                [(name, json.dumps(list(key)), pickle.dumps(state)) for key, state in states.items()],
+            )
+        conn.execute("COMMIT")
+        os.replace(path, path + ".imported")
+        logging.info(f"Состояние бота импортировано из {path} в {self.filepath}")
+
+    def _load(self, table: str, key) -> object | None:
+        column = "key" if table == "misc" else "id"
+        row = self._connect().execute(f"SELECT data FROM {table} WHERE {column} = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._written[(table, key)] = hash(row[0])
+        return pickle.loads(row[0])
+
+    # --- запись ---
+
+    async def _write(self, table: str, key, value) -> None:
+        """Ставит строку в общую транзакцию; value=None — удалить строку."""
+        blob = pickle.dumps(value) if value is not None else None
+        if blob is not None and self._written.get((table, key)) == hash(blob):
+            return
+        self._pending[(table, key)] = blob
+        if self._commit is None:
+            # Все update_* одного прохода update_persistence() запущены через gather и уже
+            # стоят в очереди цикла: фиксация через call_soon выполнится после них
+            loop = asyncio.get_running_loop()
+            self._commit = loop.create_future()
+            loop.call_soon(self._flush_pending)
+        await asyncio.shield(self._commit)
+
+    def _flush_pending(self) -> None:
+        pending, self._pending = self._pending, {}
+        commit, self._commit = self._commit, None
+        if not pending:
+            if commit is not None and not commit.done():
+                commit.set_result(None)
+            return
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            for (table, key), blob in pending.items():
+                if table == "conversations":
+                    name, conv_key = key
+                    if blob is None:
+                        conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, conv_key))
+                    else:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                            (name, conv_key, blob),
+                        )
+                    continue
+                column = "key" if table == "misc" else "id"
+                if blob is None:
+                    conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (key,))
+                else:
+                    conn.execute(f"INSERT OR REPLACE INTO {table} ({column}, data) VALUES (?, ?)", (key, blob))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if self._conn is not None and self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            if commit is not None and not commit.done():
+                commit.set_exception(e)
+            return
+        for (table, key), blob in pending.items():
+            if blob is None:
+                self._written.pop((table, key), None)
+            else:
+                self._written[(table, key)] = hash(blob)
+        if commit is not None and not commit.done():
+            commit.set_result(None)
+
+    # --- чтение при старте ---
+
+    async def get_user_data(self) -> dict:
+        # Лениво: данные пользователя подгружаются в refresh_user_data при первом обновлении
+        self._connect()
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        self._connect()
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        data = self._load("misc", "bot_data")
+        return data if data is not None else {}
+
+    async def get_callback_data(self):
+        return self._load("misc", "callback_data")
+
+    async def get_conversations(self, name: str) -> dict:
+        # Состояния диалогов нужны ConversationHandler целиком, но это лишь ключ и номер состояния
+        result = {}
+        for key, state in self._connect().execute("SELECT key, state FROM conversations WHERE name = ?", (name,)):
+            self._written[("conversations", (name, key))] = hash(state)
+            result[tuple(json.loads(key))] = pickle.loads(state)
+        return result
+
+    # --- ленивая подгрузка ---
+
+    async def _refresh(self, table: str, key: int, data: dict) -> None:
+        if key in self._loaded[table]:
+            return
+        self._loaded[table].add(key)
+        stored = self._load(table, key)
+        if stored:
+            # В памяти могли появиться ключи до первой подгрузки — они новее сохранённых
+            for name, value in stored.items():
+                data.setdefault(name, value)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._refresh("user_data", user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        await self._refresh("chat_data", chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    # --- обновления ---
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await self._write("user_data", user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        await self._write("chat_data", chat_id, data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        await self._write("misc", "bot_data", data)
+
+    async def update_callback_data(self, data) -> None:
+        await self._write("misc", "callback_data", data)
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        await self._write("conversations", (name, json.dumps(list(key))), new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._loaded["user_data"].discard(user_id)
+        await self._write("user_data", user_id, None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._loaded["chat_data"].discard(chat_id)
+        await self._write("chat_data", chat_id, None)
+
+    async def flush(self) -> None:
+        if self._pending:
+            self._flush_pending()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,240 @@
+# Отчёты админа: выгрузка заказов недели в CSV/XLSX и разбиение длинных текстов на
+# сообщения. Файлы пишутся построчно из генератора (XLSX — тоже, без сторонних
+# библиотек: это zip с XML), поэтому их можно собирать в executor, не держа весь отчёт
+# в памяти. Данные для выгрузки берутся из хранилища в цикле событий (это копии),
+# а форматирование и запись — в потоке.
+
+import csv
+import io
+import re
+import zipfile
+from collections.abc import Iterable, Iterator
+from datetime import date, datetime, timedelta
+from xml.sax.saxutils import escape
+
+TELEGRAM_TEXT_LIMIT = 4096
+
+EXPORT_HEADER = (
+    "ID заказа", "Дата доставки", "День", "Количество", "Сумма, лари", "Статус",
+    "Адрес", "Телефон", "user_id", "Username", "Меню", "Создан",
+)
+
+
+def export_rows(orders: Iterable[tuple[str, dict]], week_start: date, day_index: dict[str, int],
+                price: int, count_of) -> Iterator[tuple]:
+    """Строки выгрузки в порядке дней недели и времени создания; отменённые — со статусом."""
+    def sort_key(item):
+        oid, payload = item
+        return day_index.get(str(payload.get("day") or ""), 7), int(payload.get("created_at") or 0), oid
+
+    for oid, payload in sorted(orders, key=sort_key):
+        day = str(payload.get("day") or "")
+        idx = day_index.get(day)
+        count = count_of(payload.get("count", 1))
+        created = int(payload.get("created_at") or 0)
+        yield (
+            oid,
+            (week_start + timedelta(days=idx)).isoformat() if idx is not None else "",
+            day,
+            count,
+            count * price,
+            str(payload.get("status") or ""),
+            str(payload.get("address") or ""),
+            str(payload.get("phone") or ""),
+            int(payload.get("user_id") or 0) or "",
+            ("@" + payload["username"]) if payload.get("username") else "",
+            str(payload.get("menu") or ""),
+            datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S") if created else "",
+        )
+
+
+def write_csv(out, header: Iterable, rows: Iterable[Iterable]) -> None:
+    """CSV в UTF-8 с BOM (так его правильно открывает Excel) в бинарный ``out``."""
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="", write_through=True)
+    try:
+        writer = csv.writer(text)
+        writer.writerow(header)
+        writer.writerows(rows)
+    finally:
+        text.detach()  # ``out`` остаётся открытым для отправки
+
+
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Стиль 1 — жирный шрифт для заголовка
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+
+def _column(n: int) -> str:
+    letters = ""
+    n += 1
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _xlsx_row(r: int, values: Iterable, style: int = 0) -> str:
+    cells = []
+    s = f' s="{style}"' if style else ""
+    for c, value in enumerate(values):
+        ref = f"{_column(c)}{r}"
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c r="{ref}"{s}><v>{value}</v></c>')
+        else:
+            text = escape(_XML_INVALID.sub("", str(value)))
+            cells.append(f'<c r="{ref}"{s} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row r="{r}">{"".join(cells)}</row>'
+
+
+def write_xlsx(out, header: Iterable, rows: Iterable[Iterable], sheet: str = "Заказы") -> None:
+    """Минимальная книга XLSX с одним листом; строки пишутся в архив по мере генерации."""
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_STATIC.items():
+            zf.writestr(name, content)
+        zf.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        with zf.open("xl/worksheets/sheet1.xml", "w") as raw:
+            sheet_xml = io.TextIOWrapper(raw, encoding="utf-8")
+            sheet_xml.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet_xml.write(_xlsx_row(1, header, style=1))
+            for r, values in enumerate(rows, start=2):
+                sheet_xml.write(_xlsx_row(r, values))
+            sheet_xml.write("</sheetData></worksheet>")
+            sheet_xml.flush()
+            sheet_xml.detach()
+
+
+EXPORT_WRITERS = {"csv": write_csv, "xlsx": write_xlsx}
+
+
+def _utf16_len(text: str) -> int:
+    # Telegram считает длину сообщения в UTF-16 (эмодзи — две единицы)
+    return len(text.encode("utf-16-le")) // 2
+
+
+_TAG = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*>")
+
+
+def _open_tags(fragment: str) -> list[tuple[str, str]]:
+    """Незакрытые HTML-теги фрагмента: (имя, открывающий тег), от внешнего к внутреннему."""
+    stack: list[tuple[str, str]] = []
+    for match in _TAG.finditer(fragment):
+        name = match.group(2).lower()
+        if not match.group(1):
+            stack.append((name, match.group(0)))
+            continue
+        for idx in range(len(stack) - 1, -1, -1):
+            if stack[idx][0] == name:
+                del stack[idx:]
+                break
+    return stack
+
+
+def _cut(line: str, limit: int) -> tuple[str, str]:
+    """Отрезает от слишком длинной строки кусок до ``limit``, не разрывая тег или сущность.
+
+    Теги, открытые в куске, закрываются в его конце и открываются заново в начале остатка.
+    """
+    budget = limit
+    while True:
+        end = min(len(line), budget)
+        while end > 1 and _utf16_len(line[:end]) > budget:
+            end -= 1
+        head = line[:end]
+        for opening, closing in (("<", ">"), ("&", ";")):
+            pos = head.rfind(opening)
+            if pos > 0 and head.rfind(closing) < pos:
+                head = head[:pos]
+        open_tags = _open_tags(head)
+        closers = "".join(f"</{name}>" for name, _ in reversed(open_tags))
+        if budget <= 1 or _utf16_len(head) + _utf16_len(closers) <= limit:
+            break
+        budget = min(budget - 1, limit - _utf16_len(closers))
+    if not _TAG.sub("", head):
+        # В куске одни теги (тег длиннее лимита): переоткрытие не продвинуло бы разбиение
+        return head, line[len(head):]
+    return head + closers, "".join(tag for _, tag in open_tags) + line[len(head):]
+
+
+def split_message(text: str, limit: int = TELEGRAM_TEXT_LIMIT) -> list[str]:
+    """Делит текст на сообщения не длиннее ``limit`` по границам строк.
+
+    Строки отчёта самодостаточны (каждая закрывает свои HTML-теги), поэтому разметка
+    не ломается; строка длиннее лимита режется не внутри тега или сущности, а открытые
+    в отрезанном куске теги закрываются в нём и открываются заново в следующем.
+    """
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+    for line in text.split("\n"):
+        while _utf16_len(line) > limit:
+            head, line = _cut(line, limit)
+            if current:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            chunks.append(head)
+        line_size = _utf16_len(line)
+        if current and size + 1 + line_size > limit:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        size += line_size + (1 if current else 0)
+        current.append(line)
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()] or [text[:limit]]
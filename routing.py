@@ -0,0 +1,41 @@
+# Маршрутизация кнопок клавиатуры по точному тексту.
+# ConversationHandler перебирает обработчики состояния по очереди, и каждая кнопка,
+# заданная как MessageHandler(filters.Regex("^...$")), — это отдельный прогон регулярки.
+# ButtonRouter собирает все кнопки состояния в словарь: одна проверка на обновление,
+# а свободный ввод (обработчики после роутера) получает обновление только без совпадения.
+
+from collections.abc import Awaitable, Callable, Mapping
+
+from telegram import Update
+from telegram.ext import BaseHandler
+
+Callback = Callable[..., Awaitable[object]]
+
+
+class ButtonRouter(BaseHandler):
+    """Обработчик «текст кнопки -> callback» одним поиском в словаре.
+
+    Как и MessageHandler с filters.Regex, смотрит на текст входящего сообщения (в том
+    числе отредактированного); callback-запросы и сообщения без текста пропускает.
+    Значение, которое вернул callback, уходит в ConversationHandler как новое состояние.
+    """
+
+    def __init__(self, routes: Mapping[str, Callback], block: bool = True):
+        super().__init__(self._unused, block=block)
+        self.routes = dict(routes)
+
+    @staticmethod
+    async def _unused(update, context):  # BaseHandler требует callback; вызывается check_result
+        raise RuntimeError("ButtonRouter dispatches through its routes")
+
+    def check_update(self, update: object) -> Callback | None:
+        if not isinstance(update, Update):
+            return None
+        message = update.message or update.edited_message
+        if message is None or message.text is None:
+            return None
+        return self.routes.get(message.text)
+
+    async def handle_update(self, update, application, check_result, context):
+        self.collect_additional_context(context, update, application, check_result)
+        return await check_result(update, context)
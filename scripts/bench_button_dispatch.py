@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""Micro-benchmark: per-update cost of picking the handler for a keyboard button.
+
+Compares the previous routing of bot.py (one ``MessageHandler(filters.Regex(...))`` per
+button, tried in order by ConversationHandler, plus the group-1 ``BUTTONS_REGEX``
+alternation for ``log_button``) with ``routing.ButtonRouter`` (one dict lookup per
+state) plus ``filters.Text`` over a frozenset. The handler lists mirror the ``MENU``
+and ``ADDRESS`` states of ``lunch_conv``. Only ``check_update`` is timed — the same
+call sequence ConversationHandler and Application perform before running a callback.
+
+Usage::
+
+    python scripts/bench_button_dispatch.py [--iterations 200000]
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+from telegram import Update
+from telegram.ext import MessageHandler, filters
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from routing import ButtonRouter  # noqa: E402
+
+
+async def _cb(update, context):
+    return None
+
+
+MENU_BUTTONS = [
+    "Показать меню на неделю", "Показать заказы на эту неделю", "Мои заказы",
+    "Перейти в режим пользователя", "Перейти в режим администратора", "Управление меню",
+    "Неделя целиком", "Понедельник", "Вторник", "Среда", "Четверг", "Пятница",
+    "Заказать обед", "Посмотреть меню", "Выбрать еще один день",
+]
+COMMON = ["🔄 В начало", "В начало", "❗ Связаться с человеком", "Связаться с человеком"]
+# Abridged copy of BUTTON_TEXTS from bot.py, same order of magnitude (~45 strings)
+BUTTON_TEXTS = MENU_BUTTONS + COMMON + [
+    "Удалить предыдущий заказ", "Добавить к существующему", "Изменить название недели",
+    "Редактировать блюда дня", "Обновить фото меню", "Открыть заказы на следующую неделю",
+    "Изменить заказ", "Добавить блюдо", "Изменить блюдо", "Удалить блюдо", "Заменить список блюд",
+    "Да", "Нет", "Выбрать день заново", "1 обед", "2 обеда", "3 обеда", "4 обеда",
+    "Подтверждаю", "Изменить адрес", "Назад", "Отправить телефон",
+]
+
+
+def regex_states():
+    menu = [MessageHandler(filters.Regex(f"^{re.escape(text)}$"), _cb) for text in MENU_BUTTONS + COMMON]
+    address = [
+        MessageHandler(filters.Regex("^Назад$"), _cb),
+        MessageHandler(filters.Regex("^❗ Связаться с человеком$"), _cb),
+        MessageHandler(filters.Regex("^Связаться с человеком$"), _cb),
+        MessageHandler((filters.TEXT | filters.CONTACT) & ~filters.COMMAND, _cb),
+    ]
+    log = MessageHandler(filters.Regex(r"^(" + "|".join(re.escape(s) for s in BUTTON_TEXTS) + r")$"), _cb)
+    return menu, address, log
+
+
+def router_states():
+    menu = [ButtonRouter(dict.fromkeys(MENU_BUTTONS + COMMON, _cb))]
+    address = [
+        ButtonRouter(dict.fromkeys(["Назад", *COMMON], _cb)),
+        MessageHandler((filters.TEXT | filters.CONTACT) & ~filters.COMMAND, _cb),
+    ]
+    log = MessageHandler(filters.Text(frozenset(BUTTON_TEXTS)), _cb)
+    return menu, address, log
+
+
+def dispatch(handlers, log, update) -> None:
+    # What ConversationHandler.check_update (first match wins) and handler group 1 do
+    for handler in handlers:
+        if handler.check_update(update):
+            break
+    log.check_update(update)
+
+
+def make_update(text: str) -> Update:
+    return Update.de_json({
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "U"},
+            "text": text,
+        },
+    }, None)
+
+
+def bench(handlers, log, update, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        dispatch(handlers, log, update)
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200_000)
+    args = parser.parse_args()
+
+    cases = [
+        ("MENU, first button", "menu", "Показать меню на неделю"),
+        ("MENU, last button", "menu", "Связаться с человеком"),
+        ("MENU, no match", "menu", "привет"),
+        ("ADDRESS, free text", "address", "ул. Руставели 12, кв. 5"),
+    ]
+    variants = {"regex": regex_states(), "router": router_states()}
+    print(f"{'case':<22} {'regex ns':>10} {'router ns':>10} {'speedup':>8}")
+    for title, state, text in cases:
+        update = make_update(text)
+        results = {}
+        for name, (menu, address, log) in variants.items():
+            handlers = menu if state == "menu" else address
+            bench(handlers, log, update, args.iterations // 10)  # warm-up
+            results[name] = bench(handlers, log, update, args.iterations)
+        print(f"{title:<22} {results['regex']:>10.0f} {results['router']:>10.0f} {results['regex'] / results['router']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""Benchmark: latency of ``POST /api/v1/orders/calc`` versus ``weeks_ahead``.
+
+Calls the endpoint function directly against the database from ``DATABASE_URL``
+(one session per request, like ``get_session``) and prints, for each
+``weeks_ahead`` from 1 to 8, the number of SQL statements per request and the
+p50/p95 latency. With ``--seed`` missing menu weeks from ``--week-start`` on are
+created first, so every week is priced rather than reported as ``has_menu=False``.
+Compiled pricing tables are reused between requests; ``--cold`` drops them before
+every request to measure the database path.
+
+Usage::
+
+    python scripts/bench_order_calc.py [--requests 200] [--week-start 2024-03-18] [--seed] [--cold]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import event, select
+
+from backend.app.api.v1.orders import calculate_order
+from backend.app.api.v1.schemas import BasketSelection, CalcOrderRequest
+from backend.app.db.base import Base
+from backend.app.db.models.menu import DayOffer, MenuWeek
+from backend.app.db.session import SessionLocal, engine
+from backend.app.domain.orders.calculator import DAY_TO_INDEX
+from backend.app.domain.orders.pricing import pricing_tables
+
+MAX_WEEKS = 8  # CalcOrderRequest.weeks_ahead upper bound
+
+
+async def seed_weeks(week_start: date) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    starts = [week_start + timedelta(days=7 * idx) for idx in range(MAX_WEEKS)]
+    async with SessionLocal() as session:
+        result = await session.execute(select(MenuWeek.week_start).where(MenuWeek.week_start.in_(starts)))
+        existing = set(result.scalars())
+        for start in starts:
+            if start in existing:
+                continue
+            menu = MenuWeek(week_start=start, title=f"Бенчмарк {start.isoformat()}", is_published=True)
+            menu.day_offers = [DayOffer(day_of_week=day, items=[f"Блюдо {idx + 1}"]) for idx, day in enumerate(DAY_TO_INDEX)]
+            session.add(menu)
+        await session.commit()
+    await engine.dispose()  # the measurement runs in a new event loop
+    return MAX_WEEKS - len(existing)
+
+
+async def run(requests: int, week_start: date, cold: bool) -> None:
+    statements = 0
+
+    def count(*_args) -> None:
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    selections = [BasketSelection(day_of_week=day, portions=1) for day in DAY_TO_INDEX]
+    print(f"{'weeks':>5} {'sql/req':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for weeks_ahead in range(1, MAX_WEEKS + 1):
+        payload = CalcOrderRequest(week_start=week_start, selections=selections, weeks_ahead=weeks_ahead)
+        async with SessionLocal() as session:  # warm-up: connection pool, statement cache
+            await calculate_order(payload, session)
+        statements = 0
+        timings = []
+        for _ in range(requests):
+            if cold:
+                pricing_tables.clear()
+            started = time.perf_counter()
+            async with SessionLocal() as session:
+                await calculate_order(payload, session)
+            timings.append((time.perf_counter() - started) * 1000)
+        p50, p95 = (statistics.quantiles(timings, n=100, method="inclusive")[i] for i in (49, 94))
+        print(f"{weeks_ahead:>5} {statements / requests:>8.1f} {p50:>8.2f} {p95:>8.2f}")
+    event.remove(engine.sync_engine, "before_cursor_execute", count)
+    await engine.dispose()
+
+
+def main() -> None:
+    today = date.today()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per weeks_ahead value")
+    parser.add_argument("--week-start", type=date.fromisoformat, default=today - timedelta(days=today.weekday()))
+    parser.add_argument("--seed", action="store_true", help="create missing menu weeks before measuring")
+    parser.add_argument("--cold", action="store_true", help="drop cached pricing tables before every request")
+    args = parser.parse_args()
+    if args.seed:
+        print(f"Seeded {asyncio.run(seed_weeks(args.week_start))} menu weeks")
+    asyncio.run(run(args.requests, args.week_start, args.cold))
+
+
+if __name__ == "__main__":
+    main()
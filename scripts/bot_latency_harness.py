@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""Local latency harness for bot.py: update-to-reply time in polling vs webhook mode.
+
+The harness starts a fake Telegram Bot API server, launches ``bot.py`` against it
+(``BOT_API_BASE_URL``) in a scratch directory with a generated ``config_secret.py``
+and feeds it synthetic ``/order`` updates from distinct chats:
+
+* polling — updates are handed out through the fake ``getUpdates`` long poll;
+* webhook — updates are POSTed to the bot's webhook with the secret-token header
+  (a request without the header is expected to be rejected with 403).
+
+Latency is measured from the moment an update becomes available to the bot until
+the fake API receives the bot's ``sendMessage`` for that chat.
+
+Usage::
+
+    python scripts/bot_latency_harness.py --mode polling --updates 500 --concurrency 20
+    python scripts/bot_latency_harness.py --mode webhook --updates 500 --concurrency 20
+
+Webhook mode needs ``python-telegram-bot[webhooks]`` (tornado) in the bot environment.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+TOKEN = "123456:HARNESS"
+SECRET = "harness-secret"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Harness", "username": "harness_bot"}
+
+
+class FakeBotApi:
+    """Just enough of the Bot API for bot.py to start, receive updates and reply."""
+
+    def __init__(self) -> None:
+        self.pending: list[dict] = []
+        self.available = asyncio.Event()
+        self.ready = asyncio.Event()
+        self.replies: dict[int, float] = {}
+        self.reply_events: dict[int, asyncio.Event] = {}
+        self._message_id = 0
+
+    def push(self, update: dict) -> None:
+        self.pending.append(update)
+        self.available.set()
+
+    async def _params(self, request: Request) -> dict:
+        # PTB posts form-urlencoded fields with JSON-encoded values; uploads are not exercised here
+        if not request.headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+            return {}
+        params = {}
+        for key, value in parse_qsl((await request.body()).decode()):
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+        return params
+
+    async def handle(self, request: Request) -> JSONResponse:
+        method = request.path_params["method"]
+        params = await self._params(request)
+        if method == "getMe":
+            return JSONResponse({"ok": True, "result": BOT_USER})
+        if method == "getUpdates":
+            self.ready.set()
+            offset = int(params.get("offset") or 0)
+            self.pending = [u for u in self.pending if u["update_id"] >= offset]
+            if not self.pending:
+                self.available.clear()
+                try:
+                    await asyncio.wait_for(self.available.wait(), timeout=float(params.get("timeout") or 0) or 0.01)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self.pending[: int(params.get("limit") or 100)]
+            return JSONResponse({"ok": True, "result": batch})
+        if method == "setWebhook":
+            self.ready.set()
+            return JSONResponse({"ok": True, "result": True})
+        if method in {"sendMessage", "sendPhoto", "sendAnimation"}:
+            chat_id = int(params.get("chat_id"))
+            self.replies.setdefault(chat_id, time.perf_counter())
+            event = self.reply_events.get(chat_id)
+            if event is not None:
+                event.set()
+            self._message_id += 1
+            return JSONResponse({
+                "ok": True,
+                "result": {
+                    "message_id": self._message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": str(params.get("text") or ""),
+                },
+            })
+        return JSONResponse({"ok": True, "result": True})
+
+
+def synthetic_update(update_id: int, chat_id: int) -> dict:
+    text = "/order BLB-HARNESS"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Load"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len("/order")}],
+        },
+    }
+
+
+def write_config(workdir: Path, args: argparse.Namespace) -> None:
+    (workdir / "config_secret.py").write_text(
+        "\n".join([
+            f"BOT_TOKEN = {TOKEN!r}",
+            "ADMIN_ID = 1",
+            f"BOT_MODE = {args.mode!r}",
+            f"BOT_API_BASE_URL = 'http://127.0.0.1:{args.api_port}'",
+            f"WEBHOOK_URL = 'http://127.0.0.1:{args.webhook_port}'",
+            f"WEBHOOK_PORT = {args.webhook_port}",
+            f"WEBHOOK_SECRET = {SECRET!r}",
+            "",
+        ]),
+        encoding="utf-8",
+    )
+    menu = REPO_ROOT / "menu.json"
+    if menu.exists():
+        shutil.copy(menu, workdir / "menu.json")
+
+
+async def run(args: argparse.Namespace) -> int:
+    api = FakeBotApi()
+    app = Starlette(routes=[Route("/bot{token}/{method}", api.handle, methods=["POST", "GET"])])
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.api_port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+
+    workdir = Path(tempfile.mkdtemp(prefix="bot-harness-"))
+    write_config(workdir, args)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(workdir), str(args.bot_dir)]))
+    bot = subprocess.Popen([sys.executable, str(Path(args.bot_dir) / "bot.py")], cwd=workdir, env=env)
+    webhook_url = f"http://127.0.0.1:{args.webhook_port}/telegram"
+    try:
+        await asyncio.wait_for(api.ready.wait(), timeout=30)
+        async with httpx.AsyncClient(timeout=30) as client:
+            if args.mode == "webhook":
+                for _ in range(100):
+                    try:
+                        rejected = await client.post(webhook_url, json=synthetic_update(1, 10**9))
+                        break
+                    except httpx.TransportError:
+                        await asyncio.sleep(0.1)
+                else:
+                    print("webhook endpoint did not come up", file=sys.stderr)
+                    return 1
+                print(f"request without secret token -> HTTP {rejected.status_code}")
+
+            started: dict[int, float] = {}
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one(i: int) -> None:
+                chat_id = 10_000 + i
+                event = api.reply_events.setdefault(chat_id, asyncio.Event())
+                update = synthetic_update(1000 + i, chat_id)
+                async with semaphore:
+                    started[chat_id] = time.perf_counter()
+                    if args.mode == "webhook":
+                        await client.post(
+                            webhook_url, json=update,
+                            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+                        )
+                    else:
+                        api.push(update)
+                    await asyncio.wait_for(event.wait(), timeout=30)
+
+            wall = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.updates)))
+            wall = time.perf_counter() - wall
+
+        latencies = sorted((api.replies[c] - t) * 1000 for c, t in started.items())
+        q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        print(
+            f"mode={args.mode} updates={len(latencies)} concurrency={args.concurrency} "
+            f"throughput={len(latencies) / wall:.1f} upd/s"
+        )
+        print(
+            f"latency ms: p50={q[49]:.1f} p95={q[94]:.1f} p99={q[98]:.1f} "
+            f"max={latencies[-1]:.1f} mean={statistics.fmean(latencies):.1f}"
+        )
+        return 0
+    finally:
+        bot.terminate()
+        try:
+            bot.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        server.should_exit = True
+        await server_task
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--api-port", type=int, default=18081)
+    parser.add_argument("--webhook-port", type=int, default=18443)
+    parser.add_argument("--bot-dir", type=Path, default=REPO_ROOT, help="directory with bot.py and keyboards.py")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+"""In-process load harness for the order conversation of bot.py.
+
+Simulates the weekday pre-10:00 spike without Telegram: ``bot.py`` is imported in a
+scratch directory (generated ``config_secret.py``, seeded order history), and N
+simulated users walk ``start`` -> ``order_lunch`` -> ``select_day`` -> ``select_count``
+-> ``confirm_order`` through the real handler functions. Replies go to a stub ``Bot``
+whose ``_do_post`` answers every Bot API method locally (optionally after a fixed
+delay), so what is measured is the bot's own work: handler code, storage and logging.
+
+Reported:
+
+* handler latency per step and overall (p50/p95/p99/max);
+* bytes written to disk by the process (``wchar`` from ``/proc/self/io``), split into
+  the log file and everything else (storage), with background writes flushed;
+* event-loop blocking: every callback the loop runs is timed; callbacks longer than
+  ``--stall-ms`` are time during which no other user was served;
+* how long the outbox (admin notifications, success animation) takes to drain after
+  the last flow;
+* with ``--admin-reports``, the latency of the admin's full-week report requested
+  while the customers are ordering.
+
+Next-week ordering is opened in the seeded order window, so day cutoffs do not depend
+on the time of day the harness is run. Seeded users already have an address, so every
+flow ends on the confirmation screen.
+
+Usage::
+
+    python scripts/bot_load_harness.py --users 300 --history 20000 --concurrency 50
+    python scripts/bot_load_harness.py --backend sqlite --api-latency-ms 40
+    python scripts/bot_load_harness.py --history 40000 --history-weeks 2 --admin-reports 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from telegram import Bot, Update
+from telegram.ext import Application, CallbackContext
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+TOKEN = "123456:LOADTEST"
+ADMIN_ID = 1
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Load", "username": "load_bot"}
+DAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница"]
+STEPS = ["start", "order_lunch", "select_day", "select_count", "confirm_order"]
+
+
+class StubBot(Bot):
+    """Bot that answers Bot API calls locally instead of going to the network."""
+
+    def __init__(self, token: str, latency: float = 0.0):
+        super().__init__(token)
+        with self._unfrozen():
+            self._latency = latency
+            self._message_id = 0
+            self.calls: dict[str, int] = {}
+
+    async def _do_post(self, endpoint, data, *, read_timeout=None, write_timeout=None,
+                       connect_timeout=None, pool_timeout=None):
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        if endpoint == "getMe":
+            return BOT_USER
+        if not endpoint.startswith("send"):
+            return True
+        self._message_id += 1
+        chat_id = int(data.get("chat_id", 0))
+        result = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": str(data.get("text") or ""),
+        }
+        file_id = f"stub-{endpoint}-{self._message_id}"
+        if endpoint == "sendPhoto":
+            result["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1}]
+        elif endpoint == "sendAnimation":
+            result["animation"] = {
+                "file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1, "duration": 1,
+            }
+        return result
+
+
+class LoopMonitor:
+    """Times every callback the event loop runs (each step of every task).
+
+    While one callback runs, no other update is served, so the long ones are the time the
+    loop was blocked. Work handed to threads (storage preload, the JSON writer) is not
+    counted.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.busy = 0.0
+        self.callbacks = 0
+        self.worst = 0.0
+        self.blocked = 0.0  # time spent in callbacks longer than threshold
+        self.stalls = 0
+        self._original = None
+
+    def start(self) -> None:
+        original = self._original = asyncio.events.Handle._run
+        monitor = self
+
+        def _run(handle):
+            t = time.perf_counter()
+            try:
+                return original(handle)
+            finally:
+                spent = time.perf_counter() - t
+                monitor.busy += spent
+                monitor.callbacks += 1
+                monitor.worst = max(monitor.worst, spent)
+                if spent > monitor.threshold:
+                    monitor.blocked += spent
+                    monitor.stalls += 1
+
+        asyncio.events.Handle._run = _run
+
+    def stop(self) -> None:
+        asyncio.events.Handle._run = self._original
+
+
+def io_written() -> int | None:
+    try:
+        with open("/proc/self/io", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def next_monday(today: date) -> date:
+    return today + timedelta(days=7 - today.weekday())
+
+
+def write_workdir(workdir: Path, args: argparse.Namespace) -> None:
+    (workdir / "config_secret.py").write_text(
+        f"BOT_TOKEN = {TOKEN!r}\nADMIN_ID = {ADMIN_ID}\nSTORAGE_BACKEND = {args.backend!r}\n",
+        encoding="utf-8",
+    )
+    menu = REPO_ROOT / "menu.json"
+    if menu.exists():
+        shutil.copy(menu, workdir / "menu.json")
+    else:
+        data = {
+            "week": "Нагрузочный тест",
+            "menu": {day: [f"Суп {i}", f"Горячее {i}", f"Салат {i}"] for i, day in enumerate(DAYS, 1)},
+        }
+        (workdir / "menu.json").write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+
+def seed(args: argparse.Namespace, user_ids: list[int]) -> None:
+    """Order history for past and current weeks plus saved profiles, via the bot's storage layer."""
+    from storage import open_storage
+
+    rng = random.Random(args.seed)
+    store = open_storage(args.backend, "orders.json", "users.json", "order_window.json", "bot.sqlite3", "orders")
+    today = date.today()
+    this_week = today - timedelta(days=today.weekday())
+    for uid in user_ids:
+        store.put_user(uid, {"address": f"ул. Нагрузочная {uid % 500}, кв. {uid % 97}", "phone": "+995555000000"})
+    population = user_ids + list(range(900_000, 900_000 + max(args.users, 100)))
+    now = int(time.time())
+    for i in range(args.history):
+        week = this_week - timedelta(weeks=rng.randrange(args.history_weeks))
+        uid = rng.choice(population)
+        store.put_order(f"SEED-{i:07d}", {
+            "user_id": uid,
+            "username": None,
+            "day": rng.choice(DAYS),
+            "count": str(rng.randint(1, 4)),
+            "menu": "Суп, Горячее, Салат",
+            "address": "ул. Нагрузочная",
+            "phone": None,
+            "status": rng.choice(["new", "new", "new", "cancelled_by_user"]),
+            "created_at": now - (this_week - week).days * 86400 - rng.randrange(86400),
+            "delivery_week_start": week.isoformat(),
+            "next_week": False,
+        })
+    store.save_order_window({"next_week_enabled": True, "week_start": next_monday(today).isoformat()})
+    store.close()
+
+
+def make_update(bot: Bot, update_id: int, uid: int, text: str) -> Update:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": uid, "type": "private", "first_name": "Load"},
+        "from": {"id": uid, "is_bot": False, "first_name": "Load", "username": f"load{uid}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return Update.de_json({"update_id": update_id, "message": message}, bot)
+
+
+def percentiles(values: list[float]) -> str:
+    if not values:
+        return "-"
+    ms = sorted(v * 1000 for v in values)
+    q = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    return f"p50={q[49]:7.2f} p95={q[94]:7.2f} p99={q[98]:7.2f} max={ms[-1]:7.2f}"
+
+
+async def run(args: argparse.Namespace) -> int:
+    import bot as botmod
+    from logqueue import stop_queue_logging
+
+    expected = {
+        "start": botmod.MENU,
+        "order_lunch": botmod.ORDER_DAY,
+        "select_day": botmod.ORDER_COUNT,
+        "select_count": botmod.CONFIRM,
+        "confirm_order": botmod.MENU,
+    }
+    # The bot's console echo would drown the report; the log file is kept and measured
+    botmod.console_handler.setStream(open(os.devnull, "w", encoding="utf-8"))
+    stub = StubBot(TOKEN, latency=args.api_latency_ms / 1000)
+    application = Application.builder().bot(stub).build()
+    await stub.initialize()
+
+    t = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, botmod.open_bot_storage)
+    await asyncio.get_running_loop().run_in_executor(None, botmod.storage.preload)
+    preload = time.perf_counter() - t
+
+    rng = random.Random(args.seed + 1)
+    latencies: dict[str, list[float]] = {step: [] for step in STEPS}
+    failures: dict[str, int] = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    update_ids = iter(range(1, 10**9))
+
+    async def user_flow(uid: int) -> None:
+        texts = {
+            "start": "/start",
+            "order_lunch": "Заказать обед",
+            "select_day": rng.choice(DAYS),
+            "select_count": str(rng.randint(1, 4)),
+            "confirm_order": "Подтверждаю",
+        }
+        async with semaphore:
+            for step in STEPS:
+                update = make_update(stub, next(update_ids), uid, texts[step])
+                context = CallbackContext.from_update(update, application)
+                t0 = time.perf_counter()
+                state = await getattr(botmod, step)(update, context)
+                latencies[step].append(time.perf_counter() - t0)
+                if state != expected[step]:
+                    failures[step] = failures.get(step, 0) + 1
+                    return
+
+    admin_latencies: list[float] = []
+
+    async def admin_reports() -> None:
+        # The admin keeps pressing "Неделя целиком" while customers are ordering
+        for _ in range(args.admin_reports):
+            update = make_update(stub, next(update_ids), ADMIN_ID, "Неделя целиком")
+            context = CallbackContext.from_update(update, application)
+            t0 = time.perf_counter()
+            await botmod.admin_report_pick(update, context)
+            admin_latencies.append(time.perf_counter() - t0)
+            await asyncio.sleep(args.admin_interval_ms / 1000)
+
+    log_path = Path("logs") / "bot.log"
+    log_before = log_path.stat().st_size if log_path.exists() else 0
+    io_before = io_written()
+    monitor = LoopMonitor(args.stall_ms / 1000)
+    monitor.start()
+    botmod.outbox.start(stub)
+    wall = time.perf_counter()
+    await asyncio.gather(
+        admin_reports(),
+        *(user_flow(uid) for uid in range(args.first_user, args.first_user + args.users)),
+    )
+    wall = time.perf_counter() - wall
+    # Admin notifications go out in the background; wait for the outbox to drain
+    drain = time.perf_counter()
+    while len(botmod.outbox) and time.perf_counter() - drain < 60:
+        await asyncio.sleep(0.01)
+    drain = time.perf_counter() - drain
+    outbox_left = len(botmod.outbox)
+    await botmod.outbox.stop()
+    # Background writes of the JSON backend belong to the byte count
+    writer = getattr(botmod.storage, "writer", None)
+    if writer is not None:
+        await asyncio.get_running_loop().run_in_executor(None, writer.flush)
+    monitor.stop()
+    # Drain the logging queue so the log file size is final
+    stop_queue_logging(botmod.log_listener)
+    io_after = io_written()
+    log_after = log_path.stat().st_size if log_path.exists() else 0
+
+    total = [v for values in latencies.values() for v in values]
+    flows = len(latencies["confirm_order"]) - failures.get("confirm_order", 0)
+    print(
+        f"backend={args.backend} users={args.users} history={args.history} concurrency={args.concurrency} "
+        f"api_latency={args.api_latency_ms}ms"
+    )
+    print(f"storage preload: {preload * 1000:.1f} ms")
+    print(f"completed flows: {flows}/{args.users} in {wall:.2f} s ({flows / wall:.1f} orders/s)")
+    if failures:
+        print(f"unexpected states: {failures}")
+    print("handler latency, ms:")
+    for step in STEPS:
+        print(f"  {step:<14} {percentiles(latencies[step])}")
+    print(f"  {'all':<14} {percentiles(total)}")
+    if admin_latencies:
+        print(f"  {'admin report':<14} {percentiles(admin_latencies)} ({len(admin_latencies)} requests)")
+    if io_before is not None and io_after is not None:
+        written = io_after - io_before
+        log_bytes = log_after - log_before
+        print(
+            f"disk bytes written: {written} total, {log_bytes} log, {written - log_bytes} storage/other "
+            f"({(written - log_bytes) / max(flows, 1):.0f} per order)"
+        )
+    else:
+        print("disk bytes written: n/a (/proc/self/io is not available)")
+    print(
+        f"event loop: busy {monitor.busy * 1000:.1f} ms in {monitor.callbacks} callbacks "
+        f"({monitor.busy / wall * 100:.1f}% of wall time), worst callback {monitor.worst * 1000:.2f} ms, "
+        f"{monitor.stalls} callbacks > {args.stall_ms:g} ms ({monitor.blocked * 1000:.1f} ms)"
+    )
+    print(f"outbox: drained {drain * 1000:.0f} ms after the last flow, {outbox_left} left")
+    print(f"Bot API calls: {dict(sorted(stub.calls.items()))}")
+    botmod.storage.close()
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200, help="simulated users, one order flow each")
+    parser.add_argument("--history", type=int, default=10_000, help="orders seeded before the run")
+    parser.add_argument("--history-weeks", type=int, default=8, help="seeded orders spread over this many weeks")
+    parser.add_argument("--concurrency", type=int, default=50, help="users in the middle of a flow at once")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="delay of every stub Bot API call")
+    parser.add_argument("--stall-ms", type=float, default=5.0, help="callbacks longer than this count as stalls")
+    parser.add_argument("--admin-reports", type=int, default=0,
+                        help="full-week admin reports requested during the run")
+    parser.add_argument("--admin-interval-ms", type=float, default=50.0, help="pause between admin reports")
+    parser.add_argument("--first-user", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bot-dir", type=Path, default=REPO_ROOT, help="directory with bot.py and keyboards.py")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bot-load-"))
+    sys.path[:0] = [str(workdir), str(args.bot_dir)]
+    os.chdir(workdir)
+    try:
+        write_workdir(workdir, args)
+        seed(args, list(range(args.first_user, args.first_user + args.users)))
+        code = asyncio.run(run(args))
+    finally:
+        os.chdir(REPO_ROOT)
+        if args.keep:
+            print(f"scratch directory: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ from sqlalchemy import select
 from backend.app.db.base import Base
 from backend.app.db.models.menu import DayOffer, MenuWeek
 from backend.app.db.session import engine, SessionLocal
+from backend.app.domain.menu.cache import invalidate_menu_cache
 
 
 async def seed_menu() -> None:
@@ -28,6 +29,7 @@ async def seed_menu() -> None:
         ]
         session.add(menu)
         await session.commit()
+        await invalidate_menu_cache()
         print("Seeded default menu")
 
 
@@ -0,0 +1,1319 @@
+# Хранилище заказов, профилей и окна приёма заказов бота.
+# Два бэкенда за общим интерфейсом Storage:
+#  - JsonStorage: файлы читаются один раз на процесс, дальше все запросы обслуживаются
+#    из памяти по вторичным индексам. Заказы разбиты по неделям доставки (WeeklyOrderStore):
+#    у каждой недели свой снимок и журнал (JSONL), который периодически сворачивается
+#    в снимок в фоновом потоке. Прошедшие недели уходят в gzip-архивы.
+#    Сама запись на диск идёт в отдельном потоке BackgroundWriter: обработчики бота
+#    только ставят изменения в очередь, а записи за короткое окно сбрасываются одним fsync.
+#  - SqliteStorage: одна база SQLite в режиме WAL с индексами по пользователю,
+#    неделе доставки, дню и статусу; изменения идут в транзакциях.
+
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta
+
+JOURNAL_COMPACT_EVERY = 500  # записей журнала между снимками
+GROUP_COMMIT_WINDOW = 0.05  # секунд: записи внутри окна попадают в один сброс на диск
+
+
+def _write_json_atomic(path: str, data, fsync: bool = False) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _replay_journal(path: str, apply) -> int:
+    """Применяет записи журнала по порядку. Оборванная последняя строка (сбой при записи) пропускается."""
+    if not os.path.exists(path):
+        return 0
+    applied = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logging.warning(f"Пропущена повреждённая запись журнала {path}:{lineno}")
+                continue
+            if isinstance(record, dict):
+                apply(record)
+                applied += 1
+    return applied
+
+
+def _open_for_append(path: str):
+    # Оборванную строку после сбоя закрываем переводом строки, чтобы не склеить её со следующей записью
+    torn = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+    handle = open(path, "a", encoding="utf-8")
+    if torn:
+        handle.write("\n")
+    return handle
+
+
+class BackgroundWriter:
+    """Выделенный поток записи файлов с групповым коммитом.
+
+    append(path, line) — дописать строку (журнал), replace(path, data) — атомарно
+    перезаписать JSON-файл (побеждает последнее значение). Всё, что пришло в течение
+    ``window`` секунд после первой записи, сбрасывается одной операцией на файл.
+    Для каждого пути есть свой замок: другие операции с файлом (ротация журнала)
+    берут его через file_lock().
+    """
+
+    def __init__(self, window: float = GROUP_COMMIT_WINDOW):
+        self.window = window
+        self._cond = threading.Condition()
+        self._appends: dict[str, list[str]] = {}
+        self._replaces: dict[str, object] = {}
+        self._file_locks: dict[str, threading.Lock] = {}
+        self._submitted = 0
+        self._completed = 0
+        self._closing = False
+        self._urgent = False
+        self.flushes = 0
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def file_lock(self, path: str) -> threading.Lock:
+        with self._cond:
+            return self._file_locks.setdefault(path, threading.Lock())
+
+    def append(self, path: str, line: str) -> None:
+        with self._cond:
+            self._appends.setdefault(path, []).append(line)
+            self._submitted += 1
+            self._cond.notify_all()
+
+    def replace(self, path: str, data) -> None:
+        with self._cond:
+            self._replaces[path] = data
+            self._submitted += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Ждёт, пока всё поставленное в очередь до вызова окажется на диске."""
+        with self._cond:
+            target = self._submitted
+            self._urgent = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._completed >= target, timeout)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._appends or self._replaces or self._closing)
+                if not self._appends and not self._replaces:
+                    return
+                # Окно группового коммита: копим записи, пока не истечёт window или не попросят flush()
+                deadline = time.monotonic() + self.window
+                while not self._closing and not self._urgent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._urgent = False
+                appends, self._appends = self._appends, {}
+                replaces, self._replaces = self._replaces, {}
+                batch = self._submitted
+            self._write(appends, replaces)
+            with self._cond:
+                self._completed = batch
+                self.flushes += 1
+                self._cond.notify_all()
+
+    def _write(self, appends: dict[str, list[str]], replaces: dict[str, object]) -> None:
+        for path, lines in appends.items():
+            try:
+                with self.file_lock(path):
+                    with _open_for_append(path) as f:
+                        f.write("".join(lines))
+                        f.flush()
+                        os.fsync(f.fileno())
+            except Exception as e:
+                logging.error(f"Не удалось дописать {path}: {e}")
+        for path, data in replaces.items():
+            try:
+                with self.file_lock(path):
+                    _write_json_atomic(path, data, fsync=True)
+            except Exception as e:
+                logging.error(f"Не удалось сохранить {path}: {e}")
+
+
+def _read_json_dict(path: str) -> dict:
+    try:
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            return data if isinstance(data, dict) else {}
+    except Exception as e:
+        logging.error(f"Не удалось загрузить {path}: {e}")
+        return {}
+
+
+def week_start_of(d: date) -> date:
+    return d - timedelta(days=d.weekday())
+
+
+def order_week(payload: dict) -> date | None:
+    """Неделя доставки заказа: delivery_week_start, а для старых записей — неделя created_at."""
+    raw = payload.get("delivery_week_start")
+    if raw:
+        try:
+            return date.fromisoformat(str(raw))
+        except Exception:
+            pass
+    try:
+        ts = int(payload.get("created_at") or 0)
+    except Exception:
+        return None
+    if not ts:
+        return None
+    return week_start_of(datetime.fromtimestamp(ts).date())
+
+
+def order_user_id(payload: dict) -> int | None:
+    try:
+        uid = int(payload.get("user_id") or 0)
+    except Exception:
+        return None
+    return uid or None
+
+
+def is_cancelled(payload: dict) -> bool:
+    return str(payload.get("status") or "").lower().startswith("cancel")
+
+
+class OrderRepository:
+    """Заказы в памяти с индексами по пользователю, (неделя, день) и статусу.
+
+    На диске: снимок ``path`` + журнал ``path.journal``. Каждое изменение — одна
+    строка журнала; после ``compact_every`` записей журнал ротируется, а снимок
+    пишется в фоне. Все операции журнала идемпотентны, поэтому повторное
+    применение после сбоя во время свёртки безопасно.
+    """
+
+    def __init__(self, path: str, compact_every: int = JOURNAL_COMPACT_EVERY, writer: BackgroundWriter | None = None):
+        self.path = path
+        self.writer = writer
+        self.journal_path = path + ".journal"
+        self.compacting_path = path + ".journal.compacting"
+        self.compact_every = compact_every
+        self._journal = None
+        self._journal_records = 0
+        self._compaction: threading.Thread | None = None
+        self._orders: dict[str, dict] = {}
+        self._by_user: dict[int, set[str]] = {}
+        self._by_week_day: dict[tuple[date, str], set[str]] = {}
+        self._by_user_slot: dict[tuple[int, date, str], set[str]] = {}
+        self._by_status: dict[str, set[str]] = {}
+        self._loaded = False
+
+    # --- индексы ---
+
+    @staticmethod
+    def _index_keys(payload: dict) -> tuple[int | None, date | None, str, str]:
+        return (
+            order_user_id(payload),
+            order_week(payload),
+            str(payload.get("day") or ""),
+            str(payload.get("status") or "").lower(),
+        )
+
+    def _index(self, oid: str, payload: dict) -> None:
+        uid, week, day, status = self._index_keys(payload)
+        if uid is not None:
+            self._by_user.setdefault(uid, set()).add(oid)
+        if week is not None:
+            self._by_week_day.setdefault((week, day), set()).add(oid)
+            if uid is not None:
+                self._by_user_slot.setdefault((uid, week, day), set()).add(oid)
+        self._by_status.setdefault(status, set()).add(oid)
+
+    def _unindex(self, oid: str, payload: dict) -> None:
+        uid, week, day, status = self._index_keys(payload)
+        for index, key in (
+            (self._by_user, uid),
+            (self._by_week_day, (week, day)),
+            (self._by_user_slot, (uid, week, day)),
+            (self._by_status, status),
+        ):
+            bucket = index.get(key)
+            if bucket is None:
+                continue
+            bucket.discard(oid)
+            if not bucket:
+                del index[key]
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        for oid, payload in _read_json_dict(self.path).items():
+            if isinstance(payload, dict):
+                self._orders[oid] = payload
+                self._index(oid, payload)
+        # Незавершённые свёртки предыдущего запуска (от старых к новым), затем текущий журнал
+        _replay_journal(self.compacting_path + ".prev", self._apply)
+        _replay_journal(self.compacting_path, self._apply)
+        self._journal_records = _replay_journal(self.journal_path, self._apply)
+        self._loaded = True
+
+    # --- журнал ---
+
+    def _apply(self, record: dict) -> None:
+        oid = record.get("id")
+        if not oid:
+            return
+        if record.get("op") == "put" and isinstance(record.get("order"), dict):
+            self._replace(oid, dict(record["order"]))
+        elif record.get("op") == "update" and isinstance(record.get("fields"), dict):
+            current = self._orders.get(oid)
+            if current is not None:
+                self._replace(oid, current | record["fields"])
+        elif record.get("op") == "delete":
+            old = self._orders.pop(oid, None)
+            if old is not None:
+                self._unindex(oid, old)
+
+    def _replace(self, oid: str, payload: dict) -> None:
+        # Заказы не меняются на месте: снимок для фоновой свёртки — поверхностная копия словаря
+        old = self._orders.get(oid)
+        if old is not None:
+            self._unindex(oid, old)
+        self._orders[oid] = payload
+        self._index(oid, payload)
+
+    def _append(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        if self.writer is not None:
+            self.writer.append(self.journal_path, line)
+        else:
+            try:
+                if self._journal is None:
+                    self._journal = _open_for_append(self.journal_path)
+                self._journal.write(line)
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+            except Exception as e:
+                logging.error(f"Не удалось записать журнал {self.journal_path}: {e}")
+                return
+        self._journal_records += 1
+        if self._journal_records >= self.compact_every:
+            self.compact(background=True)
+
+    def compact(self, background: bool = False) -> bool:
+        """Сворачивает журнал в снимок. Возвращает False, если свёртка уже идёт."""
+        self._ensure_loaded()
+        if self._compaction is not None and self._compaction.is_alive():
+            return False
+        if os.path.exists(self.compacting_path) and not os.path.exists(self.compacting_path + ".prev"):
+            # Прошлая свёртка не дошла до конца: её записи уже в памяти и попадут в новый снимок
+            os.replace(self.compacting_path, self.compacting_path + ".prev")
+        elif os.path.exists(self.compacting_path):
+            with open(self.compacting_path, "r", encoding="utf-8") as src, open(self.compacting_path + ".prev", "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+            os.remove(self.compacting_path)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        # Записи, которые поток записи сбросит после ротации, попадут в новый журнал:
+        # они уже учтены в снимке, а повторное применение идемпотентно
+        if self.writer is not None:
+            with self.writer.file_lock(self.journal_path):
+                if os.path.exists(self.journal_path):
+                    os.replace(self.journal_path, self.compacting_path)
+        elif os.path.exists(self.journal_path):
+            os.replace(self.journal_path, self.compacting_path)
+        self._journal_records = 0
+        snapshot = dict(self._orders)
+        if background:
+            self._compaction = threading.Thread(
+                target=self._write_snapshot, args=(snapshot,), name="orders-compaction", daemon=True
+            )
+            self._compaction.start()
+        else:
+            self._write_snapshot(snapshot)
+        return True
+
+    def _write_snapshot(self, snapshot: dict) -> None:
+        try:
+            _write_json_atomic(self.path, snapshot, fsync=True)
+            for leftover in (self.compacting_path, self.compacting_path + ".prev"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        except Exception as e:
+            logging.error(f"Не удалось свернуть журнал {self.journal_path}: {e}")
+
+    def close(self) -> None:
+        if self._compaction is not None:
+            self._compaction.join()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    # --- чтение ---
+
+    def get(self, oid: str) -> dict | None:
+        self._ensure_loaded()
+        payload = self._orders.get(oid)
+        return dict(payload) if payload is not None else None
+
+    def __contains__(self, oid: str) -> bool:
+        self._ensure_loaded()
+        return oid in self._orders
+
+    def items(self) -> list[tuple[str, dict]]:
+        self._ensure_loaded()
+        return [(oid, dict(p)) for oid, p in self._orders.items()]
+
+    def _collect(self, oids) -> list[tuple[str, dict]]:
+        return [(oid, dict(self._orders[oid])) for oid in oids if oid in self._orders]
+
+    def for_user(self, uid: int, week: date | None = None) -> list[tuple[str, dict]]:
+        self._ensure_loaded()
+        oids = self._by_user.get(int(uid), ())
+        if week is None:
+            return self._collect(oids)
+        return [(oid, p) for oid, p in self._collect(oids) if order_week(p) == week]
+
+    def for_week(self, week: date, day: str | None = None) -> list[tuple[str, dict]]:
+        self._ensure_loaded()
+        if day is not None:
+            return self._collect(self._by_week_day.get((week, day), ()))
+        result: list[tuple[str, dict]] = []
+        for (w, _), oids in self._by_week_day.items():
+            if w == week:
+                result.extend(self._collect(oids))
+        return result
+
+    def for_status(self, status: str) -> list[tuple[str, dict]]:
+        self._ensure_loaded()
+        return self._collect(self._by_status.get(status.lower(), ()))
+
+    def find_active(self, uid: int, day: str, week: date) -> tuple[str, dict] | None:
+        """Последний неотменённый заказ пользователя на день недели — O(1) по индексу."""
+        self._ensure_loaded()
+        best: tuple[str, dict] | None = None
+        for oid in self._by_user_slot.get((int(uid), week, day), ()):
+            payload = self._orders[oid]
+            if is_cancelled(payload):
+                continue
+            if best is None or int(payload.get("created_at") or 0) > int(best[1].get("created_at") or 0):
+                best = (oid, payload)
+        return (best[0], dict(best[1])) if best else None
+
+    def created_between(self, start_ts: int, end_ts: int) -> list[tuple[str, dict]]:
+        self._ensure_loaded()
+        return [
+            (oid, dict(p)) for oid, p in self._orders.items()
+            if start_ts <= int(p.get("created_at") or 0) <= end_ts
+        ]
+
+    def user_ids(self) -> set[int]:
+        self._ensure_loaded()
+        return set(self._by_user.keys())
+
+    # --- запись ---
+
+    def put(self, oid: str, payload: dict) -> None:
+        self._ensure_loaded()
+        payload = dict(payload)
+        self._replace(oid, payload)
+        self._append({"op": "put", "id": oid, "order": payload})
+
+    def update(self, oid: str, **fields) -> bool:
+        """Частичное обновление полей заказа. Возвращает False, если заказа нет."""
+        self._ensure_loaded()
+        current = self._orders.get(oid)
+        if current is None:
+            return False
+        self._replace(oid, current | fields)
+        self._append({"op": "update", "id": oid, "fields": fields})
+        return True
+
+    def remove(self, oid: str) -> bool:
+        self._ensure_loaded()
+        old = self._orders.pop(oid, None)
+        if old is None:
+            return False
+        self._unindex(oid, old)
+        self._append({"op": "delete", "id": oid})
+        return True
+
+    def shard_files(self) -> list[str]:
+        """Все файлы репозитория на диске: снимок и журналы."""
+        return [
+            path for path in (self.path, self.journal_path, self.compacting_path, self.compacting_path + ".prev")
+            if os.path.exists(path)
+        ]
+
+
+UNDATED_WEEK = "undated"  # шард для заказов без недели доставки и без created_at
+
+
+def _week_key(week: date | None) -> str:
+    return week.isoformat() if week is not None else UNDATED_WEEK
+
+
+class WeeklyOrderStore:
+    """Заказы, разбитые по неделе доставки: ``root/<неделя>.json`` + журнал на каждую неделю.
+
+    Горячие шарды (текущая, следующая и ещё не архивированные недели) держатся в памяти,
+    так что запросы за неделю касаются только её шарда. archive_before() сворачивает
+    прошедшие недели в ``root/archive/<неделя>.json.gz``; индекс ``archive/index.json``
+    (ID заказа → неделя, пользователь) позволяет найти архивный заказ, не открывая
+    остальные архивы. Запись в архивную неделю возвращает её в горячие шарды.
+    При первом запуске монолитный orders.json с журналом раскладывается по неделям.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        legacy_path: str | None = None,
+        compact_every: int = JOURNAL_COMPACT_EVERY,
+        writer: BackgroundWriter | None = None,
+    ):
+        self.root = root
+        self.archive_root = os.path.join(root, "archive")
+        self.archive_index_path = os.path.join(self.archive_root, "index.json")
+        self.legacy_path = legacy_path
+        self.compact_every = compact_every
+        self.writer = writer
+        self._lock = threading.RLock()
+        self._shards: dict[str, OrderRepository] = {}
+        self._hot: dict[str, str] = {}  # ID заказа -> неделя горячего шарда
+        self._archived: dict[str, list] = {}  # ID заказа -> [неделя, user_id]
+        self._archive_cache: tuple[str, OrderRepository] | None = None
+        self._archive_lock = threading.Lock()  # один archive_before за раз
+        self._archiving: set[str] = set()  # недели, которые сейчас сворачиваются в архив
+        self._archive_dirty: set[str] = set()  # из них изменённые после снимка: остаются горячими
+        self._loaded = False
+
+    # --- файлы ---
+
+    def _shard_path(self, key: str) -> str:
+        return os.path.join(self.root, key + ".json")
+
+    def _archive_path(self, key: str) -> str:
+        return os.path.join(self.archive_root, key + ".json.gz")
+
+    def _open_shard(self, key: str) -> OrderRepository:
+        shard = OrderRepository(self._shard_path(key), compact_every=self.compact_every, writer=self.writer)
+        self._shards[key] = shard
+        for oid, _ in shard.items():
+            self._hot[oid] = key
+        return shard
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        os.makedirs(self.archive_root, exist_ok=True)
+        if self.legacy_path and OrderRepository(self.legacy_path).shard_files():
+            self._migrate_legacy()
+        keys = {
+            name.split(".json", 1)[0]
+            for name in os.listdir(self.root)
+            if ".json" in name and os.path.isfile(os.path.join(self.root, name))
+        }
+        for key in sorted(keys):
+            self._open_shard(key)
+        index = _read_json_dict(self.archive_index_path)
+        self._archived = {oid: entry for oid, entry in index.items() if isinstance(entry, list) and len(entry) == 2}
+        self._loaded = True
+
+    def _migrate_legacy(self) -> None:
+        legacy = OrderRepository(self.legacy_path)
+        by_week: dict[str, dict] = {}
+        for oid, payload in legacy.items():
+            by_week.setdefault(_week_key(order_week(payload)), {})[oid] = payload
+        for key, orders in by_week.items():
+            path = self._shard_path(key)
+            # Уже разложенные недели (сбой посреди миграции) дополняются, а не затираются
+            merged = _read_json_dict(path) | orders
+            _write_json_atomic(path, merged, fsync=True)
+        legacy.close()
+        for path in legacy.shard_files():
+            os.replace(path, path + ".migrated")
+        logging.info(f"Заказы из {self.legacy_path} разложены по неделям в {self.root}: {len(by_week)} шт.")
+
+    def _load_archive(self, key: str) -> OrderRepository | None:
+        if self._archive_cache is not None and self._archive_cache[0] == key:
+            return self._archive_cache[1]
+        path = self._archive_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logging.error(f"Не удалось прочитать архив {path}: {e}")
+            return None
+        # Только для чтения: у репозитория нет файлов на диске, записи в него не идут
+        repo = OrderRepository(os.path.join(self.archive_root, key + ".readonly"))
+        repo._loaded = True
+        for oid, payload in (data if isinstance(data, dict) else {}).items():
+            if isinstance(payload, dict):
+                repo._replace(oid, payload)
+        self._archive_cache = (key, repo)
+        return repo
+
+    def _repo(self, key: str) -> OrderRepository | None:
+        """Шард недели для чтения: горячий или (если неделя в архиве) прочитанный из gzip."""
+        shard = self._shards.get(key)
+        if shard is not None:
+            return shard
+        return self._load_archive(key)
+
+    def _writable(self, key: str) -> OrderRepository:
+        if key in self._archiving:
+            self._archive_dirty.add(key)
+        shard = self._shards.get(key)
+        if shard is not None:
+            return shard
+        archived = self._load_archive(key)
+        if archived is not None:
+            # Изменение архивной недели: возвращаем её в горячие шарды
+            _write_json_atomic(self._shard_path(key), dict(archived.items()), fsync=True)
+            os.remove(self._archive_path(key))
+            self._archive_cache = None
+            logging.info(f"Неделя {key} возвращена из архива")
+        return self._open_shard(key)
+
+    # --- чтение ---
+
+    def get(self, oid: str) -> dict | None:
+        with self._lock:
+            self._ensure_loaded()
+            key = self._hot.get(oid)
+            if key is None and oid in self._archived:
+                key = self._archived[oid][0]
+            repo = self._repo(key) if key is not None else None
+            return repo.get(oid) if repo is not None else None
+
+    def __contains__(self, oid: str) -> bool:
+        return self.get(oid) is not None
+
+    def items(self) -> list[tuple[str, dict]]:
+        """Все заказы, включая архивные (импорт в SQLite, выгрузки)."""
+        with self._lock:
+            self._ensure_loaded()
+            result: list[tuple[str, dict]] = []
+            for shard in self._shards.values():
+                result.extend(shard.items())
+            for key in sorted({entry[0] for entry in self._archived.values()} - set(self._shards)):
+                repo = self._load_archive(key)
+                if repo is not None:
+                    result.extend(repo.items())
+            return result
+
+    def for_week(self, week: date, day: str | None = None) -> list[tuple[str, dict]]:
+        with self._lock:
+            self._ensure_loaded()
+            repo = self._repo(_week_key(week))
+            return repo.for_week(week, day) if repo is not None else []
+
+    def for_user(self, uid: int, week: date | None = None) -> list[tuple[str, dict]]:
+        with self._lock:
+            self._ensure_loaded()
+            if week is not None:
+                repo = self._repo(_week_key(week))
+                return repo.for_user(uid) if repo is not None else []
+            result: list[tuple[str, dict]] = []
+            for shard in self._shards.values():
+                result.extend(shard.for_user(uid))
+            archived_weeks = {
+                entry[0] for oid, entry in self._archived.items()
+                if entry[1] == int(uid) and oid not in self._hot
+            }
+            for key in sorted(archived_weeks - set(self._shards)):
+                repo = self._load_archive(key)
+                if repo is not None:
+                    result.extend(repo.for_user(uid))
+            return result
+
+    def find_active(self, uid: int, day: str, week: date) -> tuple[str, dict] | None:
+        with self._lock:
+            self._ensure_loaded()
+            repo = self._repo(_week_key(week))
+            return repo.find_active(uid, day, week) if repo is not None else None
+
+    def created_between(self, start_ts: int, end_ts: int) -> list[tuple[str, dict]]:
+        """Заказы, созданные в интервале. Заказ создаётся не раньше чем за неделю до
+        недели доставки, поэтому просматриваются только недели интервала и следующая за ним."""
+        with self._lock:
+            self._ensure_loaded()
+            week = week_start_of(datetime.fromtimestamp(start_ts).date())
+            last = week_start_of(datetime.fromtimestamp(end_ts).date()) + timedelta(days=7)
+            result: list[tuple[str, dict]] = []
+            while week <= last:
+                repo = self._repo(_week_key(week))
+                if repo is not None:
+                    result.extend(repo.created_between(start_ts, end_ts))
+                week += timedelta(days=7)
+            return result
+
+    def user_ids(self) -> set[int]:
+        with self._lock:
+            self._ensure_loaded()
+            result = {int(entry[1]) for entry in self._archived.values() if entry[1] is not None}
+            for shard in self._shards.values():
+                result |= shard.user_ids()
+            return result
+
+    def last_weeks(self) -> dict[int, date]:
+        """Последняя неделя доставки каждого пользователя — по ключам шардов и индексу
+        архива, без чтения самих заказов."""
+        with self._lock:
+            self._ensure_loaded()
+            result: dict[int, date] = {}
+
+            def note(uid, key: str) -> None:
+                if uid is None or key == UNDATED_WEEK:
+                    return
+                week = date.fromisoformat(key)
+                if week > result.get(int(uid), date.min):
+                    result[int(uid)] = week
+
+            for oid, (key, uid) in self._archived.items():
+                if oid not in self._hot:
+                    note(uid, key)
+            for key, shard in self._shards.items():
+                for uid in shard.user_ids():
+                    note(uid, key)
+            return result
+
+    # --- запись ---
+
+    def put(self, oid: str, payload: dict) -> None:
+        with self._lock:
+            self._ensure_loaded()
+            key = _week_key(order_week(payload))
+            old_key = self._hot.get(oid)
+            if old_key is None and oid in self._archived:
+                old_key = self._archived[oid][0]
+            if old_key is not None and old_key != key:
+                # Неделя доставки сменилась: заказ переезжает в другой шард
+                self._writable(old_key).remove(oid)
+                self._hot.pop(oid, None)
+            self._writable(key).put(oid, payload)
+            self._hot[oid] = key
+
+    def update(self, oid: str, **fields) -> bool:
+        """Частичное обновление полей заказа. Возвращает False, если заказа нет."""
+        with self._lock:
+            current = self.get(oid)
+            if current is None:
+                return False
+            key = self._hot.get(oid) or self._archived[oid][0]
+            if _week_key(order_week(current | fields)) != key:
+                self.put(oid, current | fields)
+                return True
+            return self._writable(key).update(oid, **fields)
+
+    # --- обслуживание ---
+
+    def archive_before(self, week: date) -> list[str]:
+        """Сворачивает горячие шарды недель раньше ``week`` в gzip-архивы. Возвращает недели.
+
+        Под замком хранилища берутся только снимки шардов; gzip и fsync идут без него,
+        так что обработчики бота в это время читают и пишут как обычно. Неделя, в которую
+        успели записать после снимка, остаётся горячей до следующего запуска.
+        """
+        with self._archive_lock:
+            with self._lock:
+                self._ensure_loaded()
+                due = sorted(key for key in self._shards if key != UNDATED_WEEK and key < week.isoformat())
+                if not due:
+                    return []
+                shards = {key: self._shards[key] for key in due}
+                snapshots = {key: dict(shard.items()) for key, shard in shards.items()}
+                self._archiving.update(due)
+                self._archive_dirty.clear()
+            try:
+                for key, shard in shards.items():
+                    # Фоновая свёртка шарда не должна дописать его файлы после удаления
+                    if shard._compaction is not None:
+                        shard._compaction.join()
+                    path = self._archive_path(key)
+                    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+                        json.dump(snapshots[key], f, ensure_ascii=False)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(path + ".tmp", path)
+                if self.writer is not None:
+                    # Хвост журналов этих недель должен лечь на диск до удаления файлов
+                    self.writer.flush()
+                with self._lock:
+                    archived = [key for key in due if key not in self._archive_dirty]
+                    for key in archived:
+                        shards[key].close()
+                        del self._shards[key]
+                        for oid, payload in snapshots[key].items():
+                            self._archived[oid] = [key, order_user_id(payload)]
+                            self._hot.pop(oid, None)
+                    index = dict(self._archived)
+                    self._archiving.clear()
+            except BaseException:
+                with self._lock:
+                    self._archiving.clear()
+                raise
+            for key in set(due) - set(archived):
+                os.remove(self._archive_path(key))
+            if not archived:
+                return []
+            _write_json_atomic(self.archive_index_path, index, fsync=True)
+            # Порядок важен: архив и индекс уже на диске, при сбое горячий шард просто останется
+            with self._lock:
+                for key in archived:
+                    if key not in self._shards:  # запись могла вернуть неделю из архива
+                        for leftover in shards[key].shard_files():
+                            os.remove(leftover)
+            logging.info(f"Недели {', '.join(archived)} перенесены в архив {self.archive_root}")
+            return archived
+
+    def compact(self, background: bool = False) -> None:
+        with self._lock:
+            for shard in self._shards.values():
+                shard.compact(background=background)
+
+    def close(self) -> None:
+        with self._lock:
+            for shard in self._shards.values():
+                shard.close()
+
+
+class UserRepository:
+    """Профили пользователей (users.json) в памяти."""
+
+    def __init__(self, path: str, writer: BackgroundWriter | None = None):
+        self.path = path
+        self.writer = writer
+        self._users: dict[str, dict] = {}
+        self._loaded = False
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._users = _read_json_dict(self.path)
+        self._loaded = True
+
+    def _persist(self) -> None:
+        if self.writer is not None:
+            # Профили не меняются на месте, поверхностной копии достаточно для записи в фоне
+            self.writer.replace(self.path, dict(self._users))
+            return
+        try:
+            _write_json_atomic(self.path, self._users)
+        except Exception as e:
+            logging.error(f"Не удалось сохранить {self.path}: {e}")
+
+    def get(self, uid: int) -> dict:
+        self._ensure_loaded()
+        return dict(self._users.get(str(uid)) or {})
+
+    def put(self, uid: int, profile: dict) -> None:
+        self._ensure_loaded()
+        self._users[str(uid)] = dict(profile)
+        self._persist()
+
+    def ensure(self, uid: int) -> bool:
+        """Создаёт пустую запись, если её нет. Возвращает True, если запись добавлена."""
+        self._ensure_loaded()
+        key = str(uid)
+        if key in self._users:
+            return False
+        self._users[key] = {}
+        self._persist()
+        return True
+
+    def ids(self) -> set[int]:
+        self._ensure_loaded()
+        result: set[int] = set()
+        for key in self._users.keys():
+            try:
+                result.add(int(key))
+            except Exception:
+                pass
+        return result
+
+
+class Storage(ABC):
+    """Интерфейс хранилища бота. Все методы синхронные и возвращают копии данных."""
+
+    # --- заказы ---
+    @abstractmethod
+    def get_order(self, oid: str) -> dict | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_order(self, oid: str, payload: dict) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_order(self, oid: str, **fields) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_active_order(self, uid: int, day: str, week: date) -> tuple[str, dict] | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def user_orders(self, uid: int, week: date | None = None) -> list[tuple[str, dict]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def week_orders(self, week: date, day: str | None = None) -> list[tuple[str, dict]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def orders_created_between(self, start_ts: int, end_ts: int) -> list[tuple[str, dict]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def order_user_ids(self) -> set[int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def last_order_weeks(self) -> dict[int, date]:
+        """user_id -> неделя доставки его последнего заказа (по индексам хранилища)."""
+        raise NotImplementedError
+
+    # --- пользователи ---
+    @abstractmethod
+    def get_user(self, uid: int) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_user(self, uid: int, profile: dict) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def ensure_user(self, uid: int) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def user_ids(self) -> set[int]:
+        raise NotImplementedError
+
+    # --- окно приёма заказов ---
+    @abstractmethod
+    def load_order_window(self) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_order_window(self, data: dict) -> None:
+        raise NotImplementedError
+
+    # --- служебное состояние (рассылки и т.п.) ---
+    @abstractmethod
+    def load_setting(self, key: str) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_setting(self, key: str, data: dict) -> None:
+        raise NotImplementedError
+
+    # --- исходящая очередь (outbox): по умолчанию — одна настройка со списком ---
+    def outbox_items(self) -> list[dict]:
+        """Сообщения очереди в порядке постановки (по ``id``)."""
+        items = self.load_setting("outbox").get("items") or []
+        return [dict(item) for item in items if isinstance(item, dict)]
+
+    def put_outbox_items(self, items: list[dict]) -> None:
+        """Добавляет или перезаписывает сообщения очереди (по ``id``)."""
+        merged = {item["id"]: item for item in self.outbox_items()}
+        merged.update((item["id"], dict(item)) for item in items)
+        self.save_setting("outbox", {"items": sorted(merged.values(), key=lambda item: item["id"])})
+
+    def remove_outbox_items(self, ids: list[int]) -> None:
+        drop = set(ids)
+        items = [item for item in self.outbox_items() if item["id"] not in drop]
+        self.save_setting("outbox", {"items": items})
+
+    def archive_weeks(self, before: date) -> int:
+        """Переносит заказы недель раньше ``before`` в архив. Возвращает число недель."""
+        return 0
+
+    def preload(self) -> None:
+        """Прогрев при старте (вызывается в executor, чтобы не блокировать цикл событий)."""
+
+    def close(self) -> None:
+        pass
+
+
+class JsonStorage(Storage):
+    def __init__(
+        self,
+        orders_file: str,
+        users_file: str,
+        window_file: str,
+        background: bool = True,
+        orders_dir: str | None = None,
+    ):
+        self.writer = BackgroundWriter() if background else None
+        # orders.json прежних версий раскладывается по неделям в orders_dir при первом чтении
+        orders_dir = orders_dir or os.path.splitext(orders_file)[0]
+        self.orders = WeeklyOrderStore(orders_dir, legacy_path=orders_file, writer=self.writer)
+        self.users = UserRepository(users_file, writer=self.writer)
+        self.window_file = window_file
+        self._window: dict | None = None
+        self._settings: dict[str, dict] = {}
+
+    def get_order(self, oid):
+        return self.orders.get(oid)
+
+    def put_order(self, oid, payload):
+        self.orders.put(oid, payload)
+
+    def update_order(self, oid, **fields):
+        return self.orders.update(oid, **fields)
+
+    def find_active_order(self, uid, day, week):
+        return self.orders.find_active(uid, day, week)
+
+    def user_orders(self, uid, week=None):
+        return self.orders.for_user(uid, week)
+
+    def week_orders(self, week, day=None):
+        return self.orders.for_week(week, day)
+
+    def orders_created_between(self, start_ts, end_ts):
+        return self.orders.created_between(start_ts, end_ts)
+
+    def order_user_ids(self):
+        return self.orders.user_ids()
+
+    def last_order_weeks(self):
+        return self.orders.last_weeks()
+
+    def get_user(self, uid):
+        return self.users.get(uid)
+
+    def put_user(self, uid, profile):
+        self.users.put(uid, profile)
+
+    def ensure_user(self, uid):
+        return self.users.ensure(uid)
+
+    def user_ids(self):
+        return self.users.ids()
+
+    def load_order_window(self):
+        if self._window is None:
+            self._window = _read_json_dict(self.window_file)
+        return dict(self._window)
+
+    def save_order_window(self, data):
+        self._window = dict(data)
+        self._write(self.window_file, data)
+
+    def _write(self, path: str, data: dict) -> None:
+        if self.writer is not None:
+            self.writer.replace(path, dict(data))
+            return
+        try:
+            _write_json_atomic(path, data)
+        except Exception as e:
+            logging.error(f"Не удалось сохранить {path}: {e}")
+
+    def _setting_path(self, key: str) -> str:
+        # Рядом с order_window.json: <key>.json
+        return os.path.join(os.path.dirname(self.window_file), key + ".json")
+
+    def load_setting(self, key):
+        if key not in self._settings:
+            self._settings[key] = _read_json_dict(self._setting_path(key))
+        return dict(self._settings[key])
+
+    def save_setting(self, key, data):
+        self._settings[key] = dict(data)
+        self._write(self._setting_path(key), data)
+
+    def archive_weeks(self, before):
+        return len(self.orders.archive_before(before))
+
+    def preload(self):
+        self.orders.user_ids()
+        self.users.ids()
+        self.load_order_window()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.flush()
+        # Сворачиваем журнал заказов в снимок, чтобы следующий старт не переигрывал его целиком
+        self.orders.compact()
+        self.orders.close()
+        if self.writer is not None:
+            self.writer.close()
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER,
+    delivery_week TEXT,
+    day TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT '',
+    created_at INTEGER NOT NULL DEFAULT 0,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_orders_user_week_day ON orders (user_id, delivery_week, day);
+CREATE INDEX IF NOT EXISTS ix_orders_week_day ON orders (delivery_week, day);
+CREATE INDEX IF NOT EXISTS ix_orders_status ON orders (status);
+CREATE INDEX IF NOT EXISTS ix_orders_created_at ON orders (created_at);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    profile TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    item TEXT NOT NULL
+);
+"""
+
+
+class _SqliteTransaction:
+    def __init__(self, conn: sqlite3.Connection, lock: threading.RLock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.lock.acquire()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+        return False
+
+
+class SqliteStorage(Storage):
+    """SQLite (WAL) с индексируемыми колонками; полный заказ хранится JSON-ом в payload."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(_SQLITE_SCHEMA)
+
+    def _transaction(self):
+        return _SqliteTransaction(self._conn, self._lock)
+
+    @staticmethod
+    def _order_row(oid: str, payload: dict) -> tuple:
+        week = order_week(payload)
+        return (
+            oid,
+            order_user_id(payload),
+            week.isoformat() if week else None,
+            str(payload.get("day") or ""),
+            str(payload.get("status") or "").lower(),
+            int(payload.get("created_at") or 0),
+            json.dumps(payload, ensure_ascii=False),
+        )
+
+    def _select_orders(self, where: str, params: tuple) -> list[tuple[str, dict]]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id, payload FROM orders WHERE {where}", params).fetchall()
+        return [(oid, json.loads(payload)) for oid, payload in rows]
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            has_orders = self._conn.execute("SELECT 1 FROM orders LIMIT 1").fetchone()
+            has_users = self._conn.execute("SELECT 1 FROM users LIMIT 1").fetchone()
+        return not has_orders and not has_users
+
+    def import_from(self, source: "JsonStorage") -> None:
+        """Переносит данные из JSON-файлов (первый запуск на SQLite)."""
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._order_row(oid, payload) for oid, payload in source.orders.items()],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO users (id, profile) VALUES (?, ?)",
+                [(uid, json.dumps(source.get_user(uid), ensure_ascii=False)) for uid in source.user_ids()],
+            )
+            window = source.load_order_window()
+            if window:
+                conn.execute(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES ('order_window', ?)",
+                    (json.dumps(window, ensure_ascii=False),),
+                )
+
+    # --- заказы ---
+
+    def get_order(self, oid):
+        found = self._select_orders("id = ?", (oid,))
+        return found[0][1] if found else None
+
+    def put_order(self, oid, payload):
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?)", self._order_row(oid, payload))
+
+    def update_order(self, oid, **fields):
+        # BEGIN IMMEDIATE: чтение и запись под одной блокировкой, без потерянных обновлений
+        with self._transaction() as conn:
+            row = conn.execute("SELECT payload FROM orders WHERE id = ?", (oid,)).fetchone()
+            if row is None:
+                return False
+            payload = json.loads(row[0]) | fields
+            conn.execute("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?)", self._order_row(oid, payload))
+        return True
+
+    def find_active_order(self, uid, day, week):
+        found = self._select_orders(
+            "user_id = ? AND delivery_week = ? AND day = ? AND status NOT LIKE 'cancel%' "
+            "ORDER BY created_at DESC LIMIT 1",
+            (int(uid), week.isoformat(), day),
+        )
+        return found[0] if found else None
+
+    def user_orders(self, uid, week=None):
+        if week is None:
+            return self._select_orders("user_id = ?", (int(uid),))
+        return self._select_orders("user_id = ? AND delivery_week = ?", (int(uid), week.isoformat()))
+
+    def week_orders(self, week, day=None):
+        if day is None:
+            return self._select_orders("delivery_week = ?", (week.isoformat(),))
+        return self._select_orders("delivery_week = ? AND day = ?", (week.isoformat(), day))
+
+    def orders_created_between(self, start_ts, end_ts):
+        return self._select_orders("created_at BETWEEN ? AND ?", (int(start_ts), int(end_ts)))
+
+    def order_user_ids(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT user_id FROM orders WHERE user_id IS NOT NULL").fetchall()
+        return {int(r[0]) for r in rows}
+
+    def last_order_weeks(self):
+        # Покрывается индексом ix_orders_user_week_day
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, MAX(delivery_week) FROM orders "
+                "WHERE user_id IS NOT NULL AND delivery_week IS NOT NULL GROUP BY user_id"
+            ).fetchall()
+        return {int(uid): date.fromisoformat(week) for uid, week in rows}
+
+    # --- пользователи ---
+
+    def get_user(self, uid):
+        with self._lock:
+            row = self._conn.execute("SELECT profile FROM users WHERE id = ?", (int(uid),)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def put_user(self, uid, profile):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO users (id, profile) VALUES (?, ?)",
+                (int(uid), json.dumps(profile, ensure_ascii=False)),
+            )
+
+    def ensure_user(self, uid):
+        with self._transaction() as conn:
+            cur = conn.execute("INSERT OR IGNORE INTO users (id, profile) VALUES (?, '{}')", (int(uid),))
+            return cur.rowcount > 0
+
+    def user_ids(self):
+        with self._lock:
+            return {int(r[0]) for r in self._conn.execute("SELECT id FROM users").fetchall()}
+
+    # --- окно приёма заказов ---
+
+    def load_order_window(self):
+        return self.load_setting("order_window")
+
+    def save_order_window(self, data):
+        self.save_setting("order_window", data)
+
+    def load_setting(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return {}
+        data = json.loads(row[0])
+        return data if isinstance(data, dict) else {}
+
+    def save_setting(self, key, data):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                (key, json.dumps(data, ensure_ascii=False)),
+            )
+
+    # --- исходящая очередь: строка на сообщение, без перезаписи всей очереди ---
+
+    def outbox_items(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT item FROM outbox ORDER BY id").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def put_outbox_items(self, items):
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO outbox (id, item) VALUES (?, ?)",
+                [(item["id"], json.dumps(item, ensure_ascii=False)) for item in items],
+            )
+
+    def remove_outbox_items(self, ids):
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_storage(
+    backend: str,
+    orders_file: str,
+    users_file: str,
+    window_file: str,
+    sqlite_file: str,
+    orders_dir: str | None = None,
+) -> Storage:
+    """Создаёт хранилище по настройке STORAGE_BACKEND ("json" или "sqlite")."""
+    if str(backend).lower() != "sqlite":
+        return JsonStorage(orders_file, users_file, window_file, orders_dir=orders_dir)
+    storage = SqliteStorage(sqlite_file)
+    orders_dir = orders_dir or os.path.splitext(orders_file)[0]
+    if storage.is_empty() and (os.path.exists(orders_file) or os.path.isdir(orders_dir) or os.path.exists(users_file)):
+        logging.info(f"Импорт данных из JSON-файлов в {sqlite_file}")
+        source = JsonStorage(orders_file, users_file, window_file, background=False, orders_dir=orders_dir)
+        storage.import_from(source)
+        source.orders.close()
+    return storage
@@ -0,0 +1,37 @@
+from broadcast import SETTING_KEY, Audience, BroadcastEngine
+from storage import JsonStorage
+
+
+def _engine(tmp_path) -> tuple[BroadcastEngine, JsonStorage]:
+    storage = JsonStorage(
+        str(tmp_path / "orders.json"), str(tmp_path / "users.json"), str(tmp_path / "window.json"), background=False
+    )
+    for uid in (1, 2, 3):
+        storage.ensure_user(uid)
+    storage.save_setting(SETTING_KEY, {"job": None, "suppressed": [2, 3]})
+    engine = BroadcastEngine(storage)
+    engine.audience = Audience(storage, excluded=engine.suppressed)
+    return engine, storage
+
+
+def test_unsuppress_returns_a_blocked_chat_to_the_audience(tmp_path) -> None:
+    engine, storage = _engine(tmp_path)
+    assert engine.audience.all() == {1}
+
+    engine.unsuppress(2)
+
+    assert engine.audience.all() == {1, 2}
+    assert storage.load_setting(SETTING_KEY)["suppressed"] == [3]
+
+
+def test_unsuppress_of_an_active_chat_does_not_write(tmp_path, monkeypatch) -> None:
+    # Called for every incoming update, so the common case must stay in memory
+    engine, storage = _engine(tmp_path)
+    engine.suppressed()
+    saves = []
+    monkeypatch.setattr(storage, "save_setting", lambda key, data: saves.append(key))
+
+    engine.unsuppress(1)
+    engine.unsuppress(1)
+
+    assert saves == []
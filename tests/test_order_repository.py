@@ -0,0 +1,131 @@
+import json
+import threading
+from datetime import date
+
+from storage import BackgroundWriter, OrderRepository, _write_json_atomic
+
+WEEK = date(2030, 1, 7)
+
+
+def _order(uid: int, day: str = "Понедельник", status: str = "new", **fields) -> dict:
+    return {"user_id": uid, "delivery_week_start": WEEK.isoformat(), "day": day, "status": status, "created_at": 1, **fields}
+
+
+def _reload(repo: OrderRepository) -> OrderRepository:
+    repo.close()
+    return OrderRepository(repo.path, compact_every=repo.compact_every)
+
+
+def test_torn_last_journal_line_is_skipped_and_closed(tmp_path) -> None:
+    repo = OrderRepository(str(tmp_path / "orders.json"))
+    repo.put("a", _order(1))
+    repo.put("b", _order(2))
+    repo.close()
+    with open(repo.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "put", "id": "c", "order": {"user_')
+
+    repo = OrderRepository(repo.path)
+    assert sorted(oid for oid, _ in repo.items()) == ["a", "b"]
+    # The next record starts on a new line instead of being glued to the torn one
+    repo.put("d", _order(4))
+
+    repo = _reload(repo)
+    assert sorted(oid for oid, _ in repo.items()) == ["a", "b", "d"]
+    assert repo.for_user(4)[0][1]["user_id"] == 4
+
+
+def test_crash_between_snapshot_and_journal_cleanup_replays_safely(tmp_path, monkeypatch) -> None:
+    repo = OrderRepository(str(tmp_path / "orders.json"))
+    repo.put("a", _order(1))
+    repo.put("b", _order(2))
+    repo.update("a", status="paid")
+    # Compaction writes the snapshot and dies before removing the rotated journal
+    monkeypatch.setattr(repo, "_write_snapshot", lambda snapshot: _write_json_atomic(repo.path, snapshot, fsync=True))
+    assert repo.compact()
+    assert repo.shard_files() == [repo.path, repo.compacting_path]
+    repo.update("b", status="cancelled")
+    repo.remove("a")
+
+    repo = _reload(repo)
+    assert [oid for oid, _ in repo.items()] == ["b"]
+    assert repo.get("b")["status"] == "cancelled"
+
+    # The next compaction folds the leftover journal in and cleans up
+    assert repo.compact()
+    assert repo.shard_files() == [repo.path]
+    assert json.loads(open(repo.path, encoding="utf-8").read()) == {"b": repo.get("b")}
+
+
+def test_crash_before_snapshot_keeps_the_rotated_journals(tmp_path, monkeypatch) -> None:
+    # Two compactions in a row die before writing the snapshot
+    monkeypatch.setattr(OrderRepository, "_write_snapshot", lambda self, snapshot: None)
+    repo = OrderRepository(str(tmp_path / "orders.json"))
+    repo.put("a", _order(1))
+    repo.compact()
+    repo.put("b", _order(2))
+    repo.compact()
+    repo.update("a", status="paid")
+    monkeypatch.undo()
+
+    repo = _reload(repo)
+    assert sorted((oid, payload["status"]) for oid, payload in repo.items()) == [("a", "paid"), ("b", "new")]
+    assert repo.compact()
+    assert repo.shard_files() == [repo.path]
+
+
+def test_update_and_cancel_after_reload_keep_indexes_in_sync(tmp_path) -> None:
+    repo = OrderRepository(str(tmp_path / "orders.json"), compact_every=3)
+    repo.put("a", _order(1, created_at=10))
+    repo.put("b", _order(1, day="Вторник", created_at=20))
+    repo.put("c", _order(2))  # third record: compaction in the background
+    repo = _reload(repo)
+
+    assert repo.update("a", count=3)
+    assert repo.update("b", status="cancelled")
+    assert not repo.update("missing", status="paid")
+    repo = _reload(repo)
+
+    assert repo.get("a")["count"] == 3
+    assert repo.find_active(1, "Вторник", WEEK) is None
+    assert repo.find_active(1, "Понедельник", WEEK)[0] == "a"
+    assert [oid for oid, _ in repo.for_status("cancelled")] == ["b"]
+    assert sorted(oid for oid, _ in repo.for_status("new")) == ["a", "c"]
+    assert sorted(oid for oid, _ in repo.for_week(WEEK, "Вторник")) == ["b"]
+
+
+def test_background_writer_flush_waits_for_earlier_writes_in_order(tmp_path) -> None:
+    writer = BackgroundWriter(window=60)  # only flush() cuts the commit window short
+    path = str(tmp_path / "journal")
+    for idx in range(100):
+        writer.append(path, f"{idx}\n")
+    writer.replace(str(tmp_path / "state.json"), {"n": 1})
+    writer.replace(str(tmp_path / "state.json"), {"n": 2})
+
+    assert writer.flush(timeout=5)
+    assert open(path, encoding="utf-8").read().split() == [str(idx) for idx in range(100)]
+    assert json.load(open(tmp_path / "state.json", encoding="utf-8")) == {"n": 2}
+    assert writer.flushes == 1
+
+    threads = [threading.Thread(target=writer.append, args=(path, f"{idx}\n")) for idx in range(100, 110)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert writer.flush(timeout=5)
+    assert sorted(int(line) for line in open(path, encoding="utf-8").read().split()) == list(range(110))
+    writer.close()
+
+
+def test_repository_writes_through_background_writer(tmp_path) -> None:
+    writer = BackgroundWriter(window=60)
+    repo = OrderRepository(str(tmp_path / "orders.json"), writer=writer)
+    repo.put("a", _order(1))
+    repo.update("a", status="paid")
+    repo.put("b", _order(2))
+    repo.remove("b")
+    assert writer.flush(timeout=5)
+    writer.close()
+
+    repo = _reload(repo)
+    assert [(oid, payload["status"]) for oid, payload in repo.items()] == [("a", "paid")]
+
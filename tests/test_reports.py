@@ -0,0 +1,97 @@
+import io
+import re
+import zipfile
+from xml.etree import ElementTree
+
+from reports import TELEGRAM_TEXT_LIMIT, split_message, write_xlsx
+
+NS = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _balanced(chunk: str) -> bool:
+    stack = []
+    for closing, name in re.findall(r"<(/?)([a-z][\w-]*)[^>]*>", chunk):
+        if not closing:
+            stack.append(name)
+        elif not stack or stack.pop() != name:
+            return False
+    return not stack
+
+
+def _text(chunks: list[str]) -> str:
+    return "".join(re.sub(r"<[^>]*>", "", chunk) for chunk in chunks)
+
+
+def test_short_text_is_one_message() -> None:
+    assert split_message("<b>Неделя</b>\nПн: 3") == ["<b>Неделя</b>\nПн: 3"]
+
+
+def test_lines_are_packed_up_to_the_limit() -> None:
+    lines = [f"<b>{idx:04}</b> " + "з" * 90 for idx in range(200)]
+
+    chunks = split_message("\n".join(lines))
+
+    assert len(chunks) > 1
+    assert all(_utf16_len(chunk) <= TELEGRAM_TEXT_LIMIT for chunk in chunks)
+    assert "\n".join(chunks).split("\n") == lines
+
+
+def test_limit_counts_utf16_code_units() -> None:
+    chunks = split_message("🍲" * 3000)  # two code units each
+    assert [_utf16_len(chunk) for chunk in chunks] == [4096, 1904]
+
+
+def test_overlong_line_closes_and_reopens_markup() -> None:
+    chunks = split_message("<s>" + "a" * 5000 + "</s>")
+
+    assert len(chunks) == 2
+    assert chunks[0].startswith("<s>") and chunks[0].endswith("</s>")
+    assert chunks[1].startswith("<s>") and chunks[1].endswith("</s>")
+    assert _text(chunks) == "a" * 5000
+
+
+def test_overlong_line_keeps_nested_tags_with_attributes() -> None:
+    line = '<b>Меню: <a href="https://t.me/lunch">' + "я" * 9000 + "</a> и суп</b>"
+
+    chunks = split_message("Итого\n" + line, limit=1000)
+
+    assert all(_utf16_len(chunk) <= 1000 for chunk in chunks)
+    assert all(_balanced(chunk) for chunk in chunks)
+    assert all(chunk.startswith('<b><a href="https://t.me/lunch">') for chunk in chunks[2:-1])
+    assert _text(chunks) == "Итого" + "Меню: " + "я" * 9000 + " и суп"
+
+
+def test_cut_never_splits_a_tag_or_an_entity() -> None:
+    chunks = split_message("a" * 95 + "&amp;" + "b" * 10 + "<i>c</i>", limit=98)
+
+    assert chunks[0] == "a" * 95
+    assert chunks[1].startswith("&amp;")
+    assert "<i>c</i>" in "".join(chunks)
+
+
+def test_write_xlsx_writes_a_readable_sheet() -> None:
+    out = io.BytesIO()
+    rows = [("BLB-1", 3, 45, "Улица <Руставели> & Ко\x07"), ("BLB-2", 1, 15.5, "")]
+
+    write_xlsx(out, ("ID", "Количество", "Сумма", "Адрес"), iter(rows), sheet="Неделя 2030-01-07 " + "x" * 40)
+
+    with zipfile.ZipFile(io.BytesIO(out.getvalue())) as zf:
+        assert zf.testzip() is None
+        workbook = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+        sheet = ElementTree.fromstring(zf.read("xl/worksheets/sheet1.xml"))
+    assert len(workbook.find("x:sheets/x:sheet", NS).get("name")) == 31
+
+    cells = {}
+    for cell in sheet.iterfind(".//x:c", NS):
+        value = cell.find("x:v", NS)
+        cells[cell.get("r")] = float(value.text) if value is not None else cell.find("x:is/x:t", NS).text or ""
+    assert cells["A1"] == "ID" and cells["D1"] == "Адрес"
+    assert sheet.find(".//x:c[@r='A1']", NS).get("s") == "1"  # bold header
+    assert cells["B2"] == 3 and cells["C3"] == 15.5
+    assert cells["D2"] == "Улица <Руставели> & Ко"
+    assert cells["D3"] == ""
+    assert [row.get("r") for row in sheet.iterfind(".//x:row", NS)] == ["1", "2", "3"]
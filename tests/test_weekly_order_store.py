@@ -0,0 +1,141 @@
+import json
+import os
+from datetime import date, datetime
+
+import pytest
+
+import storage
+from storage import OrderRepository, WeeklyOrderStore
+
+OLD, PAST, CURRENT = date(2030, 1, 7), date(2030, 1, 14), date(2030, 1, 21)
+
+
+def _order(uid: int, week: date | None, **fields) -> dict:
+    payload = {"user_id": uid, "day": "Понедельник", "status": "new", "created_at": 1, **fields}
+    if week is not None:
+        payload["delivery_week_start"] = week.isoformat()
+    return payload
+
+
+def _store(tmp_path, **kwargs) -> WeeklyOrderStore:
+    return WeeklyOrderStore(str(tmp_path / "orders"), **kwargs)
+
+
+def _fill(store: WeeklyOrderStore) -> None:
+    store.put("old-1", _order(1, OLD))
+    store.put("old-2", _order(2, OLD))
+    store.put("past-1", _order(1, PAST, status="paid"))
+    store.put("current-1", _order(1, CURRENT))
+
+
+def test_legacy_orders_file_is_split_into_week_shards(tmp_path) -> None:
+    legacy = OrderRepository(str(tmp_path / "orders.json"))
+    legacy.put("old-1", _order(1, OLD))
+    legacy.put("past-1", _order(1, PAST))
+    legacy.put("undated", _order(3, None, created_at=0))
+    legacy.compact()
+    legacy.close()
+    # The journal tail of the old single-file format is part of the migration
+    with open(legacy.journal_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "update", "id": "past-1", "fields": {"status": "paid"}}) + "\n")
+
+    store = _store(tmp_path, legacy_path=legacy.path)
+
+    assert store.get("past-1")["status"] == "paid"
+    assert [oid for oid, _ in store.for_week(OLD)] == ["old-1"]
+    assert store.get("undated") is not None
+    assert sorted(name for name in os.listdir(store.root) if name.endswith(".json")) == [
+        f"{OLD.isoformat()}.json",
+        f"{PAST.isoformat()}.json",
+        f"{storage.UNDATED_WEEK}.json",
+    ]
+    assert legacy.shard_files() == []
+    assert os.path.exists(legacy.path + ".migrated") and os.path.exists(legacy.journal_path + ".migrated")
+    # A second start does not migrate again
+    assert sorted(oid for oid, _ in _store(tmp_path, legacy_path=legacy.path).items()) == [
+        "old-1", "past-1", "undated",
+    ]
+
+
+def test_archived_weeks_are_read_back_after_restart(tmp_path) -> None:
+    store = _store(tmp_path)
+    _fill(store)
+
+    assert store.archive_before(CURRENT) == [OLD.isoformat(), PAST.isoformat()]
+    store.close()
+    assert sorted(os.listdir(store.archive_root)) == [
+        f"{OLD.isoformat()}.json.gz", f"{PAST.isoformat()}.json.gz", "index.json",
+    ]
+
+    store = _store(tmp_path)
+    assert sorted(oid for oid, _ in store.for_user(1)) == ["current-1", "old-1", "past-1"]
+    assert [oid for oid, _ in store.for_user(2)] == ["old-2"]
+    assert [oid for oid, _ in store.for_user(1, PAST)] == ["past-1"]
+    assert store.get("old-2")["user_id"] == 2
+    assert store.user_ids() == {1, 2}
+    assert store.last_weeks() == {1: CURRENT, 2: OLD}
+
+    # Changing an archived order brings its week back to the hot shards
+    assert store.update("past-1", status="cancelled")
+    assert os.path.exists(store._shard_path(PAST.isoformat()))
+    assert not os.path.exists(store._archive_path(PAST.isoformat()))
+    store.close()
+    assert _store(tmp_path).get("past-1")["status"] == "cancelled"
+
+
+def test_interrupted_archive_keeps_orders_and_finishes_on_the_next_run(tmp_path, monkeypatch) -> None:
+    store = _store(tmp_path)
+    _fill(store)
+
+    # Archives and index are written, then the process dies while removing the hot files
+    def crash(path):
+        raise OSError(f"crashed removing {path}")
+
+    monkeypatch.setattr(storage.os, "remove", crash)
+    with pytest.raises(OSError):
+        store.archive_before(CURRENT)
+    monkeypatch.undo()
+    store.close()
+    assert os.path.exists(store._shard_path(OLD.isoformat()) + ".journal")
+    assert os.path.exists(store._archive_path(OLD.isoformat()))
+
+    store = _store(tmp_path)
+    assert sorted(oid for oid, _ in store.items()) == ["current-1", "old-1", "old-2", "past-1"]
+    assert sorted(oid for oid, _ in store.for_user(1)) == ["current-1", "old-1", "past-1"]
+    assert store.get("past-1")["status"] == "paid"
+
+    assert store.archive_before(CURRENT) == [OLD.isoformat(), PAST.isoformat()]
+    assert sorted(name for name in os.listdir(store.root) if ".json" in name) == [f"{CURRENT.isoformat()}.json.journal"]
+    assert sorted(oid for oid, _ in store.for_user(1)) == ["current-1", "old-1", "past-1"]
+
+
+def test_created_between_reads_only_the_weeks_it_needs(tmp_path) -> None:
+    store = _store(tmp_path)
+    created = int(datetime(2030, 1, 15, 12).timestamp())
+    store.put("a", _order(1, CURRENT, created_at=created))
+    store.put("b", _order(2, OLD, created_at=created - 7 * 86400))
+    store.archive_before(PAST)
+
+    assert [oid for oid, _ in store.created_between(created - 3600, created + 3600)] == ["a"]
+    assert [oid for oid, _ in store.created_between(created - 8 * 86400, created - 6 * 86400)] == ["b"]
+
+
+def test_week_written_while_archiving_stays_hot(tmp_path, monkeypatch) -> None:
+    store = _store(tmp_path)
+    _fill(store)
+    gzip_open = storage.gzip.open
+
+    def write_meanwhile(path, *args, **kwargs):
+        # The store lock is free while archives are compressed: a handler changes an order
+        if PAST.isoformat() in path:
+            assert store.update("past-1", status="cancelled")
+        return gzip_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(storage.gzip, "open", write_meanwhile)
+    assert store.archive_before(CURRENT) == [OLD.isoformat()]
+    monkeypatch.undo()
+
+    assert not os.path.exists(store._archive_path(PAST.isoformat()))
+    assert store.get("past-1")["status"] == "cancelled"
+    store.close()
+    assert _store(tmp_path).get("past-1")["status"] == "cancelled"